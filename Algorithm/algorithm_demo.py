@@ -1,17 +1,25 @@
-import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import haversine as hs
 from python_tsp.exact import solve_tsp_dynamic_programming
 
-
+from Algorithm.alns_dispatcher import dispatch_orders_by_alns
+from Algorithm.order_bundling import bundle_orders, sort_deliveries_of_bundle
+from src.common.driver_index import DriverIndex
 from src.common.node import Node
 from src.common.route import Map
 from src.configuration.config import Configs
+from src.utils.feasibility import repair_dispatch_result
 from src.utils.input_utils import get_restaurant_info, get_customer_info, get_route_map
 from src.utils.json_tools import convert_nodes_to_json
 from src.utils.json_tools import get_driver_instance_dict, get_order_dict
 from src.utils.json_tools import read_json_from_file, write_json_to_file
+from src.utils.location_index import get_location_index
 from src.utils.logging_engine import logger
+from src.utils.shared_data import SharedStaticData, attach_shared_static_data
 
 
 def dispatch_orders_to_drivers(id_to_unallocated_order: dict, id_to_driver: dict, id_to_location: dict):
@@ -25,51 +33,24 @@ def dispatch_orders_to_drivers(id_to_unallocated_order: dict, id_to_driver: dict
     driver_id_to_planned_route = {}
 
     # for non-empty driver, based on the carrying orders, generate planned_route(TSP solution)
+    driver_id_to_visiting_location_ids = __plan_routes_of_carrying_orders(id_to_driver, id_to_location)
     for driver_id, driver in id_to_driver.items():
-
-        # add
-        # logger.info(driver.current_coordinate)
-
-
-
-        # 对每一个骑手
-        carrying_orders = driver.carrying_orders
-        # 骑手的位置作为起始位置
-        driver_location_id = driver.current_location_id
-        all_locations_id = [driver_location_id] 
         # 初始化骑手路线
         driver_id_to_planned_route[driver_id] = []
-        
-        if len(carrying_orders) > 0:
-            # driver & order location id
-            for order in carrying_orders:
-                customer_location_id = order.delivery_location_id
-                all_locations_id.append(customer_location_id)
-            num_locations = len(all_locations_id)
-            
-            # distance matrix
-            distance_matrix = np.zeros(shape=(num_locations, num_locations))
-            for index_1, location_1_id in enumerate(all_locations_id):
-                for index_2, location_2_id in enumerate(all_locations_id):
-                    location_1 = id_to_location.get(location_1_id)
-                    location_2 = id_to_location.get(location_2_id)
-                    distance_matrix[index_1, index_2] = hs.haversine((location_1.lat, location_1.lng), (location_2.lat, location_2.lng))
-            
-            # driver routing as a TSP
-            visiting_sequence, travel_distance = solve_tsp_dynamic_programming(distance_matrix)
-            
-            # add visiting nodes to planned route
-            for tsp_index in visiting_sequence[1:]:
-                location_id = all_locations_id[tsp_index]
-                location = id_to_location.get(location_id)
-                delivery_order_list = [o for o in carrying_orders if o.delivery_location_id == location_id]
-                node = Node(location_id, location.lat, location.lng, [], delivery_order_list)
-                driver_id_to_planned_route[driver_id].append(node) 
+        carrying_orders = driver.carrying_orders
+
+        # add visiting nodes to planned route
+        for location_id in driver_id_to_visiting_location_ids.get(driver_id, []):
+            location = id_to_location.get(location_id)
+            delivery_order_list = [o for o in carrying_orders if o.delivery_location_id == location_id]
+            node = Node(location_id, location.lat, location.lng, [], delivery_order_list)
+            driver_id_to_planned_route[driver_id].append(node) 
     
     # for the empty driver, it has been allocated to the order, but have not yet arrived at the pickup location (restaurant)
     pre_matching_order_ids = []
+    to_pickup_state = Configs.DRIVER_STATE_TO_CODE.get("TO_PICKUP")
     for driver_id, driver in id_to_driver.items():
-        if len(driver.carrying_orders) == 0 and driver.destination is not None:
+        if driver.state == to_pickup_state and len(driver.carrying_orders) == 0:
             # pickup orders from next restaurant
             pickup_orders = driver.destination.pickup_orders 
             # 创建node对象
@@ -83,39 +64,44 @@ def dispatch_orders_to_drivers(id_to_unallocated_order: dict, id_to_driver: dict
     driver_id_to_left_capacity = __get_left_capacity_of_driver(id_to_driver)
     available_drivers = [driver for driver_id, driver in id_to_driver.items() if driver_id_to_left_capacity[driver_id] > 0] 
     
-    for order_id, order in id_to_unallocated_order.items():
-        # check order is pre matching or not
-        if order_id in pre_matching_order_ids:
-            continue
-        
+    # 同一餐厅的兼容订单合并为一个批次, 分配给同一个骑手
+    unallocated_orders = [order for order_id, order in id_to_unallocated_order.items()
+                          if order_id not in pre_matching_order_ids]
+    location_index = get_location_index() if Configs.LOCATION_INDEX_K > 0 else None
+    available_driver_ids = {driver.id for driver in available_drivers}
+    location_id_to_driver_ids = {}
+    for driver_id, driver in id_to_driver.items():
+        location_id_to_driver_ids.setdefault(driver.current_location_id, []).append(driver_id)
+    # 优先分配给取货地点附近已经空闲的骑手, 分配后从索引中移除
+    free_driver_index = None
+    if Configs.GREEDY_PREFER_FREE_DRIVERS and location_index is not None:
+        free_driver_index = DriverIndex(driver for driver_id, driver in id_to_driver.items()
+                                        if driver_id in available_driver_ids)
+    cur_time = max((driver.gps_update_time for driver in id_to_driver.values()), default=0)
+
+    for bundle in bundle_orders(unallocated_orders, id_to_location, location_index=location_index):
+        order = bundle[0]
+        bundle_demand = __calculate_demand(bundle)
+
         # find the nearest driver
+        # 先只检查取货地点k近邻中的骑手(k近邻之外的骑手距离更远), 没有可用的骑手时检查所有骑手
         order_driver_distance_dict = {}
-        for driver_id, driver in id_to_driver.items():
-            if driver in available_drivers:
-                pickup_location_id = order.pickup_location_id
-                driver_location_id = driver.current_location_id
-
-
-                # # add
-                # if driver_location_id == "":
-                #     driver_location = driver.current_coordinate
-                #     pickup_location = id_to_location.get(pickup_location_id)
-                #     order_driver_distance = hs.haversine((pickup_location.lat, pickup_location.lng),
-                #                                          (driver_location[0], driver_location[1]))
-                # else:
-
-                #     pickup_location = id_to_location.get(pickup_location_id)
-                #     driver_location = id_to_location.get(driver_location_id)
-                #     order_driver_distance = hs.haversine((pickup_location.lat, pickup_location.lng),
-                #                                          (driver_location.lat, driver_location.lng))
-
-
-                pickup_location = id_to_location.get(pickup_location_id)
-                driver_location = id_to_location.get(driver_location_id)
-                order_driver_distance = hs.haversine((pickup_location.lat, pickup_location.lng),
-                                                     (driver_location.lat, driver_location.lng))
-
-                order_driver_distance_dict[driver_id] = order_driver_distance
+        nearby_driver_ids = __get_nearby_driver_ids(order.pickup_location_id, location_index, location_id_to_driver_ids,
+                                                    id_to_driver)
+        free_driver_ids = __get_free_driver_ids(order.pickup_location_id, cur_time, location_index, free_driver_index)
+        for candidate_driver_ids in [free_driver_ids, nearby_driver_ids, id_to_driver.keys()]:
+            for driver_id in candidate_driver_ids:
+                driver = id_to_driver.get(driver_id)
+                if driver_id in available_driver_ids and (len(bundle) == 1 or driver.capacity >= bundle_demand):
+                    pickup_location_id = order.pickup_location_id
+                    driver_location_id = driver.current_location_id
+                    pickup_location = id_to_location.get(pickup_location_id)
+                    driver_location = id_to_location.get(driver_location_id)
+                    order_driver_distance = hs.haversine((pickup_location.lat, pickup_location.lng),
+                                                         (driver_location.lat, driver_location.lng))
+                    order_driver_distance_dict[driver_id] = order_driver_distance
+            if len(order_driver_distance_dict) > 0:
+                break
         min_distance = min(order_driver_distance_dict.values())
         min_driver_id = [driver_id for driver_id in order_driver_distance_dict 
                             if order_driver_distance_dict[driver_id] == min_distance]
@@ -126,8 +112,12 @@ def dispatch_orders_to_drivers(id_to_unallocated_order: dict, id_to_driver: dict
         else:
             assign_driver_id = min_driver_id
         
+        if free_driver_index is not None:
+            free_driver_index.remove(assign_driver_id)
+
         # pickup node & delivery node list
-        pickup_node_list, delivery_node_list = __create_pickup_and_delivery_nodes_of_orders([order], id_to_location)
+        pickup_node_list, delivery_node_list = __create_pickup_and_delivery_nodes_of_orders(
+            sort_deliveries_of_bundle(bundle, id_to_location), id_to_location)
         
         # update driver planned route
         driver_id_to_planned_route[assign_driver_id].extend(pickup_node_list)
@@ -160,6 +150,124 @@ def dispatch_orders_to_drivers(id_to_unallocated_order: dict, id_to_driver: dict
     return driver_id_to_destination, driver_id_to_planned_route
             
 
+def __plan_routes_of_carrying_orders(id_to_driver: dict, id_to_location: dict):
+    '''
+    对每个有订单的骑手求解TSP(起点为骑手位置, 访问所有订单的顾客)
+    骑手数量不少于Configs.PARALLEL_ROUTING_MIN_DRIVERS时用进程池并行求解, 结果与串行求解完全相同
+    Output:
+    - {driver_id: 按访问顺序排列的location id(不含起点)}
+    '''
+    tasks = []
+    for driver_id, driver in id_to_driver.items():
+        if len(driver.carrying_orders) > 0:
+            # 骑手的位置作为起始位置
+            all_locations_id = [driver.current_location_id]
+            all_locations_id.extend(order.delivery_location_id for order in driver.carrying_orders)
+            tasks.append((driver_id, all_locations_id))
+
+    # 地点坐标数组, 任务只传递地点下标; 模拟器发布了共享内存时直接使用共享内存中的坐标
+    shared_data = attach_shared_static_data()
+    if shared_data is not None and all(location_id in shared_data.location_id_to_index
+                                       for driver_id, all_locations_id in tasks for location_id in all_locations_id):
+        location_id_to_index = shared_data.location_id_to_index
+        lats, lngs = shared_data.lats, shared_data.lngs
+        worker_args = (None, None, shared_data.name)
+    else:
+        location_ids = list(id_to_location.keys())
+        location_id_to_index = {location_id: index for index, location_id in enumerate(location_ids)}
+        lats = np.array([id_to_location.get(location_id).lat for location_id in location_ids])
+        lngs = np.array([id_to_location.get(location_id).lng for location_id in location_ids])
+        worker_args = (lats, lngs, "")
+    index_tasks = [[location_id_to_index.get(location_id) for location_id in all_locations_id]
+                   for driver_id, all_locations_id in tasks]
+
+    if len(tasks) < Configs.PARALLEL_ROUTING_MIN_DRIVERS:
+        sequences = __solve_tsp_of_chunk(index_tasks, lats, lngs)
+    else:
+        worker_num = Configs.PARALLEL_ROUTING_WORKERS or os.cpu_count() or 1
+        chunk_size = Configs.PARALLEL_ROUTING_CHUNK_SIZE
+        chunks = [index_tasks[i:i + chunk_size] for i in range(0, len(index_tasks), chunk_size)]
+        # 坐标数组(或共享内存名称)通过initializer只传递一次, worker中只读
+        with ProcessPoolExecutor(max_workers=min(worker_num, len(chunks)), initializer=__init_routing_worker,
+                                 initargs=worker_args) as executor:
+            sequences = [sequence for chunk_sequences in executor.map(__solve_tsp_of_chunk_in_worker, chunks)
+                         for sequence in chunk_sequences]
+        logger.info("Solve the TSP of %d drivers with %d processes", len(tasks), min(worker_num, len(chunks)))
+
+    driver_id_to_visiting_location_ids = {}
+    for (driver_id, all_locations_id), visiting_sequence in zip(tasks, sequences):
+        driver_id_to_visiting_location_ids[driver_id] = [all_locations_id[tsp_index]
+                                                         for tsp_index in visiting_sequence[1:]]
+    return driver_id_to_visiting_location_ids
+
+
+# worker进程中的只读坐标数组
+__worker_lats = None
+__worker_lngs = None
+__worker_shared_data = None
+
+
+def __init_routing_worker(lats, lngs, shared_data_name: str):
+    global __worker_lats, __worker_lngs, __worker_shared_data
+    if shared_data_name:
+        __worker_shared_data = SharedStaticData.attach(shared_data_name)
+        lats, lngs = __worker_shared_data.lats, __worker_shared_data.lngs
+    __worker_lats = lats
+    __worker_lngs = lngs
+
+
+def __solve_tsp_of_chunk_in_worker(index_tasks: list):
+    return __solve_tsp_of_chunk(index_tasks, __worker_lats, __worker_lngs)
+
+
+def __solve_tsp_of_chunk(index_tasks: list, lats, lngs):
+    '''
+    求解一批骑手的TSP
+    Inputs:
+    - index_tasks: 每个元素为一个骑手的地点下标列表, 第一个为骑手位置
+    - lats, lngs: 所有地点的坐标
+    Output:
+    - 每个骑手的访问顺序(地点在列表中的位置)
+    '''
+    sequences = []
+    for location_indexes in index_tasks:
+        num_locations = len(location_indexes)
+
+        # distance matrix
+        distance_matrix = np.zeros(shape=(num_locations, num_locations))
+        for index_1, location_1_index in enumerate(location_indexes):
+            for index_2, location_2_index in enumerate(location_indexes):
+                distance_matrix[index_1, index_2] = hs.haversine((lats[location_1_index], lngs[location_1_index]),
+                                                                 (lats[location_2_index], lngs[location_2_index]))
+
+        # driver routing as a TSP
+        visiting_sequence, travel_distance = solve_tsp_dynamic_programming(distance_matrix)
+        sequences.append(visiting_sequence)
+    return sequences
+
+
+def __get_nearby_driver_ids(location_id: str, location_index, location_id_to_driver_ids: dict, id_to_driver: dict):
+    '''
+    参考位置在location_id的k近邻中的骑手(按id_to_driver中的顺序), 没有地点索引时返回[]
+    '''
+    if location_index is None or not location_index.contains([location_id]):
+        return []
+    driver_ids = set()
+    for neighbor_location_id, _ in location_index.get_neighbors(location_id):
+        driver_ids.update(location_id_to_driver_ids.get(neighbor_location_id, []))
+    return [driver_id for driver_id in id_to_driver if driver_id in driver_ids]
+
+
+def __get_free_driver_ids(location_id: str, cur_time: int, location_index, free_driver_index):
+    '''
+    cur_time之前已经空闲, 空闲地点在location_id的k近邻中的骑手(DriverIndex.get_drivers_free_near), 没有索引时返回[]
+    '''
+    if free_driver_index is None or not location_index.contains([location_id]):
+        return []
+    return [driver_id for _, _, driver_id in free_driver_index.get_drivers_free_near(location_id, cur_time,
+                                                                                    location_index)]
+
+
 def __calculate_demand(order_list: list):
     demand = 0
     for order in order_list:
@@ -202,23 +310,24 @@ def __create_pickup_and_delivery_nodes_of_orders(orders: list, id_to_location: d
     if len(pickup_location_id_list) == 0 or len(delivery_location_id_list) == 0:
         return None, None
 
-    # pickup node
-    pickup_location_list = [] # 只有一个餐厅
+    # pickup node, 每个餐厅一个节点, 包含该餐厅的所有订单
+    pickup_location_list = []
     pickup_node_list = []
     for pickup_location_id in pickup_location_id_list:
         pickup_location = id_to_location.get(pickup_location_id)
         pickup_location_list.append(pickup_location)
-        pickup_node = Node(pickup_location_id, pickup_location.lat, pickup_location.lng, copy.copy(orders), [])
+        pickup_orders = [order for order in orders if order.pickup_location_id == pickup_location_id]
+        pickup_node = Node(pickup_location_id, pickup_location.lat, pickup_location.lng, pickup_orders, [])
         pickup_node_list.append(pickup_node)
     
-    # delivery node
+    # delivery node, 每个顾客一个节点(按orders中第一次出现的顺序), 包含送到该顾客的所有订单
     delivery_location_list = []
     delivery_node_list = [] # 有多个顾客
-    for index in range(len(delivery_location_id_list)):
-        delivery_location_id = delivery_location_id_list[index]
+    for delivery_location_id in delivery_location_id_list:
         delivery_location = id_to_location.get(delivery_location_id)
         delivery_location_list.append(delivery_location)
-        delivery_node = Node(delivery_location_id, delivery_location.lat, delivery_location.lng, [], [copy.copy(orders[index])])
+        delivery_orders = [order for order in orders if order.delivery_location_id == delivery_location_id]
+        delivery_node = Node(delivery_location_id, delivery_location.lat, delivery_location.lng, [], delivery_orders)
         delivery_node_list.append(delivery_node)
     
     return pickup_node_list, delivery_node_list
@@ -269,8 +378,12 @@ def __combine_duplicated_nodes(nodes):
     n = 0
     while n < len(nodes)-1:
         if nodes[n].id == nodes[n+1].id:
+            # 合并后删除后一个节点, 继续与新的相邻节点比较
+            nodes[n].delivery_orders.extend(nodes[n+1].delivery_orders)
             nodes[n].pickup_orders.extend(nodes[n+1].pickup_orders)
-        n += 1
+            nodes.pop(n+1)
+        else:
+            n += 1
 
 
 
@@ -291,15 +404,26 @@ def scheduling():
     派单算法执行程序
     '''
 
+    start_time = time.perf_counter()
+
     # read the input json, you can design your own classes
     id_to_location, id_to_unallocated_order, id_to_ongoing_order, id_to_driver = __read_input_json()
 
     # dispatching algorithm
-    driver_id_to_destination, driver_id_to_planned_route = dispatch_orders_to_drivers(
-        id_to_unallocated_order,
-        id_to_driver,
-        id_to_location,
-        )
+    if Configs.DISPATCH_ALGORITHM == "alns":
+        driver_id_to_destination, driver_id_to_planned_route = dispatch_orders_by_alns(
+            id_to_unallocated_order, id_to_driver, id_to_location, start_time)
+    else:
+        driver_id_to_destination, driver_id_to_planned_route = dispatch_orders_to_drivers(
+            id_to_unallocated_order,
+            id_to_driver,
+            id_to_location,
+            )
+
+    # 输出之前检查可行性(与模拟器的Checker规则相同), 修复不可行的骑手路线
+    if Configs.FEASIBILITY_PRECHECK:
+        driver_id_to_destination, driver_id_to_planned_route = repair_dispatch_result(
+            id_to_driver, driver_id_to_destination, driver_id_to_planned_route, id_to_location)
 
     # output the dispatch result
     __output_json(driver_id_to_destination, driver_id_to_planned_route)
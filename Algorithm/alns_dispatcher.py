@@ -0,0 +1,544 @@
+import math
+import random
+import time
+
+import numpy as np
+
+from src.common.node import Node
+from src.common.route import LazyMap
+from src.common.speed_profile import get_speed_profile
+from src.configuration.config import Configs
+from src.utils.logging_engine import logger
+from src.utils.plan_evaluator import PlanEvaluator
+from src.utils.shared_data import SharedMap, attach_shared_static_data
+
+
+'''
+滚动时域的批量派单: 每个时间片把所有未取货的订单(新释放的和之前分配但还没有取货的)作为一个批次,
+同时决定分配给哪个骑手和插入路线的位置, 在时间预算内用ALNS(adaptive large neighborhood search)改进, 返回找到的最好方案
+- 固定部分: 骑手的目的地(不可更改)和正在配送的订单的送货节点, 不会被移除
+- 目标函数与Evaluator相同(总距离 / 骑手数量 + 延误 * LAMDA / 3600), 候选路线用PlanEvaluator批量评估
+'''
+
+# 自适应权重: 新的全局最优, 优于当前解, 接受了较差的解
+SIGMA_BEST = 33
+SIGMA_BETTER = 9
+SIGMA_ACCEPTED = 13
+REACTION_FACTOR = 0.1
+SEGMENT_ITERATIONS = 50
+
+
+class DriverRoute(object):
+    def __init__(self, driver, start_location_id: str, start_time: float, fixed_stop_num: int, initial_load: float):
+        '''
+        骑手的路线, 每个stop为(location_id, order, is_pickup), 同一地点的相邻stop输出时合并为一个Node
+        Inputs:
+        - driver: Driver
+        - start_location_id, start_time: 路线的起点和出发时间(有目的地时为目的地和到达时间)
+        - fixed_stop_num: 路线开头不能插入的stop数量(目的地的订单)
+        - initial_load: 正在配送的订单的需求
+        '''
+        self.driver = driver
+        self.start_location_id = start_location_id
+        self.start_time = start_time
+        self.fixed_stop_num = fixed_stop_num
+        self.initial_load = initial_load
+        self.stops = []
+        self.score = 0
+
+
+class AlnsDispatcher(object):
+    def __init__(self, id_to_driver: dict, id_to_location: dict, deadline: float, max_iterations=None, seed=None):
+        '''
+        Inputs:
+        - id_to_driver: {driver_id: Driver}
+        - id_to_location: {location_id: location}
+        - deadline: time.perf_counter()的截止时间, 超过后返回当前最好的方案
+        - max_iterations: ALNS的最大迭代次数, 默认Configs.ALNS_MAX_ITERATIONS
+        - seed: 随机种子, 默认Configs.RANDOM_SEED
+        '''
+        self.id_to_driver = id_to_driver
+        self.id_to_location = id_to_location
+        self.deadline = deadline
+        self.max_iterations = Configs.ALNS_MAX_ITERATIONS if max_iterations is None else max_iterations
+        self.rng = random.Random(Configs.RANDOM_SEED if seed is None else seed)
+        self.evaluator = None
+        self.routes = {}
+        self.unassigned_orders = []
+
+
+    def dispatch(self, id_to_unallocated_order: dict):
+        '''
+        Output: driver_id_to_destination, driver_id_to_planned_route(与示例算法的输出相同)
+        '''
+        # 目的地的取货订单已经确定, 不再分配
+        fixed_order_ids = {order.id for driver in self.id_to_driver.values() if driver.destination is not None
+                           for order in driver.destination.pickup_orders}
+        free_orders = [order for order_id, order in id_to_unallocated_order.items() if order_id not in fixed_order_ids]
+        self.__init_evaluator(free_orders)
+
+        for driver_id, driver in self.id_to_driver.items():
+            self.routes[driver_id] = self.__build_fixed_route(driver)
+
+        # 初始解: regret插入
+        free_orders.sort(key=lambda order: order.committed_completion_time)
+        self.unassigned_orders = self.__repair(free_orders, regret=True)
+        initial_score = self.__get_total_score()
+
+        iterations = self.__search(free_orders) if len(free_orders) > 1 else 0
+        logger.info(f"ALNS: {len(free_orders)} orders, {iterations} iterations, "
+                    f"score {initial_score:.3f} -> {self.__get_total_score():.3f}, "
+                    f"{len(self.unassigned_orders)} unassigned orders")
+        return self.__get_output()
+
+
+    def __init_evaluator(self, free_orders: list):
+        '''
+        路线涉及的所有地点的距离和时间矩阵; 模拟器发布了共享内存时使用共享内存中的地图, 否则按坐标计算
+        '''
+        location_ids = set()
+        for driver in self.id_to_driver.values():
+            location_ids.add(driver.current_location_id)
+            if driver.destination is not None:
+                location_ids.add(driver.destination.id)
+            for order in driver.carrying_orders:
+                location_ids.add(order.delivery_location_id)
+        for order in free_orders:
+            location_ids.update([order.pickup_location_id, order.delivery_location_id])
+        location_ids = sorted(location_id for location_id in location_ids if location_id)
+
+        shared_data = attach_shared_static_data()
+        if shared_data is not None and all(location_id in shared_data.location_id_to_index
+                                           for location_id in location_ids):
+            route_map = SharedMap(shared_data)
+        else:
+            route_map = LazyMap(self.id_to_location)
+        route_map.speed_profile = get_speed_profile()
+        self.evaluator = PlanEvaluator.from_route_map(route_map, location_ids, len(self.id_to_driver))
+
+
+    def __build_fixed_route(self, driver):
+        '''
+        固定部分: 目的地的订单, 正在配送的订单和目的地取货订单的送货(按最小增加成本插入)
+        '''
+        initial_load = sum(order.demand for order in driver.carrying_orders)
+        if driver.destination is not None:
+            destination = driver.destination
+            route = DriverRoute(driver, destination.id, destination.arrive_time,
+                                len(destination.pickup_orders) + len(destination.delivery_orders), initial_load)
+            route.stops = [(destination.id, order, True) for order in destination.pickup_orders]
+            route.stops.extend((destination.id, order, False) for order in destination.delivery_orders)
+            delivered_order_ids = {order.id for order in destination.delivery_orders}
+            fixed_deliveries = [order for order in driver.carrying_orders if order.id not in delivered_order_ids]
+            fixed_deliveries.extend(destination.pickup_orders)
+        else:
+            route = DriverRoute(driver, driver.current_location_id,
+                                max(driver.leave_time_at_current_location, driver.gps_update_time), 0, initial_load)
+            fixed_deliveries = list(driver.carrying_orders)
+
+        route.score = self.__evaluate_routes([route], [self.__get_route_arrays(route)])[0]
+        for order in sorted(fixed_deliveries, key=lambda order: order.committed_completion_time):
+            candidates = self.__get_insertion_candidates(route, [(order.delivery_location_id, order, False)])
+            if candidates is None:
+                route.stops.append((order.delivery_location_id, order, False))
+                route.score = self.__evaluate_routes([route], [self.__get_route_arrays(route)])[0]
+                continue
+            route_arrays, positions = candidates
+            scores = self.__evaluate_routes([route], [route_arrays])
+            best = int(np.argmin(scores))
+            route.stops.insert(positions[best][0], (order.delivery_location_id, order, False))
+            route.score = scores[best]
+        return route
+
+
+    # 评估
+    def __get_route_arrays(self, route: DriverRoute, extra_stops=()):
+        '''
+        路线(和待插入的stop)的地点下标, 服务时间, 载重变化, 承诺送达时间(取货为inf)
+        '''
+        stops = list(route.stops) + list(extra_stops)
+        location_indexes = np.array([self.evaluator.location_id_to_index[location_id] for location_id, _, _ in stops],
+                                    dtype=int)
+        service_times = np.array([order.load_time if is_pickup else order.unload_time for _, order, is_pickup in stops],
+                                 dtype=float)
+        load_deltas = np.array([order.demand if is_pickup else -order.demand for _, order, is_pickup in stops],
+                               dtype=float)
+        deadlines = np.array([np.inf if is_pickup else order.committed_completion_time for _, order, is_pickup in stops],
+                             dtype=float)
+        return location_indexes, service_times, load_deltas, deadlines
+
+
+    def __evaluate_routes(self, routes: list, route_arrays: list):
+        '''
+        批量评估路线, route_arrays的每个元素为2维数组(候选路线数, 长度)或1维数组(一条路线)
+        Output: 所有候选路线的分数(按routes的顺序拼接)
+        '''
+        location_matrices, service_matrices, deadline_matrices, start_indexes, start_times = [], [], [], [], []
+        for route, (location_indexes, service_times, _, deadlines) in zip(routes, route_arrays):
+            location_matrices.append(np.atleast_2d(location_indexes))
+            service_matrices.append(np.atleast_2d(service_times))
+            deadline_matrices.append(np.atleast_2d(deadlines))
+            candidate_num = location_matrices[-1].shape[0]
+            start_indexes.append(np.full(candidate_num, self.evaluator.location_id_to_index[route.start_location_id]))
+            start_times.append(np.full(candidate_num, route.start_time, dtype=float))
+
+        max_length = max(max(matrix.shape[1] for matrix in location_matrices), 1)
+        location_matrix = np.concatenate([self.__pad(matrix, max_length, -1) for matrix in location_matrices])
+        service_matrix = np.concatenate([self.__pad(matrix, max_length, 0) for matrix in service_matrices])
+        deadline_matrix = np.concatenate([self.__pad(matrix, max_length, np.inf) for matrix in deadline_matrices])
+        # 每个stop都作为送货位置, 取货的承诺送达时间为inf, 不产生延误
+        delivery_positions = np.where(location_matrix >= 0, np.arange(max_length)[None, :], -1)
+        result = self.evaluator.evaluate(np.concatenate(start_indexes), np.concatenate(start_times), location_matrix,
+                                         service_matrix, delivery_positions, deadline_matrix)
+        return result["scores"]
+
+
+    @staticmethod
+    def __pad(matrix, length: int, value):
+        if matrix.shape[1] == length:
+            return matrix
+        padding = np.full((matrix.shape[0], length - matrix.shape[1]), value, dtype=matrix.dtype)
+        return np.concatenate([matrix, padding], axis=1)
+
+
+    def __get_insertion_candidates(self, route: DriverRoute, new_stops: list):
+        '''
+        把new_stops(1个送货stop, 或同一订单的取货和送货stop)按顺序插入route的所有可行位置(不评估)
+        Output: (route_arrays, positions), route_arrays为__evaluate_routes的输入, positions的每个元素为new_stops在新路线中的位置;
+                没有可行位置时返回None
+        '''
+        length = len(route.stops)
+        new_length = length + len(new_stops)
+        if len(new_stops) == 1:
+            first_positions = np.arange(route.fixed_stop_num, new_length)
+            positions = first_positions[:, None]
+        else:
+            first_positions, second_positions = np.triu_indices(new_length, k=1)
+            mask = first_positions >= route.fixed_stop_num
+            positions = np.stack([first_positions[mask], second_positions[mask]], axis=1)
+        if len(positions) == 0:
+            return None
+
+        # 新路线第k个stop在(原路线 + new_stops)中的下标
+        columns = np.arange(new_length)[None, :]
+        source_indexes = columns.copy()
+        for position_index in range(positions.shape[1]):
+            source_indexes = source_indexes - (columns > positions[:, [position_index]])
+        for position_index in range(positions.shape[1]):
+            source_indexes = np.where(columns == positions[:, [position_index]], length + position_index,
+                                      source_indexes)
+
+        location_indexes, service_times, load_deltas, deadlines = self.__get_route_arrays(route, new_stops)
+        loads = route.initial_load + np.cumsum(load_deltas[source_indexes], axis=1)
+        is_feasible = loads.max(axis=1, initial=route.initial_load) <= route.driver.capacity
+        if not is_feasible.any():
+            return None
+        source_indexes = source_indexes[is_feasible]
+        return ((location_indexes[source_indexes], service_times[source_indexes], None, deadlines[source_indexes]),
+                positions[is_feasible])
+
+
+    def __get_best_insertions(self, orders: list, driver_ids: list):
+        '''
+        每个订单在每个骑手路线中的最优插入位置, 所有订单和骑手的候选路线在一次__evaluate_routes中评估
+        Output: {order_id: {driver_id: (增加的成本, 取货位置, 送货位置)}}, 不包含没有可行位置的骑手
+        '''
+        order_id_to_insertions = {order.id: {} for order in orders}
+        keys, routes, route_arrays, candidate_positions = [], [], [], []
+        for order in orders:
+            new_stops = [(order.pickup_location_id, order, True), (order.delivery_location_id, order, False)]
+            for driver_id in driver_ids:
+                route = self.routes[driver_id]
+                candidates = self.__get_insertion_candidates(route, new_stops)
+                if candidates is None:
+                    continue
+                keys.append((order.id, driver_id))
+                routes.append(route)
+                route_arrays.append(candidates[0])
+                candidate_positions.append(candidates[1])
+        if len(routes) == 0:
+            return order_id_to_insertions
+
+        scores = self.__evaluate_routes(routes, route_arrays)
+        start = 0
+        for (order_id, driver_id), route, positions in zip(keys, routes, candidate_positions):
+            best = start + int(np.argmin(scores[start:start + len(positions)]))
+            best_positions = positions[best - start]
+            order_id_to_insertions[order_id][driver_id] = (scores[best] - route.score, best_positions[0],
+                                                           best_positions[1])
+            start += len(positions)
+        return order_id_to_insertions
+
+
+    def __get_total_score(self):
+        return sum(route.score for route in self.routes.values())
+
+
+    # 修复和破坏算子
+    def __repair(self, orders: list, regret: bool):
+        '''
+        依次插入成本最小的订单(regret=True时插入最优与次优骑手差距最大的订单), 返回没有可行位置的订单
+        '''
+        driver_ids = list(self.routes.keys())
+        order_id_to_insertions = self.__get_best_insertions(orders, driver_ids)
+        left_orders = list(orders)
+        unassigned_orders = []
+        while left_orders:
+            best_order, best_key = None, None
+            for order in left_orders:
+                costs = sorted(insertion[0] for insertion in order_id_to_insertions[order.id].values())
+                if len(costs) == 0:
+                    key = (-math.inf, 0)
+                elif regret:
+                    key = (-(costs[1] - costs[0]) if len(costs) > 1 else -math.inf, costs[0])
+                else:
+                    key = (costs[0], 0)
+                if best_key is None or key < best_key:
+                    best_order, best_key = order, key
+            left_orders.remove(best_order)
+
+            insertions = order_id_to_insertions.pop(best_order.id)
+            if len(insertions) == 0:
+                unassigned_orders.append(best_order)
+                continue
+            driver_id = min(insertions, key=lambda driver_id: insertions[driver_id][0])
+            cost, pickup_position, delivery_position = insertions[driver_id]
+            route = self.routes[driver_id]
+            route.stops.insert(pickup_position, (best_order.pickup_location_id, best_order, True))
+            route.stops.insert(delivery_position, (best_order.delivery_location_id, best_order, False))
+            route.score += cost
+
+            # 只有被修改的路线需要重新计算
+            for order_id, insertions in self.__get_best_insertions(left_orders, [driver_id]).items():
+                order_id_to_insertions[order_id].pop(driver_id, None)
+                order_id_to_insertions[order_id].update(insertions)
+        return unassigned_orders
+
+
+    def __remove_orders(self, orders: list):
+        order_ids = {order.id for order in orders}
+        changed_routes = []
+        for route in self.routes.values():
+            stops = route.stops[:route.fixed_stop_num] + [stop for stop in route.stops[route.fixed_stop_num:]
+                                                          if stop[1].id not in order_ids]
+            if len(stops) != len(route.stops):
+                route.stops = stops
+                changed_routes.append(route)
+        if changed_routes:
+            scores = self.__evaluate_routes(changed_routes, [self.__get_route_arrays(route) for route in changed_routes])
+            for route, score in zip(changed_routes, scores):
+                route.score = score
+
+
+    def __get_assigned_free_orders(self, free_order_ids: set):
+        '''
+        Output: [(order, driver_id)], 已经分配的可以移除的订单
+        '''
+        assigned_orders = []
+        for driver_id, route in self.routes.items():
+            for _, order, is_pickup in route.stops[route.fixed_stop_num:]:
+                if is_pickup and order.id in free_order_ids:
+                    assigned_orders.append((order, driver_id))
+        return assigned_orders
+
+
+    def __random_removal(self, assigned_orders: list, removal_num: int):
+        return [order for order, _ in self.rng.sample(assigned_orders, removal_num)]
+
+
+    def __worst_removal(self, assigned_orders: list, removal_num: int):
+        '''
+        移除后节省成本最多的订单(随机化, Ropke & Pisinger)
+        '''
+        routes, route_arrays = [], []
+        for order, driver_id in assigned_orders:
+            route = self.routes[driver_id]
+            removed_route = DriverRoute(route.driver, route.start_location_id, route.start_time, route.fixed_stop_num,
+                                        route.initial_load)
+            removed_route.stops = [stop for stop in route.stops if stop[1] is not order]
+            routes.append(removed_route)
+            route_arrays.append(self.__get_route_arrays(removed_route))
+        scores = self.__evaluate_routes(routes, route_arrays)
+        savings = [self.routes[driver_id].score - score for (order, driver_id), score in zip(assigned_orders, scores)]
+        ranked_orders = [assigned_orders[index][0] for index in np.argsort(savings)[::-1]]
+        return self.__select_ranked(ranked_orders, removal_num, 3)
+
+
+    def __related_removal(self, assigned_orders: list, removal_num: int):
+        '''
+        移除与随机订单相似(取货地点, 送货地点, 承诺送达时间接近)的订单(Shaw removal)
+        '''
+        seed_order = self.rng.choice(assigned_orders)[0]
+        distance_matrix = self.evaluator.distance_matrix
+        index_of = self.evaluator.location_id_to_index
+
+        def get_relatedness(order):
+            return (distance_matrix[index_of[seed_order.pickup_location_id], index_of[order.pickup_location_id]]
+                    + distance_matrix[index_of[seed_order.delivery_location_id], index_of[order.delivery_location_id]]
+                    + abs(seed_order.committed_completion_time - order.committed_completion_time)
+                    * Configs.DRIVER_SPEED / 3600)
+
+        ranked_orders = sorted((order for order, _ in assigned_orders), key=get_relatedness)
+        return self.__select_ranked(ranked_orders, removal_num, 6)
+
+
+    def __select_ranked(self, ranked_orders: list, removal_num: int, randomness: float):
+        selected_orders = []
+        ranked_orders = list(ranked_orders)
+        while len(selected_orders) < removal_num and ranked_orders:
+            index = int(self.rng.random() ** randomness * len(ranked_orders))
+            selected_orders.append(ranked_orders.pop(index))
+        return selected_orders
+
+
+    # ALNS
+    def __search(self, free_orders: list):
+        '''
+        模拟退火接受准则, 温度随剩余时间线性下降; 算子权重按每段的表现自适应调整
+        Output: 迭代次数
+        '''
+        free_order_ids = {order.id for order in free_orders}
+        destroy_operators = [self.__random_removal, self.__worst_removal, self.__related_removal]
+        repair_regrets = [False, True]
+        destroy_weights = np.ones(len(destroy_operators))
+        repair_weights = np.ones(len(repair_regrets))
+        destroy_scores, destroy_counts = np.zeros(len(destroy_operators)), np.zeros(len(destroy_operators))
+        repair_scores, repair_counts = np.zeros(len(repair_regrets)), np.zeros(len(repair_regrets))
+
+        current_score = best_score = self.__get_unassigned_penalty() + self.__get_total_score()
+        best_solution = self.__save_solution()
+        start_time = time.perf_counter()
+        total_seconds = max(self.deadline - start_time, 1e-6)
+        # 初始温度: 以50%的概率接受差ALNS_START_TEMPERATURE_RATIO的解
+        start_temperature = Configs.ALNS_START_TEMPERATURE_RATIO * abs(current_score) / math.log(2) + 1e-9
+
+        iteration = 0
+        while iteration < self.max_iterations:
+            now = time.perf_counter()
+            if now >= self.deadline:
+                break
+            iteration += 1
+
+            assigned_orders = self.__get_assigned_free_orders(free_order_ids)
+            if len(assigned_orders) == 0:
+                break
+            removal_num = self.rng.randint(1, max(1, min(Configs.ALNS_MAX_REMOVAL,
+                                                         math.ceil(len(assigned_orders) * 0.4))))
+            destroy_index = self.__roulette(destroy_weights)
+            repair_index = self.__roulette(repair_weights)
+            saved_solution = self.__save_solution()
+
+            removed_orders = destroy_operators[destroy_index](assigned_orders, removal_num)
+            self.__remove_orders(removed_orders)
+            self.rng.shuffle(removed_orders)
+            removed_orders.extend(self.unassigned_orders)
+            self.unassigned_orders = self.__repair(removed_orders, repair_regrets[repair_index])
+            new_score = self.__get_unassigned_penalty() + self.__get_total_score()
+
+            temperature = start_temperature * max(self.deadline - now, 0) / total_seconds
+            reward = 0
+            if new_score < best_score - 1e-9:
+                best_score, best_solution = new_score, self.__save_solution()
+                current_score, reward = new_score, SIGMA_BEST
+            elif new_score < current_score - 1e-9:
+                current_score, reward = new_score, SIGMA_BETTER
+            elif temperature > 0 and self.rng.random() < math.exp(-(new_score - current_score) / temperature):
+                current_score, reward = new_score, SIGMA_ACCEPTED
+            else:
+                self.__restore_solution(saved_solution)
+
+            destroy_scores[destroy_index] += reward
+            destroy_counts[destroy_index] += 1
+            repair_scores[repair_index] += reward
+            repair_counts[repair_index] += 1
+            if iteration % SEGMENT_ITERATIONS == 0:
+                destroy_weights = self.__update_weights(destroy_weights, destroy_scores, destroy_counts)
+                repair_weights = self.__update_weights(repair_weights, repair_scores, repair_counts)
+                destroy_scores[:], destroy_counts[:], repair_scores[:], repair_counts[:] = 0, 0, 0, 0
+
+        self.__restore_solution(best_solution)
+        return iteration
+
+
+    def __get_unassigned_penalty(self):
+        '''
+        没有分配的订单按Configs.MAX_SCORE惩罚, 保证尽量分配所有订单
+        '''
+        return len(self.unassigned_orders) * Configs.MAX_SCORE
+
+
+    def __roulette(self, weights):
+        return int(np.searchsorted(np.cumsum(weights), self.rng.random() * weights.sum(), side="right"))
+
+
+    @staticmethod
+    def __update_weights(weights, scores, counts):
+        used = counts > 0
+        new_weights = weights.copy()
+        new_weights[used] = (1 - REACTION_FACTOR) * weights[used] + REACTION_FACTOR * scores[used] / counts[used]
+        return np.maximum(new_weights, 1e-3)
+
+
+    def __save_solution(self):
+        return ({driver_id: (list(route.stops), route.score) for driver_id, route in self.routes.items()},
+                list(self.unassigned_orders))
+
+
+    def __restore_solution(self, solution: tuple):
+        driver_id_to_route, unassigned_orders = solution
+        for driver_id, (stops, score) in driver_id_to_route.items():
+            self.routes[driver_id].stops = list(stops)
+            self.routes[driver_id].score = score
+        self.unassigned_orders = list(unassigned_orders)
+
+
+    # 输出
+    def __get_output(self):
+        '''
+        同一地点相邻的stop合并为一个Node; 有目的地的骑手, 第一个Node为原目的地(到达时间不变)
+        '''
+        driver_id_to_destination = {}
+        driver_id_to_planned_route = {}
+        for driver_id, route in self.routes.items():
+            driver = route.driver
+            nodes = []
+            for location_id, order, is_pickup in route.stops:
+                if len(nodes) == 0 or nodes[-1].id != location_id:
+                    location = self.id_to_location.get(location_id)
+                    nodes.append(Node(location_id, location.lat, location.lng, [], []))
+                if is_pickup:
+                    nodes[-1].pickup_orders.append(order)
+                else:
+                    nodes[-1].delivery_orders.append(order)
+
+            destination = None
+            if driver.destination is not None:
+                if len(nodes) == 0 or nodes[0].id != driver.destination.id:
+                    location = self.id_to_location.get(driver.destination.id)
+                    nodes.insert(0, Node(driver.destination.id, location.lat, location.lng, [], []))
+                destination = nodes.pop(0)
+                destination.arrive_time = driver.destination.arrive_time
+            elif len(nodes) > 0:
+                destination = nodes.pop(0)
+            driver_id_to_destination[driver_id] = destination
+            driver_id_to_planned_route[driver_id] = nodes
+        return driver_id_to_destination, driver_id_to_planned_route
+
+
+def get_time_budget():
+    '''
+    ALNS的时间预算(秒): 不超过Configs.ALNS_MAX_SECONDS, 也不超过算法运行时间上限的ALNS_RUNTIME_RATIO
+    '''
+    return min(Configs.ALNS_MAX_SECONDS, Configs.MAX_RUNTIME_OF_ALGORITHM * Configs.ALNS_RUNTIME_RATIO)
+
+
+def dispatch_orders_by_alns(id_to_unallocated_order: dict, id_to_driver: dict, id_to_location: dict,
+                            start_time=None):
+    '''
+    Inputs: 与示例算法dispatch_orders_to_drivers相同
+    - start_time: 算法开始的time.perf_counter(), 时间预算包括读取输入的时间
+    Output: driver_id_to_destination, driver_id_to_planned_route
+    '''
+    start_time = time.perf_counter() if start_time is None else start_time
+    dispatcher = AlnsDispatcher(id_to_driver, id_to_location, start_time + get_time_budget())
+    return dispatcher.dispatch(id_to_unallocated_order)
@@ -0,0 +1,128 @@
+import numpy as np
+
+from src.configuration.config import Configs
+from src.utils.tools import haversine_distance
+
+
+'''
+订单合并: 同一餐厅, 顾客距离接近, 承诺送达时间接近的订单合并为一个批次, 由同一个骑手一次取货后依次送达
+兼容图: 订单为节点, 两个订单可以合并时有边; 每个批次为图中的一个团(批次内任意两个订单都兼容)
+'''
+
+
+def get_compatibility_graph(orders: list, id_to_location: dict, max_distance=None, max_deadline_gap=None,
+                            location_index=None):
+    '''
+    同一餐厅的订单两两计算兼容性(向量化), 不同餐厅的订单不兼容
+    Inputs:
+    - orders: list of orders
+    - id_to_location: {location_id: location}
+    - max_distance: 顾客之间的最大距离(km), 默认Configs.BUNDLE_MAX_CUSTOMER_DISTANCE
+    - max_deadline_gap: 承诺送达时间的最大差(秒), 默认Configs.BUNDLE_MAX_DEADLINE_GAP
+    - location_index: 可选, LocationIndex, 不计算所有订单对的距离:
+        Configs.BUNDLE_SHORTLIST_BY_CLUSTER为True时只合并餐厅聚类(直径不超过max_distance的最高一层)中同一个聚类的顾客,
+        否则k近邻包括了max_distance内所有顾客时只检查k近邻
+    Output:
+    - {pickup_location_id: (该餐厅的订单列表, 兼容矩阵(bool, 订单数 x 订单数))}
+    '''
+    max_distance = Configs.BUNDLE_MAX_CUSTOMER_DISTANCE if max_distance is None else max_distance
+    max_deadline_gap = Configs.BUNDLE_MAX_DEADLINE_GAP if max_deadline_gap is None else max_deadline_gap
+
+    pickup_location_id_to_orders = {}
+    for order in orders:
+        pickup_location_id_to_orders.setdefault(order.pickup_location_id, []).append(order)
+
+    cluster_level = None
+    if location_index is not None and Configs.BUNDLE_SHORTLIST_BY_CLUSTER:
+        cluster_level = location_index.get_cluster_level(max_distance)
+
+    pickup_location_id_to_graph = {}
+    for pickup_location_id, restaurant_orders in pickup_location_id_to_orders.items():
+        delivery_location_ids = [order.delivery_location_id for order in restaurant_orders]
+        if cluster_level is not None and pickup_location_id in location_index.restaurant_id_to_clusters:
+            is_close = location_index.get_cluster_matrix(pickup_location_id, delivery_location_ids, cluster_level)
+        elif location_index is not None and location_index.contains(delivery_location_ids) \
+                and location_index.covers(delivery_location_ids, max_distance):
+            is_close = location_index.get_neighbor_matrix(delivery_location_ids, max_distance)
+        else:
+            locations = [id_to_location.get(location_id) for location_id in delivery_location_ids]
+            lats = np.array([location.lat for location in locations])
+            lngs = np.array([location.lng for location in locations])
+            is_close = haversine_distance(lats[:, None], lngs[:, None], lats[None, :], lngs[None, :]) <= max_distance
+
+        deadlines = np.array([order.committed_completion_time for order in restaurant_orders], dtype=float)
+        deadline_gaps = np.abs(deadlines[:, None] - deadlines[None, :])
+        is_compatible = is_close & (deadline_gaps <= max_deadline_gap)
+        pickup_location_id_to_graph[pickup_location_id] = (restaurant_orders, is_compatible)
+    return pickup_location_id_to_graph
+
+
+def bundle_orders(orders: list, id_to_location: dict, max_size=None, max_distance=None, max_deadline_gap=None,
+                  location_index=None):
+    '''
+    在兼容图上贪心划分团: 按承诺送达时间依次选择种子订单, 加入与批次内所有订单都兼容的最早的订单, 直到达到max_size
+    Inputs:
+    - max_size: 每个批次的最大订单数量, 默认Configs.BUNDLE_MAX_ORDERS
+    - 其他参数与get_compatibility_graph相同
+    Output:
+    - list of bundles, 每个批次为订单列表(第一个为种子订单), 按种子订单在orders中的顺序排列
+    '''
+    max_size = Configs.BUNDLE_MAX_ORDERS if max_size is None else max_size
+    if max_size <= 1:
+        return [[order] for order in orders]
+
+    order_id_to_bundle = {}
+    pickup_location_id_to_graph = get_compatibility_graph(orders, id_to_location, max_distance, max_deadline_gap,
+                                                          location_index)
+    for restaurant_orders, is_compatible in pickup_location_id_to_graph.values():
+        is_bundled = np.zeros(len(restaurant_orders), dtype=bool)
+        sequence = sorted(range(len(restaurant_orders)),
+                          key=lambda index: restaurant_orders[index].committed_completion_time)
+        for seed in sequence:
+            if is_bundled[seed]:
+                continue
+            is_bundled[seed] = True
+            members = [seed]
+            # 与批次内所有订单都兼容的候选订单
+            candidates = is_compatible[seed] & ~is_bundled
+            for index in sequence:
+                if len(members) >= max_size:
+                    break
+                if not candidates[index]:
+                    continue
+                members.append(index)
+                is_bundled[index] = True
+                candidates &= is_compatible[index]
+                candidates[index] = False
+            bundle = [restaurant_orders[index] for index in members]
+            for order in bundle:
+                order_id_to_bundle[order.id] = bundle
+
+    bundles = []
+    for order in orders:
+        bundle = order_id_to_bundle.get(order.id)
+        if bundle is not None and bundle[0] is order:
+            bundles.append(bundle)
+    return bundles
+
+
+def sort_deliveries_of_bundle(bundle: list, id_to_location: dict):
+    '''
+    批次的送货顺序: 从餐厅出发, 每次前往最近的顾客(距离相同时承诺送达时间早的优先)
+    Output: 按送货顺序排列的订单列表
+    '''
+    if len(bundle) <= 1:
+        return list(bundle)
+    current_location = id_to_location.get(bundle[0].pickup_location_id)
+    left_orders = list(bundle)
+    sorted_orders = []
+    while left_orders:
+        locations = [id_to_location.get(order.delivery_location_id) for order in left_orders]
+        distances = haversine_distance(current_location.lat, current_location.lng,
+                                       np.array([location.lat for location in locations]),
+                                       np.array([location.lng for location in locations]))
+        index = min(range(len(left_orders)),
+                    key=lambda index: (distances[index], left_orders[index].committed_completion_time))
+        sorted_orders.append(left_orders.pop(index))
+        current_location = locations[index]
+    return sorted_orders
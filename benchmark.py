@@ -0,0 +1,207 @@
+# 模拟器性能测试: 在不同规模的生成测试例上记录加载时间, 每秒时间片数, 算法I/O时间和内存峰值
+# 命令行运行时结果追加到benchmark_results.csv并与上一次比较; pytest-benchmark的测试见tests/benchmarks
+import csv
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from src.configuration.config import Configs
+from src.utils.logging_engine import logger
+
+
+# 测试规模, 可以通过命令行选择, e.g., python benchmark.py small medium
+BENCHMARK_SIZES = {
+    "small": {"order_num": 300, "driver_num": 20, "customer_num": 200, "restaurant_num": 4},
+    "medium": {"order_num": 5000, "driver_num": 50, "customer_num": 400, "restaurant_num": 10},
+    "large": {"order_num": 50000, "driver_num": 200, "customer_num": 800, "restaurant_num": 20},
+}
+DEFAULT_SIZES = ["small", "medium"]
+
+benchmark_output_folder = os.path.join(Configs.output_folder, "benchmark")
+benchmark_result_file_path = os.path.join(benchmark_output_folder, "benchmark_results.csv")
+
+# 越小越好的指标和越大越好的指标, 用于判断是否变差
+LOWER_IS_BETTER = ["load_seconds", "algorithm_io_seconds", "peak_memory_mb"]
+HIGHER_IS_BETTER = ["ticks_per_second"]
+
+
+def prepare_instance(size_name: str):
+    '''
+    生成测试例(参数不变时复用已经生成的文件)
+    '''
+    from src.utils.instance_generator import generate_instance
+
+    params = BENCHMARK_SIZES.get(size_name)
+    folder_path = os.path.join(benchmark_output_folder, "instances", size_name)
+    instance = f"instance_{size_name}"
+    params_file_path = os.path.join(folder_path, "params.json")
+    if os.path.exists(params_file_path) and read_params(params_file_path) == params:
+        return folder_path, instance
+
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+    generate_instance(folder_path, instance, **params)
+    with open(params_file_path, "w") as fd:
+        fd.write(json.dumps(params))
+    return folder_path, instance
+
+
+def read_params(file_path: str):
+    with open(file_path, "r") as fd:
+        return json.loads(fd.read())
+
+
+def load_instance(size_name: str):
+    '''
+    读取一个规模的测试例(不使用快照缓存), 用于测量加载时间
+    '''
+    from src.utils.input_utils import get_initial_data
+    from src.utils.time_utils import get_initial_time
+
+    folder_path, instance = prepare_instance(size_name)
+    Configs.set_benchmark_folder(folder_path)
+    instance_folder_path = os.path.join(folder_path, instance)
+    return get_initial_data(os.path.join(instance_folder_path, f"{instance}.csv"),
+                            os.path.join(instance_folder_path, "driver_info.csv"),
+                            Configs.route_info_file_path,
+                            Configs.customer_info_file_path,
+                            Configs.restaurant_info_file_path,
+                            get_initial_time())
+
+
+def run_benchmark_case(size_name: str):
+    '''
+    在独立进程中运行一个规模的测试, 保证内存峰值互不影响
+    模拟失败(包括sys.exit)时返回None, 否则进程池的worker退出后主进程会一直等待
+    '''
+    from src.simulator.simulator_api import run_simulation
+
+    # 加载时间
+    start_time = time.perf_counter()
+    load_instance(size_name)
+    load_seconds = time.perf_counter() - start_time
+    Configs.SAVE_PROFILE_REPORT = False
+    _, instance = prepare_instance(size_name)
+
+    # 模拟
+    start_time = time.perf_counter()
+    try:
+        simulate_env = run_simulation(Configs.customer_info_file, Configs.restaurant_info_file,
+                                      Configs.route_info_file, instance)
+    except SystemExit as exception:
+        logger.error(f"Benchmark {size_name}: simulator terminated ({exception.code})")
+        return None
+    if simulate_env is None:
+        logger.error(f"Benchmark {size_name}: failed to initialize the simulation")
+        return None
+    simulation_seconds = time.perf_counter() - start_time
+    summary = simulate_env.profiler.get_summary()
+    timers = summary.get("timers")
+
+    return {"size": size_name,
+            **BENCHMARK_SIZES.get(size_name),
+            "load_seconds": load_seconds,
+            "simulation_seconds": simulation_seconds,
+            "tick_num": summary.get("tick_num"),
+            "ticks_per_second": summary.get("ticks_per_second"),
+            "algorithm_io_seconds": sum(timers.get(name, {}).get("total", 0)
+                                        for name in ["json_export", "output_parsing"]),
+            "algorithm_seconds": timers.get("algorithm_subprocess", {}).get("total", 0),
+            "peak_memory_mb": get_peak_memory_mb(),
+            "score": simulate_env.total_score}
+
+
+def run_benchmark_case_in_new_process(size_name: str):
+    '''
+    在新的进程(spawn)中运行run_benchmark_case
+    '''
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_benchmark_case, (size_name,))
+
+
+def get_peak_memory_mb():
+    '''
+    当前进程的内存峰值(不支持resource模块的系统返回0)
+    '''
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS单位是byte, Linux单位是KB
+    return peak_memory / 1024 / 1024 if sys.platform == "darwin" else peak_memory / 1024
+
+
+def get_previous_results():
+    '''
+    每个规模最近一次的测试结果
+    '''
+    size_to_result = {}
+    if not os.path.exists(benchmark_result_file_path):
+        return size_to_result
+    with open(benchmark_result_file_path, "r") as fd:
+        for row in csv.DictReader(fd):
+            size_to_result[row["size"]] = row
+    return size_to_result
+
+
+def check_regression(result: dict, previous_result: dict):
+    '''
+    与上一次结果比较, 指标变差超过Configs.BENCHMARK_REGRESSION_TOLERANCE时报警
+    '''
+    if previous_result is None:
+        return []
+    regressions = []
+    tolerance = Configs.BENCHMARK_REGRESSION_TOLERANCE
+    for name in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+        previous_value = float(previous_result.get(name, 0) or 0)
+        value = result.get(name, 0)
+        if previous_value <= 0:
+            continue
+        if name in LOWER_IS_BETTER and value > previous_value * (1 + tolerance):
+            regressions.append(f"{name}: {previous_value:.3f} -> {value:.3f}")
+        elif name in HIGHER_IS_BETTER and value < previous_value * (1 - tolerance):
+            regressions.append(f"{name}: {previous_value:.3f} -> {value:.3f}")
+    return regressions
+
+
+def save_results(results: list):
+    if not os.path.exists(benchmark_output_folder):
+        os.makedirs(benchmark_output_folder)
+    is_new_file = not os.path.exists(benchmark_result_file_path)
+    header = ["run_time"] + list(results[0].keys())
+    with open(benchmark_result_file_path, "a", newline="") as fd:
+        writer = csv.DictWriter(fd, fieldnames=header)
+        if is_new_file:
+            writer.writeheader()
+        run_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for result in results:
+            writer.writerow({"run_time": run_time, **result})
+
+
+if __name__ == "__main__":
+    size_names = sys.argv[1:] if len(sys.argv) > 1 else DEFAULT_SIZES
+    previous_results = get_previous_results()
+
+    results = []
+    for size_name in size_names:
+        if size_name not in BENCHMARK_SIZES:
+            logger.error(f"Unknown benchmark size {size_name}, choose from {list(BENCHMARK_SIZES.keys())}")
+            continue
+        result = run_benchmark_case_in_new_process(size_name)
+        if result is None:
+            continue
+        results.append(result)
+        logger.info(f"Benchmark {size_name}: {result}")
+
+        regressions = check_regression(result, previous_results.get(size_name))
+        for regression in regressions:
+            logger.warning(f"Benchmark {size_name} regression, {regression}")
+
+    if results:
+        save_results(results)
+    print(json.dumps(results, indent=4))
@@ -1,3 +1,6 @@
+from src.configuration.config import Configs
+
+
 class Driver(object):
     def __init__(self, driver_id: str, capacity:int, gps_id: str, operation_time: int, carrying_orders=None):
         '''
@@ -36,6 +39,15 @@ class Driver(object):
         self.destination = None
         self.planned_route = []
 
+        '''
+        state: 骑手状态, Configs.DRIVER_STATE_TO_CODE
+        next_free_time: 完成目的地和计划路线(变为空闲)的预计时间, 空闲骑手为变为空闲的时间(不随时间片改变)
+        next_free_location_id: 变为空闲时所在的地点
+        '''
+        self.state = Configs.DRIVER_STATE_TO_CODE.get("IDLE")
+        self.next_free_time = 0
+        self.next_free_location_id = ""
+
     def add_order(self, order):
         '''
         Add new order to the driver
@@ -80,6 +92,25 @@ class Driver(object):
             self.leave_time_at_current_location = 0
     
     
+    def update_state(self, cur_time: int):
+        '''
+        根据目的地和计划路线更新骑手状态, 预计空闲的时间和地点(计划路线的时间由driver simulator计算)
+        '''
+        if self.destination is None:
+            # 已经空闲的骑手保留变为空闲的时间, 骑手索引中的位置不随时间片改变
+            self.state = Configs.DRIVER_STATE_TO_CODE.get("IDLE")
+            self.next_free_time = max(self.next_free_time, self.leave_time_at_current_location)
+            self.next_free_location_id = self.current_location_id
+            return
+        last_node = self.planned_route[-1] if len(self.planned_route) > 0 else self.destination
+        if len(self.destination.pickup_orders) > 0:
+            self.state = Configs.DRIVER_STATE_TO_CODE.get("TO_PICKUP")
+        else:
+            self.state = Configs.DRIVER_STATE_TO_CODE.get("TO_DELIVERY")
+        self.next_free_time = last_node.leave_time
+        self.next_free_location_id = last_node.id
+    
+    
     def __str__(self):
         return "[{}:{}]".format(self.__class__.__name__, self.gather_attrs())
     
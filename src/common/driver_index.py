@@ -0,0 +1,114 @@
+import bisect
+import math
+
+from src.configuration.config import Configs
+
+
+class DriverIndex(object):
+    def __init__(self, drivers=()):
+        '''
+        按状态和空闲地点分组, 组内按预计空闲时间排序的骑手索引(有序列表 + bisect)
+        查询"某个时间之前空闲, 在某些地点附近的骑手"为O(地点数 * log n + 结果数量)
+        空闲骑手的空闲时间为变为空闲的时间(Driver.update_state), 不随时间片改变, 只有状态改变的骑手需要更新
+        Inputs:
+        - drivers: 骑手列表, 需要先调用driver.update_state
+        '''
+        # {driver_id: (state, next_free_time, next_free_location_id)}
+        self.driver_id_to_key = {}
+        # {state: [(next_free_time, driver_id)]}, {location_id: [(next_free_time, driver_id)]}
+        self.state_to_entries = {}
+        self.location_id_to_entries = {}
+        for driver in drivers:
+            self.update(driver)
+
+
+    def update(self, driver):
+        '''
+        添加骑手, 或骑手的状态, 预计空闲时间和地点改变后更新
+        '''
+        key = (driver.state, driver.next_free_time, driver.next_free_location_id)
+        if self.driver_id_to_key.get(driver.id) == key:
+            return
+        self.remove(driver.id)
+        self.driver_id_to_key[driver.id] = key
+        entry = (driver.next_free_time, driver.id)
+        bisect.insort(self.state_to_entries.setdefault(driver.state, []), entry)
+        bisect.insort(self.location_id_to_entries.setdefault(driver.next_free_location_id, []), entry)
+
+
+    def remove(self, driver_id: str):
+        key = self.driver_id_to_key.pop(driver_id, None)
+        if key is None:
+            return
+        state, next_free_time, next_free_location_id = key
+        DriverIndex.__remove_entry(self.state_to_entries.get(state), (next_free_time, driver_id))
+        DriverIndex.__remove_entry(self.location_id_to_entries.get(next_free_location_id), (next_free_time, driver_id))
+
+
+    @staticmethod
+    def __remove_entry(entries: list, entry: tuple):
+        index = bisect.bisect_left(entries, entry)
+        if index < len(entries) and entries[index] == entry:
+            del entries[index]
+
+
+    @staticmethod
+    def __count_free_before(entries: list, time: float):
+        '''
+        有序列表中空闲时间<=time的数量
+        '''
+        return bisect.bisect_left(entries, (math.nextafter(time, math.inf),))
+
+
+    def get_drivers_of_state(self, state_name: str):
+        '''
+        Output: 状态为state_name的骑手id, 按预计空闲时间排序
+        '''
+        entries = self.state_to_entries.get(Configs.DRIVER_STATE_TO_CODE.get(state_name), [])
+        return [driver_id for _, driver_id in entries]
+
+
+    def get_next_free_time(self, after_time: int, state_names=("TO_PICKUP", "TO_DELIVERY")):
+        '''
+        状态为state_names的骑手中, 在after_time之后最早变为空闲的时间, 没有时返回None
+        '''
+        free_times = []
+        for state_name in state_names:
+            entries = self.state_to_entries.get(Configs.DRIVER_STATE_TO_CODE.get(state_name), [])
+            index = DriverIndex.__count_free_before(entries, after_time)
+            if index < len(entries):
+                free_times.append(entries[index][0])
+        return min(free_times) if free_times else None
+
+
+    def get_drivers_free_before(self, before_time: int, location_ids=None):
+        '''
+        预计空闲时间<=before_time的骑手, 按空闲时间排序
+        Inputs:
+        - location_ids: 可选, 只包括空闲地点在这些地点的骑手
+        Output: [(next_free_time, driver_id)]
+        '''
+        if location_ids is None:
+            entry_lists = self.state_to_entries.values()
+        else:
+            entry_lists = [self.location_id_to_entries.get(location_id, []) for location_id in location_ids]
+        result = []
+        for entries in entry_lists:
+            result.extend(entries[:DriverIndex.__count_free_before(entries, before_time)])
+        result.sort()
+        return result
+
+
+    def get_drivers_free_near(self, location_id: str, before_time: int, location_index, max_distance=None):
+        '''
+        before_time之前空闲, 空闲地点在location_id的k近邻(max_distance km内)中的骑手
+        Inputs:
+        - location_index: LocationIndex
+        Output: [(next_free_time, distance, driver_id)], 按空闲时间和距离排序
+        '''
+        result = []
+        for neighbor_location_id, distance in location_index.get_neighbors(location_id, max_distance):
+            for next_free_time, driver_id in self.get_drivers_free_before(before_time, [neighbor_location_id]):
+                result.append((next_free_time, distance, driver_id))
+        result.sort()
+        return result
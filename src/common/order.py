@@ -1,5 +1,5 @@
-import datetime
 from src.utils.logging_engine import logger
+from src.utils.time_utils import timestamp_to_datetime
 
 class Order(object):
     def __init__(self, order_id: str, demand: float, creation_time: int, committed_completion_time: int,
@@ -29,11 +29,12 @@ class Order(object):
         # state
         self.delivery_state = int(state)
 
-        # output order information
-        logger.debug(f"{order_id}, creation time: {datetime.datetime.fromtimestamp(creation_time)}, "
-                     f"committed completion time: {datetime.datetime.fromtimestamp(committed_completion_time)}, "
-                     f"pickup restaurant id: {order_restaurant_id}, delivery customer location id: {order_customer_id}"
-                     )
+        # output order information, 只有debug级别开启时才格式化
+        if logger.is_enabled_for("debug"):
+            logger.debug(f"{order_id}, creation time: {timestamp_to_datetime(creation_time)}, "
+                         f"committed completion time: {timestamp_to_datetime(committed_completion_time)}, "
+                         f"pickup restaurant id: {order_restaurant_id}, delivery customer location id: {order_customer_id}"
+                         )
 
 
 
@@ -0,0 +1,257 @@
+import heapq
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from src.common.route import Map, LazyMap
+from src.configuration.config import Configs
+from src.utils.logging_engine import logger
+from src.utils.tools import haversine_distance
+
+
+class RoadNetworkMap(Map):
+    def __init__(self, edge_df: pd.DataFrame, node_df: pd.DataFrame, id_to_location: dict,
+                 precompute_location_ids=None, tree_cache_size=None):
+        '''
+        基于路网的地图, 地点对之间的时间和距离为路网上的最短路(按时间)
+        - 每个地点吸附到最近的路网节点, 吸附距离按Configs.DRIVER_SPEED计入时间
+        - 预先计算precompute_location_ids(e.g., 餐厅)出发的最短路树, 其他起点的最短路树按需计算, 保存在LRU中
+        - 最短路树只保存到地点吸附节点的时间和距离, 每棵树的内存与地点数量成正比, 与路网规模无关
+        - 不连通的地点对使用LazyMap(haversine)估计, 不返回sys.maxsize, 每个地点对只警告一次
+        Inputs:
+        - edge_df: 路段, ['start_node_id', 'end_node_id', 'distance', 'time', 'oneway'(可选, 默认双向)]
+        - node_df: 节点, ['node_id', 'latitude', 'longitude']
+        - id_to_location: {location_id: location object(restaurant or customer)}
+        - precompute_location_ids: 预先计算最短路树的地点
+        - tree_cache_size: 按需计算的最短路树的数量上限, 默认Configs.ROAD_TREE_CACHE_SIZE
+        '''
+        super().__init__({})
+        self.fallback_map = LazyMap(id_to_location)
+        self.tree_cache_size = tree_cache_size or Configs.ROAD_TREE_CACHE_SIZE
+
+        # 节点
+        node_ids = [str(node_id) for node_id in node_df["node_id"]]
+        node_id_to_index = {node_id: index for index, node_id in enumerate(node_ids)}
+        self.node_lats = node_df["latitude"].to_numpy(dtype=float)
+        self.node_lngs = node_df["longitude"].to_numpy(dtype=float)
+
+        # 邻接表(CSR), 每个节点的出边在[offsets[i], offsets[i + 1])之间
+        self.__build_adjacency(edge_df, node_id_to_index)
+
+        # 地点吸附到最近的节点
+        self.location_id_to_node_index, self.location_id_to_snap_distance = self.__snap_locations(id_to_location)
+        # 最短路树中的位置: 地点吸附节点(去重)在树的数组中的下标
+        self.__tree_node_indexes = np.array(sorted(set(self.location_id_to_node_index.values())), dtype=int)
+        node_index_to_tree_index = {node_index: tree_index
+                                    for tree_index, node_index in enumerate(self.__tree_node_indexes.tolist())}
+        self.location_id_to_tree_index = {location_id: node_index_to_tree_index.get(node_index)
+                                          for location_id, node_index in self.location_id_to_node_index.items()}
+        self.__warned_location_id_pairs = set()
+
+        # 最短路树: {source node index: (time array, distance array)}, 数组与self.__tree_node_indexes一一对应
+        self.__precomputed_trees = {}
+        self.__cached_trees = OrderedDict()
+        self.tree_hits = 0
+        self.tree_misses = 0
+        for location_id in precompute_location_ids or []:
+            node_index = self.location_id_to_node_index.get(location_id)
+            if node_index is not None and node_index not in self.__precomputed_trees:
+                self.__precomputed_trees[node_index] = self.__compute_tree(node_index)
+        logger.info(f"Road network: {len(node_ids)} nodes, {len(self.__targets)} arcs, "
+                    f"{len(self.__precomputed_trees)} precomputed shortest path trees")
+
+
+    def __build_adjacency(self, edge_df: pd.DataFrame, node_id_to_index: dict):
+        start_indexes = np.array([node_id_to_index[str(node_id)] for node_id in edge_df["start_node_id"]], dtype=int)
+        end_indexes = np.array([node_id_to_index[str(node_id)] for node_id in edge_df["end_node_id"]], dtype=int)
+        distances = edge_df["distance"].to_numpy(dtype=float)
+        times = edge_df["time"].to_numpy(dtype=float)
+        oneway = RoadNetworkMap.parse_oneway(edge_df["oneway"]) if "oneway" in edge_df.columns \
+            else np.zeros(len(edge_df), dtype=bool)
+
+        # 双向路段增加反向的弧
+        two_way = ~oneway
+        sources = np.concatenate([start_indexes, end_indexes[two_way]])
+        targets = np.concatenate([end_indexes, start_indexes[two_way]])
+        distances = np.concatenate([distances, distances[two_way]])
+        times = np.concatenate([times, times[two_way]])
+
+        order = np.argsort(sources, kind="stable")
+        self.__offsets = np.searchsorted(sources[order], np.arange(len(node_id_to_index) + 1)).tolist()
+        # python list在Dijkstra的循环中比numpy array快
+        self.__targets = targets[order].tolist()
+        self.__arc_times = times[order].tolist()
+        self.__arc_distances = distances[order].tolist()
+
+
+    @staticmethod
+    def parse_oneway(oneway: pd.Series):
+        '''
+        oneway列可能是bool, 0/1或字符串("yes"/"no", "True"/"False"), 只有明确的真值才是单行道
+        '''
+        if oneway.dtype == bool:
+            return oneway.to_numpy()
+        values = oneway.fillna("").astype(str).str.strip().str.lower()
+        return values.isin(["1", "1.0", "true", "yes", "y", "t"]).to_numpy()
+
+
+    def __snap_locations(self, id_to_location: dict):
+        '''
+        每个地点最近的路网节点和吸附距离(km)
+        '''
+        location_id_to_node_index = {}
+        location_id_to_snap_distance = {}
+        for location_id, location in id_to_location.items():
+            distances = haversine_distance(location.lat, location.lng, self.node_lats, self.node_lngs)
+            node_index = int(np.argmin(distances))
+            location_id_to_node_index[location_id] = node_index
+            location_id_to_snap_distance[location_id] = float(distances[node_index])
+        return location_id_to_node_index, location_id_to_snap_distance
+
+
+    def __dijkstra(self, source: int):
+        '''
+        从source出发的最短路(按时间), 同时记录最短路的距离, 不可达的节点为np.inf
+        '''
+        node_num = len(self.__offsets) - 1
+        times = [float("inf")] * node_num
+        distances = [float("inf")] * node_num
+        times[source] = 0
+        distances[source] = 0
+        offsets, targets, arc_times, arc_distances = (self.__offsets, self.__targets, self.__arc_times,
+                                                      self.__arc_distances)
+        heap = [(0, source)]
+        while heap:
+            time, node = heapq.heappop(heap)
+            if time > times[node]:
+                continue
+            for arc in range(offsets[node], offsets[node + 1]):
+                target = targets[arc]
+                new_time = time + arc_times[arc]
+                if new_time < times[target]:
+                    times[target] = new_time
+                    distances[target] = distances[node] + arc_distances[arc]
+                    heapq.heappush(heap, (new_time, target))
+        return np.array(times), np.array(distances)
+
+
+    def __compute_tree(self, source: int):
+        '''
+        从source出发到所有地点吸附节点的时间和距离
+        '''
+        times, distances = self.__dijkstra(source)
+        return times[self.__tree_node_indexes], distances[self.__tree_node_indexes]
+
+
+    def __get_tree(self, source: int):
+        if source in self.__precomputed_trees:
+            self.tree_hits += 1
+            return self.__precomputed_trees.get(source)
+        if source in self.__cached_trees:
+            self.tree_hits += 1
+            self.__cached_trees.move_to_end(source)
+            return self.__cached_trees.get(source)
+
+        self.tree_misses += 1
+        tree = self.__compute_tree(source)
+        self.__cached_trees[source] = tree
+        if len(self.__cached_trees) > self.tree_cache_size:
+            self.__cached_trees.popitem(last=False)
+        return tree
+
+
+    def calculate_distance_between_locations(self, org_location_id, dest_location_id):
+        '''
+        计算origin和destination的距离
+        '''
+        if org_location_id == dest_location_id:
+            return 0
+        return float(self.calculate_routes_from_location(org_location_id, [dest_location_id])[0][0])
+
+
+    def calculate_time_between_locations(self, org_location_id, dest_location_id):
+        '''
+        计算origin和destination的时间(秒)
+        '''
+        if org_location_id == dest_location_id:
+            return 0
+        return float(self.calculate_routes_from_location(org_location_id, [dest_location_id])[1][0])
+
+
+    def calculate_routes_from_location(self, org_location_id, dest_location_ids: list):
+        '''
+        一个起点到多个终点的距离和时间(一次最短路树查询)
+        Output: distances, times, numpy array, 与dest_location_ids一一对应
+        '''
+        org_node = self.location_id_to_node_index.get(org_location_id)
+        dest_tree_indexes = [self.location_id_to_tree_index.get(location_id) for location_id in dest_location_ids]
+        if org_node is None or None in dest_tree_indexes:
+            warning_location_ids = self.__get_unwarned_location_ids(org_location_id, dest_location_ids)
+            if warning_location_ids:
+                logger.warning(f"Locations of ({org_location_id}, {warning_location_ids}) are not in the road "
+                               f"network, use the haversine distance")
+            return self.__get_fallback_routes(org_location_id, dest_location_ids)
+
+        tree_times, tree_distances = self.__get_tree(org_node)
+        dest_tree_indexes = np.array(dest_tree_indexes, dtype=int)
+        snap_distances = self.location_id_to_snap_distance.get(org_location_id) + np.array(
+            [self.location_id_to_snap_distance.get(location_id) for location_id in dest_location_ids])
+        distances = tree_distances[dest_tree_indexes] + snap_distances
+        times = tree_times[dest_tree_indexes] + snap_distances * 3600 / Configs.DRIVER_SPEED
+
+        # 同一个地点距离为0, 不连通的地点使用haversine估计
+        same_location = np.array([location_id == org_location_id for location_id in dest_location_ids], dtype=bool)
+        distances[same_location] = 0
+        times[same_location] = 0
+        unreachable = np.isinf(times)
+        if unreachable.any():
+            unreachable_ids = [location_id for location_id, flag in zip(dest_location_ids, unreachable) if flag]
+            warning_location_ids = self.__get_unwarned_location_ids(org_location_id, unreachable_ids)
+            if warning_location_ids:
+                logger.warning(f"{len(warning_location_ids)} locations are unreachable from {org_location_id} "
+                               f"in the road network, use the haversine distance")
+            distances[unreachable], times[unreachable] = self.__get_fallback_routes(org_location_id, unreachable_ids)
+        return distances, times
+
+
+    def __get_unwarned_location_ids(self, org_location_id, dest_location_ids: list):
+        '''
+        还没有警告过的地点对的终点, 每个地点对只警告一次(与Map相同)
+        '''
+        location_ids = [location_id for location_id in dest_location_ids
+                        if (org_location_id, location_id) not in self.__warned_location_id_pairs]
+        self.__warned_location_id_pairs.update((org_location_id, location_id) for location_id in location_ids)
+        return location_ids
+
+
+    def __get_fallback_routes(self, org_location_id, dest_location_ids: list):
+        distances = self.fallback_map.calculate_distances([org_location_id] * len(dest_location_ids),
+                                                          dest_location_ids)
+        return distances, distances * 3600 / self.fallback_map.speed
+
+
+    def get_matrices(self, location_ids: list):
+        '''
+        地点之间的距离矩阵和时间矩阵, 每一行为一次一对多查询
+        '''
+        num_locations = len(location_ids)
+        distance_matrix = np.zeros((num_locations, num_locations))
+        time_matrix = np.zeros((num_locations, num_locations))
+        for index, location_id in enumerate(location_ids):
+            distance_matrix[index], time_matrix[index] = self.calculate_routes_from_location(location_id,
+                                                                                             location_ids)
+        return distance_matrix, time_matrix
+
+
+    def get_cache_stats(self):
+        '''
+        最短路树的命中次数, 未命中次数(需要计算Dijkstra), 命中率和缓存大小
+        '''
+        total = self.tree_hits + self.tree_misses
+        return {"hits": self.tree_hits,
+                "misses": self.tree_misses,
+                "hit_rate": self.tree_hits / total if total > 0 else 0,
+                "size": len(self.__cached_trees),
+                "precomputed": len(self.__precomputed_trees),
+                "max_size": self.tree_cache_size}
@@ -1,6 +1,12 @@
-from asyncio.log import logger
+import functools
 import sys
 
+import numpy as np
+
+from src.configuration.config import Configs
+from src.utils.logging_engine import logger
+from src.utils.tools import haversine_distance
+
 
 class RouteInfo(object):
     def __init__(self, route_id: str, start_location_id: str, end_location_id: str, distance: float, time: float):
@@ -22,6 +28,11 @@ class RouteInfo(object):
 
 
 class Map(object):
+    # 路线数据中没有的地点对, 从fallback_map获取(e.g., LazyMap), 为None时返回sys.maxsize
+    fallback_map = None
+    # 分时段的行驶时间系数(SpeedProfile), 为None时行驶时间与出发时间无关
+    speed_profile = None
+
     def __init__(self, id_to_route):
         '''
         Input:
@@ -32,6 +43,20 @@ class Map(object):
         self.__location_id_pair_to_distance = self.__get_distance_matrix_between_locations()
         # get the time between locations, unit is mins
         self.__location_id_pair_to_time = self.__get_time_matrix_between_locations()
+        # 已经输出过警告的(不在路线数据中的)地点对, 每个地点对只警告一次
+        self.__warned_location_id_pairs = set()
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_Map__warned_location_id_pairs", set())
+
+
+    def __warn_missing_pair(self, org_location_id, dest_location_id, matrix_name: str):
+        if (org_location_id, dest_location_id) in self.__warned_location_id_pairs:
+            return
+        self.__warned_location_id_pairs.add((org_location_id, dest_location_id))
+        logger.warning(f"({org_location_id}, {dest_location_id}) is not in {matrix_name} matrix, use the fallback map.")
 
 
     def __get_distance_matrix_between_locations(self):
@@ -77,6 +102,9 @@ class Map(object):
             return self.__location_id_pair_to_distance.get((org_location_id, dest_location_id))
         elif (dest_location_id, org_location_id) in self.__location_id_pair_to_distance:
             return self.__location_id_pair_to_distance.get((dest_location_id, org_location_id))
+        elif self.fallback_map is not None:
+            self.__warn_missing_pair(org_location_id, dest_location_id, "distance")
+            return self.fallback_map.calculate_distance_between_locations(org_location_id, dest_location_id)
         else:
             logger.error(f"({org_location_id}, {dest_location_id}) is not in distance matrix.")
             return sys.maxsize
@@ -93,6 +121,164 @@ class Map(object):
             return self.__location_id_pair_to_time.get((org_location_id, dest_location_id))
         elif (dest_location_id, org_location_id) in self.__location_id_pair_to_distance:
             return self.__location_id_pair_to_time.get((dest_location_id, org_location_id))
+        elif self.fallback_map is not None:
+            self.__warn_missing_pair(org_location_id, dest_location_id, "time")
+            return self.fallback_map.calculate_time_between_locations(org_location_id, dest_location_id)
         else:
             logger.error(f"({org_location_id}, {dest_location_id}) is not in time matrix.")
-            return sys.maxsize
\ No newline at end of file
+            return sys.maxsize
+
+
+    def calculate_time_between_locations_at(self, org_location_id, dest_location_id, departure_time):
+        '''
+        departure_time出发, 从origin到destination的时间(考虑speed_profile)
+        '''
+        transport_time = self.calculate_time_between_locations(org_location_id, dest_location_id)
+        if self.speed_profile is None or transport_time == sys.maxsize:
+            return transport_time
+        return self.speed_profile.calculate_travel_time(departure_time, transport_time)
+
+
+    def calculate_times_at(self, org_location_ids: list, dest_location_ids: list, departure_times):
+        '''
+        批量计算多个(origin, destination, 出发时间)的时间
+        Output: numpy array, 与输入一一对应
+        '''
+        transport_times = np.array([self.calculate_time_between_locations(org_location_id, dest_location_id)
+                                    for org_location_id, dest_location_id in zip(org_location_ids, dest_location_ids)],
+                                   dtype=float)
+        if self.speed_profile is None:
+            return transport_times
+        return self.speed_profile.calculate_travel_times(departure_times, transport_times)
+
+
+    def get_matrices(self, location_ids: list):
+        '''
+        地点之间的距离矩阵和时间矩阵(与calculate_*_between_locations的结果相同, 优先使用(起点, 终点)方向的路线)
+        Input:
+        - location_ids: 地点id列表, 矩阵的行和列按照该顺序排列
+        Output:
+        - distance_matrix, time_matrix: numpy array (n, n), 没有路线的地点对为np.inf
+        '''
+        location_id_to_index = {location_id: index for index, location_id in enumerate(location_ids)}
+        num_locations = len(location_ids)
+        distance_matrix = np.full((num_locations, num_locations), np.inf)
+        time_matrix = np.full((num_locations, num_locations), np.inf)
+
+        routes = []
+        for (start_location_id, end_location_id), distance in (self.__location_id_pair_to_distance or {}).items():
+            if start_location_id in location_id_to_index and end_location_id in location_id_to_index:
+                routes.append((location_id_to_index.get(start_location_id), location_id_to_index.get(end_location_id),
+                               distance, self.__location_id_pair_to_time.get((start_location_id, end_location_id))))
+        if len(routes) > 0:
+            start_indexes, end_indexes, distances, times = (np.array(values) for values in zip(*routes))
+            # 先填反方向, 再用正方向覆盖
+            distance_matrix[end_indexes, start_indexes] = distances
+            time_matrix[end_indexes, start_indexes] = times
+            distance_matrix[start_indexes, end_indexes] = distances
+            time_matrix[start_indexes, end_indexes] = times
+        np.fill_diagonal(distance_matrix, 0)
+        np.fill_diagonal(time_matrix, 0)
+        return distance_matrix, time_matrix
+
+
+class LazyMap(Map):
+    def __init__(self, id_to_location: dict, speed=None, cache_size=None):
+        '''
+        不读取路线数据, 根据地点坐标按需计算距离(haversine)和时间(距离 / 速度), 适用于地点数量很大的情况
+        常用的地点对缓存在有上限的LRU中
+        Inputs:
+        - id_to_location: {location_id: location object(restaurant or customer)}
+        - speed: km/h, 默认Configs.DRIVER_SPEED
+        - cache_size: LRU缓存的地点对数量, 默认Configs.ROUTE_CACHE_SIZE
+        '''
+        super().__init__({})
+        self.speed = speed or Configs.DRIVER_SPEED
+        self.cache_size = cache_size or Configs.ROUTE_CACHE_SIZE
+        self.location_ids = list(id_to_location.keys())
+        self.location_id_to_index = {location_id: index for index, location_id in enumerate(self.location_ids)}
+        self.lats = np.array([id_to_location.get(location_id).lat for location_id in self.location_ids], dtype=float)
+        self.lngs = np.array([id_to_location.get(location_id).lng for location_id in self.location_ids], dtype=float)
+        self.__init_cache()
+
+
+    def __init_cache(self):
+        # 距离是对称的, key为排序后的地点对
+        self.__cached_distance = functools.lru_cache(maxsize=self.cache_size)(self.__compute_distance)
+
+
+    def __getstate__(self):
+        # lru_cache不能pickle, 恢复后重新创建空缓存
+        state = self.__dict__.copy()
+        state.pop("_LazyMap__cached_distance", None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__init_cache()
+
+
+    def __compute_distance(self, location_1_index: int, location_2_index: int):
+        return float(haversine_distance(self.lats[location_1_index], self.lngs[location_1_index],
+                                        self.lats[location_2_index], self.lngs[location_2_index]))
+
+
+    def calculate_distance_between_locations(self, org_location_id, dest_location_id):
+        '''
+        计算origin和destination的距离
+        '''
+        if org_location_id == dest_location_id:
+            return 0
+
+        org_index = self.location_id_to_index.get(org_location_id)
+        dest_index = self.location_id_to_index.get(dest_location_id)
+        if org_index is None or dest_index is None:
+            logger.error(f"({org_location_id}, {dest_location_id}) is not in the locations.")
+            return sys.maxsize
+        return self.__cached_distance(min(org_index, dest_index), max(org_index, dest_index))
+
+
+    def calculate_time_between_locations(self, org_location_id, dest_location_id):
+        '''
+        计算origin和destination的时间(秒)
+        '''
+        distance = self.calculate_distance_between_locations(org_location_id, dest_location_id)
+        if distance == sys.maxsize:
+            return sys.maxsize
+        return distance * 3600 / self.speed
+
+
+    def calculate_distances(self, org_location_ids: list, dest_location_ids: list):
+        '''
+        批量计算多个(origin, destination)的距离(向量化, 不经过缓存)
+        Output: numpy array, 与输入一一对应
+        '''
+        org_indexes = np.array([self.location_id_to_index[location_id] for location_id in org_location_ids], dtype=int)
+        dest_indexes = np.array([self.location_id_to_index[location_id] for location_id in dest_location_ids], dtype=int)
+        return haversine_distance(self.lats[org_indexes], self.lngs[org_indexes],
+                                  self.lats[dest_indexes], self.lngs[dest_indexes])
+
+
+    def get_matrices(self, location_ids: list):
+        '''
+        地点之间的距离矩阵和时间矩阵(向量化计算)
+        '''
+        indexes = np.array([self.location_id_to_index[location_id] for location_id in location_ids], dtype=int)
+        distance_matrix = haversine_distance(self.lats[indexes][:, None], self.lngs[indexes][:, None],
+                                             self.lats[indexes][None, :], self.lngs[indexes][None, :])
+        np.fill_diagonal(distance_matrix, 0)
+        return distance_matrix, distance_matrix * 3600 / self.speed
+
+
+    def get_cache_stats(self):
+        '''
+        LRU缓存的命中次数, 未命中次数, 命中率和大小
+        '''
+        cache_info = self.__cached_distance.cache_info()
+        total = cache_info.hits + cache_info.misses
+        return {"hits": cache_info.hits,
+                "misses": cache_info.misses,
+                "hit_rate": cache_info.hits / total if total > 0 else 0,
+                "size": cache_info.currsize,
+                "max_size": cache_info.maxsize}
@@ -0,0 +1,76 @@
+import numpy as np
+
+from src.configuration.config import Configs
+
+
+class SpeedProfile(object):
+    def __init__(self, multipliers: list, bucket_seconds: int):
+        '''
+        一天内分时段的行驶时间系数, e.g., 午餐高峰系数1.3表示同样的路线需要1.3倍的时间
+        行驶过程按时段累计进度, 跨越时段时按各时段的速度分段计算, 保证先出发的骑手不会晚到达(FIFO)
+        Inputs:
+        - multipliers: 每个时段的行驶时间系数(> 0), 时段数量 * bucket_seconds = 一天
+        - bucket_seconds: 时段长度(秒)
+        '''
+        self.multipliers = np.asarray(multipliers, dtype=float)
+        self.bucket_seconds = bucket_seconds
+        self.period = Configs.A_DAY_TIME_SECONDS
+        if len(self.multipliers) * bucket_seconds != self.period or (self.multipliers <= 0).any():
+            raise ValueError(f"Invalid speed profile: {len(self.multipliers)} buckets of {bucket_seconds} seconds")
+
+        # 时段边界的累计进度(按自由流时间计), 单调递增, 用于O(log k)的正向和反向插值
+        self.boundary_times = np.arange(len(self.multipliers) + 1) * float(bucket_seconds)
+        self.boundary_progress = np.concatenate([[0], np.cumsum(bucket_seconds / self.multipliers)])
+        self.progress_of_period = self.boundary_progress[-1]
+
+    @classmethod
+    def from_hourly_multipliers(cls, hour_to_multiplier: dict, bucket_minutes=60):
+        '''
+        根据{hour: multiplier}创建, 没有指定的小时系数为1
+        '''
+        bucket_seconds = bucket_minutes * 60
+        bucket_num = Configs.A_DAY_TIME_SECONDS // bucket_seconds
+        multipliers = [hour_to_multiplier.get(bucket * bucket_seconds // 3600, 1) for bucket in range(bucket_num)]
+        return cls(multipliers, bucket_seconds)
+
+    def get_progress(self, timestamps):
+        '''
+        从0点(UTC)开始到timestamps累计的进度
+        '''
+        timestamps = np.asarray(timestamps, dtype=float)
+        days, seconds = np.divmod(timestamps, self.period)
+        return days * self.progress_of_period + np.interp(seconds, self.boundary_times, self.boundary_progress)
+
+    def get_time_of_progress(self, progress):
+        '''
+        get_progress的反函数
+        '''
+        progress = np.asarray(progress, dtype=float)
+        days, left_progress = np.divmod(progress, self.progress_of_period)
+        return days * self.period + np.interp(left_progress, self.boundary_progress, self.boundary_times)
+
+    def calculate_travel_time(self, departure_time, free_flow_time):
+        '''
+        departure_time出发, 自由流时间为free_flow_time的路线的实际行驶时间(秒)
+        '''
+        if free_flow_time <= 0:
+            return free_flow_time
+        return float(self.calculate_travel_times(np.array([departure_time]), np.array([free_flow_time]))[0])
+
+    def calculate_travel_times(self, departure_times, free_flow_times):
+        '''
+        calculate_travel_time的向量化版本
+        '''
+        departure_times = np.asarray(departure_times, dtype=float)
+        free_flow_times = np.asarray(free_flow_times, dtype=float)
+        arrival_times = self.get_time_of_progress(self.get_progress(departure_times) + free_flow_times)
+        return np.where(free_flow_times > 0, arrival_times - departure_times, free_flow_times)
+
+
+def get_speed_profile():
+    '''
+    根据Configs.SPEED_PROFILE创建, 没有配置时返回None(使用静态时间)
+    '''
+    if not Configs.SPEED_PROFILE:
+        return None
+    return SpeedProfile.from_hourly_multipliers(Configs.SPEED_PROFILE, Configs.SPEED_PROFILE_BUCKET_MINUTES)
@@ -7,31 +7,81 @@ class Configs(object):
     # 多目标权重之间的系数
     LAMDA = 10000
 
+    # 模拟时钟的日期(UTC), 与运行的日期和时区无关, 保证结果可以复现和缓存
+    SIMULATION_EPOCH = os.environ.get("FOOD_DELIVERY_SIMULATION_EPOCH", "2021-10-10")
+    # 模拟开始的时间(点)
+    SIMULATION_START_HOUR = 6
+
+    # 缓存编译好的测试例数据(按文件内容哈希)
+    USE_INSTANCE_CACHE = True
+    # 批量实验时把地点坐标和距离/时间矩阵发布到共享内存, 所有模拟器和算法进程只读连接
+    USE_SHARED_STATIC_DATA = False
+    # 缓存模拟结果(按测试例, 参数和算法代码哈希), 算法有随机性时不要开启
+    USE_RESULT_CACHE = False
+
     # Time interval of the algorithm
     ALG_RUN_FREQUENCY = 10  # minute
+
+    # 派单时间的确定方式
+    # fixed: 每ALG_RUN_FREQUENCY分钟派单一次
+    # event: 新订单释放(等待BATCHING_WINDOW), 骑手变为空闲时派单, 没有事件的时间段跳过
+    DISPATCH_MODE = "fixed"
+    BATCHING_WINDOW = 120  # second
+    # event模式下两次派单的最小间隔
+    MIN_DISPATCH_INTERVAL = 60  # second
+    # 派单流水线: "sequential", 依次执行; "async", 算法运行时并行写日志和预先序列化下一个时间片的订单
+    # (只有这两项与算法并行, 历史记录和分数的更新仍然依次执行)
+    PIPELINE_MODE = "sequential"
+    # 订单来源
+    # memory: 初始化时读取测试例的所有订单
+    # stream: 按模拟时间分块读取订单文件(可以包含多天), 完成的订单移出内存
+    # socket, file: 实时接入(shadow mode), 订单发送到INGESTION_ADDRESS(unix socket路径或"host:port")
+    #               或追加写入INGESTION_ADDRESS(jsonl文件), 格式见order_ingestion.py
+    ORDER_SOURCE_MODE = "memory"
+    # stream模式下每次读取的订单行数
+    ORDER_SOURCE_CHUNK_SIZE = 5000
+    # 订单文件没有date列时, 创建时间比上一行小超过该值视为进入下一天, 小于该值视为乱序
+    ORDER_SOURCE_DISORDER_TOLERANCE = 3600  # second
+    # 实时接入的地址, 为空时为Output/ingestion/orders.sock或orders.jsonl
+    INGESTION_ADDRESS = ""
+    # 接收队列的批次数量上限(队列满时不再接收, 发送端阻塞), 每批最多的消息数量
+    INGESTION_QUEUE_SIZE = 1000
+    INGESTION_BATCH_SIZE = 1000
+    # 等待新消息的最长时间, 超过后按已经收到的订单继续模拟
+    INGESTION_IDLE_TIMEOUT = 60  # second
     ORDER_STATUS_TO_CODE = {"INITIALIZATION": 0, "GENERATED": 1, "ONGOING": 2, "COMPLETED": 3}
+    # 骑手状态: 没有目的地, 下一个目的地需要取货, 下一个目的地只送货
+    DRIVER_STATE_TO_CODE = {"IDLE": 0, "TO_PICKUP": 1, "TO_DELIVERY": 2}
 
     # file path
     root_folder_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    benchmark_folder_path = os.path.join(root_folder_path, "Benchmark")
+    # 可以通过环境变量指定其他测试例文件夹(e.g., 生成的大规模测试例), 算法子进程会继承该环境变量
+    benchmark_folder_path = os.environ.get("FOOD_DELIVERY_BENCHMARK_FOLDER", os.path.join(root_folder_path, "Benchmark"))
     src_folder_path = os.path.join(root_folder_path, "src")
     algorithm_folder_path = os.path.join(root_folder_path, "Algorithm")
     output_folder = os.path.join(src_folder_path, "Output")
+    cache_folder = os.path.join(output_folder, "cache")
     # if output folder not exit
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
     
     # route, location data 
     route_info_file = "route_info.csv"
+    # 路网数据(ROUTE_MAP_MODE = "road")
+    road_edge_file = "road_edges.csv"
+    road_node_file = "road_nodes.csv"
     restaurant_info_file = "restaurant_info.csv"
     customer_info_file = "customer_info.csv"
     
     route_info_file_path = os.path.join(benchmark_folder_path, route_info_file)
+    road_edge_file_path = os.path.join(benchmark_folder_path, road_edge_file)
+    road_node_file_path = os.path.join(benchmark_folder_path, road_node_file)
     restaurant_info_file_path = os.path.join(benchmark_folder_path, restaurant_info_file)
     customer_info_file_path = os.path.join(benchmark_folder_path, customer_info_file)
 
-    # algorithm file
-    algorithm_data_interaction_folder_path = os.path.join(algorithm_folder_path, "data_interaction")
+    # algorithm file, 可以通过环境变量指定其他文件夹(e.g., 并行运行多个模拟器时每个模拟器一个文件夹)
+    algorithm_data_interaction_folder_path = os.environ.get("FOOD_DELIVERY_DATA_INTERACTION_FOLDER",
+                                                            os.path.join(algorithm_folder_path, "data_interaction"))
     if not os.path.exists(algorithm_data_interaction_folder_path):
         os.makedirs(algorithm_data_interaction_folder_path)
     algorithm_driver_input_info_path = os.path.join(algorithm_data_interaction_folder_path, "driver_info.json")
@@ -51,21 +101,142 @@ class Configs(object):
                               'out': 'c',
                               }
 
-    # random seed
-    RANDOM_SEED = 0
+    # random seed, 通过环境变量设置(Configs.set_random_seed), 算法子进程(e.g., ALNS)使用同一个种子
+    RANDOM_SEED = int(os.environ.get("FOOD_DELIVERY_RANDOM_SEED", 0))
 
     # limitation of algorithm running time
     MAX_RUNTIME_OF_ALGORITHM = 600
 
+    # 派单算法输出之前按Checker的规则(src/utils/feasibility.py)检查并修复不可行的骑手路线
+    FEASIBILITY_PRECHECK = True
+
+    # 派单算法: greedy, 示例算法(最近骑手); alns, 批量分配和路线的ALNS(Algorithm/alns_dispatcher.py)
+    # 通过环境变量设置, 算法子进程和分支模拟(fork_simulation的environment)可以直接使用
+    DISPATCH_ALGORITHM = os.environ.get("FOOD_DELIVERY_DISPATCH_ALGORITHM", "greedy")
+    # ALNS的时间预算(秒) = min(ALNS_MAX_SECONDS, MAX_RUNTIME_OF_ALGORITHM * ALNS_RUNTIME_RATIO), 包括读取输入的时间
+    ALNS_MAX_SECONDS = 5
+    ALNS_RUNTIME_RATIO = 0.5
+    ALNS_MAX_ITERATIONS = 2000
+    # 每次迭代最多移除的订单数量
+    ALNS_MAX_REMOVAL = 10
+    # 模拟退火初始温度: 以50%的概率接受比当前解差该比例的解
+    ALNS_START_TEMPERATURE_RATIO = 0.01
+
+    # 示例算法的订单合并: 同一餐厅, 顾客之间距离(km)和承诺送达时间之差(秒)不超过阈值的订单合并为一个批次
+    # 每个批次最多BUNDLE_MAX_ORDERS个订单, 1表示不合并
+    BUNDLE_MAX_ORDERS = 3
+    BUNDLE_MAX_CUSTOMER_DISTANCE = 1.5
+    BUNDLE_MAX_DEADLINE_GAP = 900
+    # 只合并地点索引中同一个聚类的顾客(聚类直径不超过BUNDLE_MAX_CUSTOMER_DISTANCE, 候选更少), 否则按距离判断
+    BUNDLE_SHORTLIST_BY_CLUSTER = False
+
+    # 地点索引(src/utils/location_index.py): 每个地点最近的LOCATION_INDEX_K个地点, 0表示不使用索引
+    # 订单合并时k近邻需要包括BUNDLE_MAX_CUSTOMER_DISTANCE内的所有顾客, 否则按坐标计算距离
+    LOCATION_INDEX_K = 160
+    # 每个餐厅配送范围(km)内顾客的层次聚类, 每层聚类的直径上限(km)
+    LOCATION_CLUSTER_RADIUS = 8
+    LOCATION_CLUSTER_LEVELS = [0.5, 1, 2]
+
+    # 示例算法: 先在取货地点k近邻中已经空闲的骑手(DriverIndex.get_drivers_free_near)中选择最近的骑手,
+    # 没有时再检查k近邻中的所有骑手和所有骑手; 需要地点索引(LOCATION_INDEX_K > 0)
+    GREEDY_PREFER_FREE_DRIVERS = False
+
+    # 示例算法: 骑手数量不少于该值时, 用进程池并行求解各骑手的TSP路线
+    PARALLEL_ROUTING_MIN_DRIVERS = 64
+    # 进程数, 0表示os.cpu_count()
+    PARALLEL_ROUTING_WORKERS = 0
+    # 每个进程任务包含的骑手数量
+    PARALLEL_ROUTING_CHUNK_SIZE = 16
+
     # algorithm running success or not
     ALGORITHM_SUCCESS_FLAG = 'SUCCESS'
 
     # maximum number of log files
     MAX_LOG_FILE_NUM = 100
 
+    # 日志在后台线程中写入, 不阻塞模拟过程
+    LOG_ASYNCHRONOUS = True
+    # 每个时间片只输出一条结构化汇总日志, 时间片内的详细日志降为debug
+    LOG_TICK_SUMMARY = False
+
+    # 每N个时间片保存一次模拟状态的检查点到 Output/checkpoint/{instance}, 0表示不保存
+    CHECKPOINT_INTERVAL_TICKS = 0
+
+    # 记录每个时间片的派单结果到 Output/recording/{instance}.jsonl, 可以用replay_simulation回放(不调用派单算法)
+    RECORD_DISPATCH_RESULT = False
+
+    # 每次模拟结束后输出服务水平指标(src/utils/metrics.py)到 Output/metrics, 按METRICS_BUCKET_SECONDS分组
+    SAVE_METRICS_REPORT = False
+    METRICS_BUCKET_SECONDS = 3600
+
+    # 每次模拟结束后输出各环节耗时报告(csv/json)到 Output/profile
+    SAVE_PROFILE_REPORT = False
+    # 每个时间片开启cProfile(输出.prof文件)
+    PROFILE_CPROFILE = False
+    # 每个时间片记录tracemalloc内存峰值
+    PROFILE_TRACEMALLOC = False
+
     # total seconds in a day
     A_DAY_TIME_SECONDS = 24 * 60 * 60
 
+    # 骑手平均速度, km/h (路线时间 = 距离 / 速度)
+    DRIVER_SPEED = 30
+
+    # 地图模式
+    # matrix: 从route_info.csv读取所有地点对的距离和时间
+    # lazy: 不读取路线数据, 按需根据坐标计算距离和时间(距离 / DRIVER_SPEED), 适用于地点数量很大的情况
+    # road: 读取路网(road_edges.csv, road_nodes.csv), 地点之间的时间和距离为路网上的最短路
+    ROUTE_MAP_MODE = "matrix"
+    # lazy模式下LRU缓存的地点对数量
+    ROUTE_CACHE_SIZE = 100000
+    # road模式下按需计算的最短路树的数量(餐厅出发的最短路树预先计算), 每棵树只保存到地点的时间和距离(16 bytes * 地点数量)
+    ROAD_TREE_CACHE_SIZE = 2000
+    # 分时段的行驶时间系数{hour: multiplier}, 没有指定的小时为1, e.g., {11: 1.3, 12: 1.4, 18: 1.3}
+    # 为空时行驶时间与出发时间无关
+    SPEED_PROFILE = {}
+    SPEED_PROFILE_BUCKET_MINUTES = 60
+    # matrix模式下路线数据中没有的地点对用haversine距离估计(每个地点对警告一次), 默认返回sys.maxsize
+    ROUTE_FALLBACK_TO_HAVERSINE = False
+
+    # benchmark: 指标变差超过该比例时报警
+    BENCHMARK_REGRESSION_TOLERANCE = 0.2
+
     # dataset choice, if empty means all dataset, e.g., []，[1], [1, 2, 3], [64]
     selected_instances = [3]
-    all_test_instances = range(1, 65)
\ No newline at end of file
+    all_test_instances = range(1, 65)
+
+    @staticmethod
+    def set_benchmark_folder(folder_path: str):
+        '''
+        切换测试例文件夹(地点和路线数据), 同时设置环境变量, 使算法子进程读取同一份数据
+        '''
+        os.environ["FOOD_DELIVERY_BENCHMARK_FOLDER"] = folder_path
+        Configs.benchmark_folder_path = folder_path
+        Configs.route_info_file_path = os.path.join(folder_path, Configs.route_info_file)
+        Configs.road_edge_file_path = os.path.join(folder_path, Configs.road_edge_file)
+        Configs.road_node_file_path = os.path.join(folder_path, Configs.road_node_file)
+        Configs.restaurant_info_file_path = os.path.join(folder_path, Configs.restaurant_info_file)
+        Configs.customer_info_file_path = os.path.join(folder_path, Configs.customer_info_file)
+
+    @staticmethod
+    def set_random_seed(seed: int):
+        '''
+        设置随机种子, 同时设置环境变量, 使算法子进程使用同一个种子
+        '''
+        os.environ["FOOD_DELIVERY_RANDOM_SEED"] = str(seed)
+        Configs.RANDOM_SEED = seed
+
+    @staticmethod
+    def set_data_interaction_folder(folder_path: str):
+        '''
+        切换模拟器和算法交互的json文件夹, 同时设置环境变量, 使算法子进程读写同一个文件夹
+        '''
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+        os.environ["FOOD_DELIVERY_DATA_INTERACTION_FOLDER"] = folder_path
+        Configs.algorithm_data_interaction_folder_path = folder_path
+        Configs.algorithm_driver_input_info_path = os.path.join(folder_path, "driver_info.json")
+        Configs.algorithm_unallocated_orders_input_path = os.path.join(folder_path, "unallocated_orders.json")
+        Configs.algorithm_ongoing_orders_input_path = os.path.join(folder_path, "ongoing_orders.json")
+        Configs.algorithm_output_destination_path = os.path.join(folder_path, "output_destination.json")
+        Configs.algorithm_output_planned_route_path = os.path.join(folder_path, "output_route.json")
@@ -0,0 +1,139 @@
+import datetime
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from src.configuration.config import Configs
+from src.utils.logging_engine import logger
+
+
+'''
+what-if对比: 从同一个模拟状态(e.g., 中午的检查点)分出多个分支, 每个分支使用不同的派单算法在独立进程中继续模拟, 输出各分支的分数
+状态只序列化一次(SimulateEnvironment.dumps_state, 不包括地图和地点信息), 所有分支共用同一份bytes, 不需要deepcopy整个对象图
+e.g., fork_simulation(load_simulation(checkpoint, ...), [{"name": "baseline"},
+                                                           {"name": "greedy", "command": "python main_algorithm_greedy.py"}],
+                      "Instance_3")
+'''
+
+
+@contextmanager
+def branch_settings(branch: dict, fork_folder: str):
+    '''
+    在当前进程中应用分支的Configs属性和环境变量, 结束时(包括异常)恢复
+    进程池的一个进程会依次运行多个分支, 不恢复时后面的分支会继承前一个分支的设置(e.g., 派单算法)
+    '''
+    configs = {name: value for name, value in vars(Configs).items() if not name.startswith("__")}
+    environment = dict(os.environ)
+    try:
+        for name, value in branch.get("configs", {}).items():
+            setattr(Configs, name, value)
+        Configs.SAVE_PROFILE_REPORT = False
+        Configs.CHECKPOINT_INTERVAL_TICKS = 0
+        Configs.set_data_interaction_folder(os.path.join(fork_folder, "data_interaction", branch.get("name")))
+        # 算法子进程继承当前进程的环境变量
+        os.environ.update({name: str(value) for name, value in branch.get("environment", {}).items()})
+        yield
+    finally:
+        for name in [name for name in vars(Configs) if not name.startswith("__") and name not in configs]:
+            delattr(Configs, name)
+        for name, value in configs.items():
+            if vars(Configs).get(name) is not value:
+                setattr(Configs, name, value)
+        os.environ.clear()
+        os.environ.update(environment)
+
+
+def run_branch(branch: dict, state: bytes, instance: str, fork_folder: str):
+    '''
+    在独立进程中运行一个分支, 每个分支使用独立的数据交互文件夹
+    Inputs:
+    - branch: 分支的参数
+        - name: 分支名称
+        - command: 可选, 调用算法的命令, 默认为main_algorithm入口文件
+        - environment: 可选, {name: value}, 算法子进程的环境变量
+        - configs: 可选, {name: value}, 分支进程中Configs的属性(模拟器侧, e.g., LAMDA, MAX_RUNTIME_OF_ALGORITHM)
+    - state: SimulateEnvironment.dumps_state的输出
+    Output:
+    - 分支的分数和运行状态
+    '''
+    from src.simulator.simulator_api import run_simulation_from_state
+
+    result = {"branch": branch.get("name"), "command": branch.get("command", ""), "score": None,
+              "status": "success", "seconds": 0}
+    start_time = time.perf_counter()
+    with branch_settings(branch, fork_folder):
+        try:
+            simulate_env = run_simulation_from_state(state, Configs.customer_info_file, Configs.restaurant_info_file,
+                                                     Configs.route_info_file, instance, branch.get("command", ""))
+            if simulate_env.total_score == sys.maxsize:
+                result["status"] = "infeasible dispatch"
+            else:
+                result["score"] = simulate_env.total_score
+        except SystemExit as exception:
+            result["status"] = f"simulator terminated ({exception.code})"
+        except Exception as exception:
+            result["status"] = f"error: {exception}"
+    result["seconds"] = time.perf_counter() - start_time
+    return result
+
+
+def fork_simulation(simulate_env, branches: list, instance: str, worker_num=0, fork_name=""):
+    '''
+    从simulate_env的当前状态分出多个分支并行模拟, 输出到 Output/fork/{fork_name}/branches.csv
+    simulate_env本身不会改变, 可以继续运行或再次分支
+    Inputs:
+    - simulate_env: SimulateEnvironment, e.g., simulator_api.load_simulation的输出
+    - branches: 分支参数列表, 见run_branch
+    - instance: 测试例文件夹名称, 用于加载静态数据
+    - worker_num: 进程数, 0表示min(os.cpu_count(), 分支数量)
+    - fork_name: 名称, 默认为当前时间
+    Output:
+    - DataFrame, 每个分支一行, 按分数排序, gap为与最好分支的差距
+    '''
+    from src.utils.shared_data import SHARED_DATA_ENV_NAME, publish_static_data
+
+    names = [branch.get("name") for branch in branches]
+    if len(set(names)) != len(names) or None in names:
+        raise ValueError(f"Branch names must be unique and not empty: {names}")
+
+    fork_name = fork_name or datetime.datetime.now().strftime('%y%m%d%H%M%S')
+    fork_folder = os.path.join(Configs.output_folder, "fork", fork_name)
+    if not os.path.exists(fork_folder):
+        os.makedirs(fork_folder)
+
+    with simulate_env.profiler.timer("fork"):
+        state = simulate_env.dumps_state()
+    logger.info(f"Fork {len(branches)} branches at tick {simulate_env.tick_index}, state size: "
+                f"{len(state) / 1024:.1f} KB, output folder: {fork_folder}")
+
+    # 地图发布到共享内存, 分支进程不需要重新加载
+    shared_data = None
+    if Configs.USE_SHARED_STATIC_DATA and SHARED_DATA_ENV_NAME not in os.environ:
+        shared_data = publish_static_data(simulate_env.id_to_location, simulate_env.route_map)
+
+    try:
+        # spawn: 子进程重新初始化日志线程, 避免fork时复制正在运行的日志线程
+        worker_num = min(worker_num or os.cpu_count() or 1, len(branches))
+        context = multiprocessing.get_context("spawn")
+        results = []
+        with context.Pool(worker_num) as pool:
+            async_results = [pool.apply_async(run_branch, (branch, state, instance, fork_folder))
+                             for branch in branches]
+            for async_result in async_results:
+                result = async_result.get()
+                results.append(result)
+                logger.info(f"Branch {result['branch']}: score {result['score']}, {result['status']}")
+    finally:
+        if shared_data is not None:
+            os.environ.pop(SHARED_DATA_ENV_NAME, None)
+            shared_data.close()
+
+    branches_df = pd.DataFrame(results).sort_values("score", na_position="last").reset_index(drop=True)
+    branches_df["gap"] = branches_df["score"] - branches_df["score"].min()
+    branches_df.to_csv(os.path.join(fork_folder, "branches.csv"), index=False)
+    logger.info(f"Write the branch results to {fork_folder}")
+    return branches_df
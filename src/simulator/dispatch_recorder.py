@@ -0,0 +1,140 @@
+import json
+import os
+import sys
+
+from src.common.dispatch_result import DispatchResult
+from src.common.node import Node
+from src.utils.logging_engine import logger
+from src.utils.time_utils import timestamp_to_datetime
+
+
+'''
+派单结果的记录和回放
+记录: 每个时间片一行json(jsonl), 只保存有目的地或计划路线的骑手, 每个节点为
+      [location_id, pickup_order_ids, delivery_order_ids, arrive_time, leave_time]
+回放: 按记录的派单结果和算法运行时间重新模拟, 不调用派单算法; 修改Evaluator或LAMDA之后重新计算分数只需要几秒
+第一行为头部信息(模拟开始时间, 时间片长度, 骑手数量), 回放时校验
+'''
+
+
+class DispatchRecorder(object):
+    def __init__(self, file_path: str, initial_time: int, time_interval: int, driver_num: int):
+        '''
+        Inputs:
+        - file_path: 记录文件(.jsonl), 已经存在时覆盖
+        - initial_time, time_interval, driver_num: 模拟器的开始时间, 时间片长度和骑手数量
+        '''
+        self.file_path = file_path
+        folder = os.path.dirname(file_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.__fd = open(file_path, "w")
+        self.__write_line({"initial_time": initial_time, "time_interval": time_interval, "driver_num": driver_num})
+        self.tick_num = 0
+
+
+    def record(self, cur_time: int, used_seconds: float, dispatch_result: DispatchResult):
+        '''
+        记录一个时间片的派单结果(通过校验之后)
+        '''
+        driver_id_to_nodes = {}
+        for driver_id, destination in dispatch_result.driver_id_to_destination.items():
+            planned_route = dispatch_result.driver_id_to_planned_route.get(driver_id) or []
+            if destination is None and len(planned_route) == 0:
+                continue
+            driver_id_to_nodes[driver_id] = [DispatchRecorder.__convert_node_to_list(destination),
+                                             [DispatchRecorder.__convert_node_to_list(node) for node in planned_route]]
+        self.__write_line({"time": cur_time, "used_seconds": used_seconds, "drivers": driver_id_to_nodes})
+        self.tick_num += 1
+
+
+    def close(self):
+        if not self.__fd.closed:
+            self.__fd.close()
+            logger.info(f"Record {self.tick_num} dispatch results to {self.file_path}")
+
+
+    def __write_line(self, data: dict):
+        self.__fd.write(json.dumps(data, separators=(",", ":")))
+        self.__fd.write("\n")
+
+
+    @staticmethod
+    def __convert_node_to_list(node):
+        if node is None:
+            return None
+        return [node.id, [order.id for order in node.pickup_orders], [order.id for order in node.delivery_orders],
+                node.arrive_time, node.leave_time]
+
+
+class DispatchReplayer(object):
+    def __init__(self, file_path: str):
+        '''
+        读取DispatchRecorder的记录文件
+        '''
+        self.file_path = file_path
+        with open(file_path, "r") as fd:
+            lines = [json.loads(line) for line in fd if line.strip()]
+        if len(lines) == 0:
+            logger.error(f"The dispatch record {file_path} is empty")
+            sys.exit(-1)
+        self.initial_time = lines[0].get("initial_time")
+        self.time_interval = lines[0].get("time_interval")
+        self.driver_num = lines[0].get("driver_num")
+        self.ticks = lines[1:]
+        self.tick_index = 0
+
+
+    def check_simulation(self, initial_time: int, time_interval: int, driver_num: int):
+        '''
+        记录的模拟开始时间, 时间片长度和骑手数量必须与当前模拟器相同
+        '''
+        if (self.initial_time, self.time_interval, self.driver_num) != (initial_time, time_interval, driver_num):
+            logger.error(f"The dispatch record {self.file_path} starts at "
+                         f"{timestamp_to_datetime(self.initial_time)} with time interval {self.time_interval} "
+                         f"and {self.driver_num} drivers, however the simulator starts at "
+                         f"{timestamp_to_datetime(initial_time)} with time interval {time_interval} "
+                         f"and {driver_num} drivers")
+            sys.exit(-1)
+
+
+    def is_exhausted(self):
+        return self.tick_index >= len(self.ticks)
+
+
+    def replay(self, cur_time: int, id_to_driver: dict, id_to_order: dict, id_to_location: dict):
+        '''
+        回放下一个时间片的派单结果, 记录的时间必须与当前时间相同
+        Output: (used_seconds, DispatchResult)
+        '''
+        if self.is_exhausted():
+            logger.error(f"{timestamp_to_datetime(cur_time)}, no dispatch result left in {self.file_path}")
+            sys.exit(-1)
+        tick = self.ticks[self.tick_index]
+        if tick.get("time") != cur_time:
+            logger.error(f"Dispatch record {self.tick_index} is at {timestamp_to_datetime(tick.get('time'))}, "
+                         f"however the current time is {timestamp_to_datetime(cur_time)}")
+            sys.exit(-1)
+        self.tick_index += 1
+
+        driver_id_to_destination = {}
+        driver_id_to_planned_route = {}
+        driver_id_to_nodes = tick.get("drivers")
+        for driver_id in id_to_driver:
+            destination, planned_route = driver_id_to_nodes.get(driver_id, (None, []))
+            driver_id_to_destination[driver_id] = DispatchReplayer.__convert_list_to_node(destination, id_to_order,
+                                                                                         id_to_location)
+            driver_id_to_planned_route[driver_id] = [
+                DispatchReplayer.__convert_list_to_node(node, id_to_order, id_to_location) for node in planned_route]
+        return tick.get("used_seconds"), DispatchResult(driver_id_to_destination, driver_id_to_planned_route)
+
+
+    @staticmethod
+    def __convert_list_to_node(node, id_to_order: dict, id_to_location: dict):
+        if node is None:
+            return None
+        location_id, pickup_order_ids, delivery_order_ids, arrive_time, leave_time = node
+        location = id_to_location.get(location_id)
+        return Node(location_id, location.lat, location.lng,
+                    [id_to_order.get(order_id) for order_id in pickup_order_ids],
+                    [id_to_order.get(order_id) for order_id in delivery_order_ids], arrive_time, leave_time)
@@ -1,8 +1,8 @@
-import datetime
 import simpy
 import haversine as hs
 from geographiclib.geodesic import Geodesic
 from src.utils.logging_engine import logger
+from src.utils.time_utils import timestamp_to_datetime
 
 
 class DriverSimulator(object):
@@ -21,6 +21,10 @@ class DriverSimulator(object):
         self.driver_id_to_destination = {}
         self.driver_id_to_cur_position_info = {}
         self.driver_id_to_carrying_orders = {}
+
+        # 上一次run的统计: 有目的地(移动)的骑手, 模拟访问的节点数
+        self.moved_driver_ids = []
+        self.visited_node_num = 0
     
 
     def run(self, id_to_driver: dict, from_time: int):
@@ -32,6 +36,8 @@ class DriverSimulator(object):
         """
         # initialize the simulation environment
         self.env = simpy.rt.RealtimeEnvironment(initial_time=from_time, factor=0.000000000001, strict=False)
+        self.moved_driver_ids = []
+        self.visited_node_num = 0
 
         # sort_drivers by leave time in their locations
         sorted_drivers = self.__sort_drivers(id_to_driver, from_time)
@@ -65,11 +71,13 @@ class DriverSimulator(object):
             if len(cur_location_id) == 0:
                 logger.error(f"Driver {driver.id}: both the current location and the destination are None!!!")
             return
+        self.moved_driver_ids.append(driver.id)
         
         # 在当前地点，且有下一个目的地
         if len(cur_location_id) > 0:
             next_location_id = driver.destination.id
-            transport_time = self.route_map.calculate_time_between_locations(cur_location_id, next_location_id)
+            transport_time = self.route_map.calculate_time_between_locations_at(cur_location_id, next_location_id,
+                                                                                self.env.now)
             yield self.env.timeout(transport_time)
         else:
             # 不在当前地点，正在前往下一个目的地的路上
@@ -79,8 +87,8 @@ class DriverSimulator(object):
             else:
                 # bug，汇报bug
                 logger.error(f"Driver {driver.id} is driving toward the destination, "
-                                f"however current time {datetime.datetime.fromtimestamp(self.env.now)} is greater than "
-                                f"the arrival time {datetime.datetime.fromtimestamp(arr_time)} of destination!!!")
+                                f"however current time {timestamp_to_datetime(self.env.now)} is greater than "
+                                f"the arrival time {timestamp_to_datetime(arr_time)} of destination!!!")
 
         # 到达了下一个目的地，更新时间
         driver.destination.arrive_time = self.env.now
@@ -90,13 +98,15 @@ class DriverSimulator(object):
 
         # 离开目的地
         driver.destination.leave_time = self.env.now
+        self.visited_node_num += 1
 
         # 前往剩下的地点(执行planned route中所有的订单)
         for node in driver.planned_route:
             next_location_id = node.id
 
-            # calculate travel time
-            transport_time = self.route_map.calculate_time_between_locations(cur_location_id, next_location_id)
+            # calculate travel time (出发时间为当前时间)
+            transport_time = self.route_map.calculate_time_between_locations_at(cur_location_id, next_location_id,
+                                                                                self.env.now)
             yield self.env.timeout(transport_time)
 
             # calculate service time
@@ -109,6 +119,7 @@ class DriverSimulator(object):
             node.arrive_time = arr_time
             node.leave_time = leave_time
             cur_location_id = next_location_id
+            self.visited_node_num += 1
     
 
     @staticmethod
@@ -0,0 +1,214 @@
+import datetime
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.configuration.config import Configs
+from src.utils.logging_engine import logger
+
+
+'''
+批量实验: 在(测试例, 随机种子, 骑手数量, 派单频率, LAMDA)的参数网格上并行运行模拟器, 输出分数的分布和置信区间
+e.g., run_experiments(["Instance_3"], seeds=range(10), fleet_sizes=[None, 20], lamdas=[10000])
+'''
+
+# 每组参数的分数汇总时, 区分不同参数组合的列(随机种子不在其中)
+GROUP_COLUMNS = ["instance", "driver_num", "alg_run_frequency", "lamda"]
+
+# 置信区间的置信水平
+CONFIDENCE_LEVEL = 0.95
+
+
+def get_t_critical_value(degrees_of_freedom: int, confidence=CONFIDENCE_LEVEL):
+    '''
+    Student t分布的双侧临界值t, P(|T| < t) = confidence, 用于少量样本的均值置信区间
+    (不依赖scipy, 用整数自由度的闭式P(|T| < t)二分查找, 精度1e-9)
+    '''
+    lower, upper = 0.0, 1.0
+    while __get_t_central_probability(upper, degrees_of_freedom) < confidence:
+        lower, upper = upper, upper * 2
+    while upper - lower > 1e-9:
+        middle = (lower + upper) / 2
+        if __get_t_central_probability(middle, degrees_of_freedom) < confidence:
+            lower = middle
+        else:
+            upper = middle
+    return (lower + upper) / 2
+
+
+def __get_t_central_probability(t: float, degrees_of_freedom: int):
+    '''
+    P(|T| < t), T为自由度degrees_of_freedom(正整数)的t分布, Abramowitz and Stegun 26.7.3/26.7.4
+    '''
+    theta = np.arctan(t / np.sqrt(degrees_of_freedom))
+    cos_square = np.cos(theta) ** 2
+    if degrees_of_freedom % 2 == 0:
+        # sin(theta) * (1 + 1/2 cos^2 + 1*3/(2*4) cos^4 + ... )
+        term, total = 1.0, 1.0
+        for k in range(2, degrees_of_freedom, 2):
+            term *= (k - 1) / k * cos_square
+            total += term
+        return np.sin(theta) * total
+    # 2/pi * (theta + sin(theta) * (cos + 2/3 cos^3 + ... ))
+    if degrees_of_freedom == 1:
+        return 2 / np.pi * theta
+    term = np.cos(theta)
+    total = term
+    for k in range(3, degrees_of_freedom, 2):
+        term *= (k - 1) / k * cos_square
+        total += term
+    return 2 / np.pi * (theta + np.sin(theta) * total)
+
+
+def get_experiment_cases(instances: list, seeds=(0,), fleet_sizes=(None,), alg_run_frequencies=None, lamdas=None):
+    '''
+    参数网格中的所有实验
+    Inputs:
+    - instances: 测试例文件夹名称列表, e.g., ["Instance_3"]
+    - seeds: 随机种子列表(Configs.RANDOM_SEED, 决定骑手的初始位置)
+    - fleet_sizes: 骑手数量列表, None表示使用测试例中的所有骑手
+    - alg_run_frequencies: 派单频率列表(分钟), 默认Configs.ALG_RUN_FREQUENCY
+    - lamdas: 超时惩罚系数列表, 默认Configs.LAMDA
+    Output:
+    - 每个元素为一个实验的参数dict
+    '''
+    alg_run_frequencies = alg_run_frequencies or [Configs.ALG_RUN_FREQUENCY]
+    lamdas = lamdas or [Configs.LAMDA]
+    cases = []
+    for instance, driver_num, alg_run_frequency, lamda, seed in itertools.product(
+            instances, fleet_sizes, alg_run_frequencies, lamdas, seeds):
+        cases.append({"case_id": len(cases),
+                      "instance": instance,
+                      "seed": seed,
+                      "driver_num": driver_num,
+                      "alg_run_frequency": alg_run_frequency,
+                      "lamda": lamda})
+    return cases
+
+
+def run_experiment_case(case: dict, experiment_folder: str):
+    '''
+    在独立进程中运行一个实验, 每个实验使用独立的数据交互文件夹, 互不影响
+    模拟失败(包括sys.exit)时分数为None, 并记录失败原因
+    '''
+    from src.simulator.simulator_api import run_simulation
+
+    Configs.set_random_seed(case.get("seed"))
+    Configs.ALG_RUN_FREQUENCY = case.get("alg_run_frequency")
+    Configs.LAMDA = case.get("lamda")
+    Configs.SAVE_PROFILE_REPORT = False
+    Configs.set_data_interaction_folder(os.path.join(experiment_folder, "data_interaction", f"case_{case['case_id']}"))
+
+    result = {**case, "score": None, "status": "success", "seconds": 0}
+    start_time = time.perf_counter()
+    try:
+        simulate_env = run_simulation(Configs.customer_info_file, Configs.restaurant_info_file,
+                                      Configs.route_info_file, case.get("instance"), case.get("driver_num"))
+        if simulate_env is None or simulate_env.total_score == sys.maxsize:
+            result["status"] = "failed to initialize or infeasible dispatch"
+        else:
+            result["score"] = simulate_env.total_score
+    except SystemExit as exception:
+        result["status"] = f"simulator terminated ({exception.code})"
+    except Exception as exception:
+        result["status"] = f"error: {exception}"
+    result["seconds"] = time.perf_counter() - start_time
+    return result
+
+
+def summarize_results(results_df: pd.DataFrame):
+    '''
+    按参数组合(不含随机种子)汇总分数: 运行次数, 成功次数, 均值, 标准差, 95%置信区间(t分布), 最小值, 最大值
+    '''
+    rows = []
+    group_df = results_df.copy()
+    # None不能作为groupby的key
+    group_df["driver_num"] = group_df["driver_num"].fillna(-1)
+    for keys, df in group_df.groupby(GROUP_COLUMNS, sort=False):
+        scores = df["score"].dropna().to_numpy(dtype=float)
+        mean = scores.mean() if len(scores) > 0 else np.nan
+        std = scores.std(ddof=1) if len(scores) > 1 else 0.0
+        # t分布(自由度n - 1)的置信区间, 只有一次成功运行时没有置信区间
+        half_width = get_t_critical_value(len(scores) - 1) * std / np.sqrt(len(scores)) \
+            if len(scores) > 1 else np.nan
+        row = dict(zip(GROUP_COLUMNS, keys))
+        row["driver_num"] = None if row["driver_num"] == -1 else row["driver_num"]
+        row.update({"runs": len(df),
+                    "successful_runs": len(scores),
+                    "mean_score": mean,
+                    "std_score": std,
+                    "ci95_low": mean - half_width,
+                    "ci95_high": mean + half_width,
+                    "min_score": scores.min() if len(scores) > 0 else np.nan,
+                    "max_score": scores.max() if len(scores) > 0 else np.nan})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def run_experiments(instances: list, seeds=(0,), fleet_sizes=(None,), alg_run_frequencies=None, lamdas=None,
+                    worker_num=0, experiment_name=""):
+    '''
+    并行运行参数网格中的所有实验, 输出到 Output/experiment/{experiment_name}/
+    - runs.csv: 每个实验一行
+    - summary.csv: 每组参数一行(均值, 标准差, 95%置信区间)
+    Inputs: 参数网格见get_experiment_cases
+    - worker_num: 进程数, 0表示os.cpu_count()
+    - experiment_name: 实验名称, 默认为当前时间
+    Output:
+    - (runs DataFrame, summary DataFrame)
+    '''
+    from src.simulator.simulator_api import prepare_instance_data
+    from src.utils.input_utils import get_customer_info, get_restaurant_info, get_route_map
+    from src.common.route import Map
+    from src.utils.shared_data import SHARED_DATA_ENV_NAME, SharedMap, publish_static_data
+
+    experiment_name = experiment_name or datetime.datetime.now().strftime('%y%m%d%H%M%S')
+    experiment_folder = os.path.join(Configs.output_folder, "experiment", experiment_name)
+    if not os.path.exists(experiment_folder):
+        os.makedirs(experiment_folder)
+
+    cases = get_experiment_cases(instances, seeds, fleet_sizes, alg_run_frequencies, lamdas)
+    logger.info(f"Start {len(cases)} experiments, output folder: {experiment_folder}")
+
+    # 地点坐标和地图只加载一次, 发布到共享内存, 子进程通过环境变量连接
+    shared_data = None
+    if Configs.USE_SHARED_STATIC_DATA:
+        id_to_location = {**get_customer_info(Configs.customer_info_file_path),
+                          **get_restaurant_info(Configs.restaurant_info_file_path)}
+        shared_data = publish_static_data(id_to_location, Map(get_route_map(Configs.route_info_file_path)))
+
+    try:
+        # 每个测试例只编译一次, 所有进程读取同一个快照
+        if Configs.USE_INSTANCE_CACHE:
+            for instance in instances:
+                prepare_instance_data(Configs.customer_info_file, Configs.restaurant_info_file,
+                                      Configs.route_info_file, instance,
+                                      SharedMap(shared_data) if shared_data is not None else None)
+
+        # spawn: 子进程重新初始化日志线程, 避免fork时复制正在运行的日志线程
+        worker_num = min(worker_num or os.cpu_count() or 1, len(cases))
+        context = multiprocessing.get_context("spawn")
+        results = []
+        with context.Pool(worker_num) as pool:
+            async_results = [pool.apply_async(run_experiment_case, (case, experiment_folder)) for case in cases]
+            for async_result in async_results:
+                result = async_result.get()
+                results.append(result)
+                logger.info(f"Experiment {result['case_id']} ({result['instance']}, seed {result['seed']}, "
+                            f"driver num {result['driver_num']}): score {result['score']}, {result['status']}")
+    finally:
+        if shared_data is not None:
+            os.environ.pop(SHARED_DATA_ENV_NAME, None)
+            shared_data.close()
+
+    runs_df = pd.DataFrame(results)
+    summary_df = summarize_results(runs_df)
+    runs_df.to_csv(os.path.join(experiment_folder, "runs.csv"), index=False)
+    summary_df.to_csv(os.path.join(experiment_folder, "summary.csv"), index=False)
+    logger.info(f"Write the experiment results to {experiment_folder}")
+    return runs_df, summary_df
@@ -14,20 +14,26 @@ class History(object):
         self.__order_id_to_status_list = {}
 
 
-    def add_driver_position_history(self, driver_id:str, update_time:int, curr_location_id:str):
+    def add_driver_position_history(self, driver_id:str, update_time:int, curr_location_id:str, arrive_time=None,
+                                    service_time=None):
         '''
         在update_time时刻, 更新骑手信息, 加入现在所在地点信息
         Inputs:
         driver_id: id of driver
-        update_time: information update time
+        update_time: information update time (leave time of the location)
         curr_location_id: current driver stop location
+        arrive_time: arrive time of the location, default update_time
+        service_time: service time of the location, None if unknown (e.g., the current location of the driver)
         '''
         if driver_id not in self.__driver_id_to_node_list:
             self.__driver_id_to_node_list[driver_id] = []
         
         if len(curr_location_id)> 0:
             self.__driver_id_to_node_list[driver_id].append({"location_id": curr_location_id,
-                                                             "update time": update_time})
+                                                             "update time": update_time,
+                                                             "arrive_time": update_time if arrive_time is None
+                                                             else arrive_time,
+                                                             "service_time": service_time})
 
 
     def add_order_status_history(self, order_state:int ,update_time:int, committed_completion_time, order_id:str):
@@ -79,20 +85,25 @@ class History(object):
                 if driver.leave_time_at_current_location <= to_time:
                     self.add_driver_position_history(driver_id, 
                                                      driver.leave_time_at_current_location, 
-                                                     driver.current_location_id)
+                                                     driver.current_location_id,
+                                                     driver.arrive_time_at_current_location)
 
             # if driver is running to next destination
             if driver.destination is not None:
                 if driver.destination.leave_time <= to_time:
                     self.add_driver_position_history(driver.id, 
                                                      driver.destination.leave_time,
-                                                     driver.destination.id)
+                                                     driver.destination.id,
+                                                     driver.destination.arrive_time,
+                                                     driver.destination.service_time)
             
             for node in driver.planned_route:
                 if node.leave_time <= to_time:
                     self.add_driver_position_history(driver.id, 
                                                      node.leave_time,
-                                                     node.id)
+                                                     node.id,
+                                                     node.arrive_time,
+                                                     node.service_time)
     
     def add_history_of_orders(self, id_to_driver:dict, to_time=0):
         '''
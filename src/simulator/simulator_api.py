@@ -1,21 +1,31 @@
+import asyncio
 import datetime
+import json
 import os
 import random
-import time
 import traceback
 
 from src.configuration.config import Configs
+from src.common.speed_profile import get_speed_profile
+from src.simulator.dispatch_recorder import DispatchRecorder, DispatchReplayer
 from src.simulator.simulator_env import SimulateEnvironment
-from src.utils.input_utils import get_initial_data
+from src.utils.input_utils import get_initial_data, get_initial_data_with_cache, get_content_digest, \
+    get_source_file_paths
+from src.utils.location_index import get_location_index
 from src.utils.logging_engine import logger
+from src.utils.metrics import export_service_metrics
+from src.utils.order_ingestion import LiveOrderSource
+from src.utils.order_source import get_order_source
+from src.utils.shared_data import SharedMap, attach_shared_static_data
+from src.utils.time_utils import get_initial_time, timestamp_to_datetime
 
 
-def __initialize(customer_info_file_name: str, restaurant_info_file_name:str, route_info_file_name: str, instance_folder: str):
+def __get_instance_file_paths(customer_info_file_name: str, restaurant_info_file_name:str, route_info_file_name: str,
+                              instance_folder: str):
     '''
-    初始化模拟器
-    location_info_file_name: 地点数据文件名, 包括餐厅和顾客地点
-    route_info_file_name: 地图路线数据文件名
-    instance_folder: 测试例对应的文件夹
+    获取测试例所有文件的绝对路径
+    Output: data_file_path, driver_info_file_path, route_info_file_path, customer_location_info_file_path,
+            restaurant_location_info_file_path
     '''
     # 获取文件绝对路径
     route_info_file_path = os.path.join(Configs.benchmark_folder_path, route_info_file_name)
@@ -34,33 +44,88 @@ def __initialize(customer_info_file_name: str, restaurant_info_file_name:str, ro
             driver_info_file_path = os.path.join(instance_folder_path, file_name)
         else:
             data_file_path = os.path.join(instance_folder_path, file_name)
+
+    return (data_file_path, driver_info_file_path, route_info_file_path, customer_location_info_file_path,
+            restaurant_location_info_file_path)
+
+
+def __initialize(customer_info_file_name: str, restaurant_info_file_name:str, route_info_file_name: str, instance_folder: str,
+                 driver_num=None):
+    '''
+    初始化模拟器
+    location_info_file_name: 地点数据文件名, 包括餐厅和顾客地点
+    route_info_file_name: 地图路线数据文件名
+    instance_folder: 测试例对应的文件夹
+    driver_num: 骑手数量, 只使用测试例中的前driver_num个骑手, None表示使用所有骑手
+    '''
+    file_paths = __get_instance_file_paths(customer_info_file_name, restaurant_info_file_name, route_info_file_name,
+                                           instance_folder)
     
-    # 初始化时间
-    now = datetime.datetime.now()
-    initial_datetime = datetime.datetime(now.year, now.month, now.day, 6) # start from 6 AM
-    initial_time = int(time.mktime(initial_datetime.timetuple()))
+    # 初始化时间, 模拟时钟从Configs.SIMULATION_EPOCH开始, 与运行日期无关
+    initial_time = get_initial_time()
     time_interval = Configs.ALG_RUN_FREQUENCY * 60
-    logger.info(f"Start time of the simulator: {initial_datetime}, time interval: {time_interval: .2f}")
+    logger.info(f"Start time of the simulator: {timestamp_to_datetime(initial_time)}, "
+                f"time interval: {time_interval: .2f}")
 
     try:
         # 获取初始化数据, get_initial_data
-        id_to_order, id_to_driver, route_map, id_to_restaurant_location, id_to_location = get_initial_data(data_file_path,
-                                                                                driver_info_file_path,
-                                                                                route_info_file_path,
-                                                                                customer_location_info_file_path,
-                                                                                restaurant_location_info_file_path,
-                                                                                initial_time)
+        id_to_order, id_to_driver, route_map, id_to_restaurant_location, id_to_location = __load_initial_data(
+            file_paths, initial_time)
+        id_to_driver = __select_drivers(id_to_driver, driver_num)
         # 初始化骑手位置
         __initial_position_of_drivers(id_to_restaurant_location, id_to_driver, initial_time)
+        # stream模式下订单在模拟过程中读取
+        order_source = get_order_source(file_paths[0], initial_time)
 
         # return instance of the object SimulateEnvironment
-        return SimulateEnvironment(initial_time, time_interval, id_to_order, id_to_driver, id_to_location, route_map)
+        return SimulateEnvironment(initial_time, time_interval, id_to_order, id_to_driver, id_to_location, route_map,
+                                   order_source)
     except Exception as exception:
         logger.error("Failed to read initial data")
         logger.error(f"Error: {exception}, {traceback.format_exc()}")
         return None
 
 
+def __load_initial_data(file_paths: tuple, initial_time: int):
+    '''
+    读取初始化数据(get_initial_data的输出), 地图使用共享内存(如果已经发布)和分时段的行驶时间
+    '''
+    # 已经发布了共享内存中的静态数据时, 地图直接从共享内存读取
+    shared_data = attach_shared_static_data()
+    route_map = SharedMap(shared_data) if shared_data is not None else None
+
+    load_initial_data = get_initial_data_with_cache if Configs.USE_INSTANCE_CACHE else get_initial_data
+    initial_data = load_initial_data(*file_paths, initial_time, route_map)
+    # 与快照一起预先创建地点索引, 算法进程直接读取
+    if Configs.USE_INSTANCE_CACHE and Configs.LOCATION_INDEX_K > 0:
+        get_location_index(file_paths[3], file_paths[4])
+    # 分时段的行驶时间
+    initial_data[2].speed_profile = get_speed_profile()
+    return initial_data
+
+
+def __select_drivers(id_to_driver: dict, driver_num):
+    '''
+    选择前driver_num个骑手(测试例文件中的顺序)
+    '''
+    if driver_num is None or driver_num >= len(id_to_driver):
+        if driver_num is not None and driver_num > len(id_to_driver):
+            logger.warning(f"Only {len(id_to_driver)} drivers in the instance, can not use {driver_num} drivers")
+        return id_to_driver
+    return {driver_id: id_to_driver.get(driver_id) for driver_id in list(id_to_driver.keys())[:driver_num]}
+
+
+def prepare_instance_data(customer_info_file: str, restaurant_info_file: str, route_info_file: str, instance: str,
+                          route_map=None):
+    '''
+    提前生成测试例的快照(Configs.USE_INSTANCE_CACHE), 并行运行多个模拟器时只需要编译一次
+    route_map: 可选, 共享内存中的地图, 快照中不包含地图
+    Output: get_initial_data的输出
+    '''
+    file_paths = __get_instance_file_paths(customer_info_file, restaurant_info_file, route_info_file, instance)
+    return get_initial_data_with_cache(*file_paths, get_initial_time(), route_map)
+
+
 def __initial_position_of_drivers(id_to_restaurant: dict, id_to_driver: dict, ini_time: int):
     '''
     初始化骑手位置, 骑手初始化在各个餐厅
@@ -73,15 +138,172 @@ def __initial_position_of_drivers(id_to_restaurant: dict, id_to_driver: dict, in
         index = random.randint(0, len(restaurant_id_list) - 1)
         restaurant_id = restaurant_id_list[index]
         driver.set_cur_position_info(restaurant_id, ini_time, ini_time, ini_time)
-        logger.info(f"Initial position of {driver_id} is {restaurant_id}")
+        logger.info("Initial position of %s is %s", driver_id, restaurant_id)
     
 
-def simulate(customer_info_file: str, restaurant_info_file: str, route_info_file: str, instance: str):
+def run_simulation(customer_info_file: str, restaurant_info_file: str, route_info_file: str, instance: str,
+                   driver_num=None):
     '''
-    运行模拟器
+    初始化并运行模拟器, 返回模拟结束后的SimulateEnvironment(初始化失败时返回None)
+    driver_num: 骑手数量, None表示使用测试例中的所有骑手
+    '''
+    simulate_env = __initialize(customer_info_file, restaurant_info_file, route_info_file, instance, driver_num)
+    if simulate_env is not None:
+        __run(simulate_env, instance)
+    return simulate_env
+
+
+def resume_simulation(checkpoint_file_path: str, customer_info_file: str, restaurant_info_file: str,
+                      route_info_file: str, instance: str):
+    '''
+    从检查点(SimulateEnvironment.save_checkpoint)恢复并继续模拟, 返回模拟结束后的SimulateEnvironment
+    地图和地点信息不在检查点中, 从测试例文件(或快照)中读取; 实时接入的订单来源(LiveOrderSource)从检查点的位置继续接收
+    '''
+    simulate_env = load_simulation(checkpoint_file_path, customer_info_file, restaurant_info_file, route_info_file,
+                                   instance)
+    if isinstance(simulate_env.order_source, LiveOrderSource):
+        simulate_env.order_source.restart()
+    __run(simulate_env, instance)
+    return simulate_env
+
+
+def load_simulation(checkpoint_file_path: str, customer_info_file: str, restaurant_info_file: str,
+                    route_info_file: str, instance: str):
+    '''
+    从检查点恢复SimulateEnvironment(不运行), 实时接入的订单来源不接收新的订单(e.g., 分支只回放已经收到的订单)
+    '''
+    route_map, id_to_location = load_static_data(customer_info_file, restaurant_info_file, route_info_file, instance)
+    return SimulateEnvironment.load_checkpoint(checkpoint_file_path, route_map, id_to_location)
+
+
+def run_simulation_from_state(state: bytes, customer_info_file: str, restaurant_info_file: str, route_info_file: str,
+                              instance: str, algorithm_calling_command=""):
+    '''
+    从SimulateEnvironment.dumps_state的输出继续模拟, 返回模拟结束后的SimulateEnvironment
+    algorithm_calling_command: 调用算法的命令, 为空时使用状态中的命令(默认为main_algorithm入口文件)
+    '''
+    route_map, id_to_location = load_static_data(customer_info_file, restaurant_info_file, route_info_file, instance)
+    simulate_env = SimulateEnvironment.loads_state(state, route_map, id_to_location)
+    if algorithm_calling_command:
+        simulate_env.algorithm_calling_command = algorithm_calling_command
+    __run(simulate_env, instance)
+    return simulate_env
+
+
+def replay_simulation(record_file_path: str, customer_info_file: str, restaurant_info_file: str,
+                      route_info_file: str, instance: str, driver_num=None):
+    '''
+    回放DispatchRecorder记录的派单结果重新模拟(不调用派单算法), 返回模拟结束后的SimulateEnvironment
+    修改Evaluator或模拟器侧的参数(e.g., LAMDA)之后, 不需要重新运行派单算法就可以重新计算分数
+    driver_num: 与记录时的骑手数量相同
     '''
-    simulate_env = __initialize(customer_info_file, restaurant_info_file, route_info_file, instance)
+    simulate_env = __initialize(customer_info_file, restaurant_info_file, route_info_file, instance, driver_num)
     if simulate_env is not None:
-        # 模拟器仿真过程
+        simulate_env.dispatch_replayer = DispatchReplayer(record_file_path)
+        simulate_env.dispatch_replayer.check_simulation(simulate_env.initial_time, simulate_env.time_interval,
+                                                        len(simulate_env.id_to_driver))
+        __run(simulate_env, instance)
+    return simulate_env
+
+
+def get_dispatch_record_file_path(instance: str):
+    '''
+    派单结果的记录文件 Output/recording/{instance}.jsonl
+    '''
+    return os.path.join(Configs.output_folder, "recording", f"{instance}.jsonl")
+
+
+def load_static_data(customer_info_file: str, restaurant_info_file: str, route_info_file: str, instance: str):
+    '''
+    检查点和状态中不保存的静态数据
+    Output: route_map, id_to_location
+    '''
+    file_paths = __get_instance_file_paths(customer_info_file, restaurant_info_file, route_info_file, instance)
+    _, _, route_map, _, id_to_location = __load_initial_data(file_paths, get_initial_time())
+    return route_map, id_to_location
+
+
+def __run(simulate_env: SimulateEnvironment, instance: str):
+    '''
+    模拟器仿真过程, 输出各环节耗时报告
+    '''
+    if Configs.CHECKPOINT_INTERVAL_TICKS > 0:
+        simulate_env.checkpoint_folder = os.path.join(Configs.output_folder, "checkpoint", instance)
+    # 从头开始的模拟才记录派单结果(从检查点恢复时缺少之前的时间片, 无法回放)
+    if Configs.RECORD_DISPATCH_RESULT and simulate_env.dispatch_replayer is None and simulate_env.tick_index == 0:
+        simulate_env.dispatch_recorder = DispatchRecorder(get_dispatch_record_file_path(instance),
+                                                          simulate_env.initial_time, simulate_env.time_interval,
+                                                          len(simulate_env.id_to_driver))
+
+    if Configs.PIPELINE_MODE == "async":
+        asyncio.run(simulate_env.run_async())
+    else:
         simulate_env.run()
-    return simulate_env.total_score
\ No newline at end of file
+
+    # 输出各环节耗时报告和服务水平指标
+    report_name = f"{instance}_{datetime.datetime.now().strftime('%y%m%d%H%M%S')}"
+    if Configs.SAVE_PROFILE_REPORT:
+        simulate_env.profiler.export(os.path.join(Configs.output_folder, "profile", report_name))
+    if Configs.SAVE_METRICS_REPORT and simulate_env.score_components is not None:
+        export_service_metrics(simulate_env.history, simulate_env.initial_time,
+                               os.path.join(Configs.output_folder, "metrics", report_name))
+
+
+def simulate(customer_info_file: str, restaurant_info_file: str, route_info_file: str, instance: str,
+             driver_num=None):
+    '''
+    运行模拟器
+    driver_num: 骑手数量, None表示使用测试例中的所有骑手
+    '''
+    result_key = ""
+    if Configs.USE_RESULT_CACHE:
+        result_key = __get_result_key(customer_info_file, restaurant_info_file, route_info_file, instance, driver_num)
+        key_to_score = __read_result_cache()
+        if result_key in key_to_score:
+            logger.info(f"Get the score of {instance} from the result cache")
+            return key_to_score.get(result_key)
+
+    simulate_env = run_simulation(customer_info_file, restaurant_info_file, route_info_file, instance, driver_num)
+
+    if Configs.USE_RESULT_CACHE:
+        key_to_score = __read_result_cache()
+        key_to_score[result_key] = simulate_env.total_score
+        with open(__get_result_cache_file_path(), "w") as fd:
+            fd.write(json.dumps(key_to_score, indent=4))
+    return simulate_env.total_score
+
+
+def __get_result_key(customer_info_file: str, restaurant_info_file: str, route_info_file: str, instance: str,
+                     driver_num=None):
+    '''
+    模拟结果缓存的key: 测试例文件内容, 模拟参数, 派单算法的参数, 模拟器和派单算法所有代码的哈希值
+    '''
+    file_paths = list(__get_instance_file_paths(customer_info_file, restaurant_info_file, route_info_file, instance))
+    file_paths += [os.path.join(Configs.root_folder_path, file_name)
+                   for file_name in sorted(os.listdir(Configs.root_folder_path))
+                   if file_name.startswith(Configs.ALGORITHM_ENTRY_FILE_NAME) and file_name.endswith(".py")]
+    file_paths += get_source_file_paths([Configs.src_folder_path, Configs.algorithm_folder_path])
+
+    # 算法子进程从环境变量读取派单算法
+    algorithm_settings = [os.environ.get("FOOD_DELIVERY_DISPATCH_ALGORITHM", ""), Configs.DISPATCH_ALGORITHM,
+                          Configs.DISPATCH_MODE, Configs.PIPELINE_MODE, Configs.ORDER_SOURCE_MODE,
+                          Configs.ROUTE_MAP_MODE, Configs.ROUTE_FALLBACK_TO_HAVERSINE, Configs.SPEED_PROFILE,
+                          Configs.MAX_RUNTIME_OF_ALGORITHM, Configs.FEASIBILITY_PRECHECK, driver_num]
+    algorithm_settings += [(name, getattr(Configs, name)) for name in sorted(vars(Configs))
+                           if name.startswith(("BUNDLE_", "ALNS_", "LOCATION_", "GREEDY_"))]
+    return get_content_digest(file_paths, get_initial_time(), Configs.ALG_RUN_FREQUENCY, Configs.LAMDA,
+                              Configs.RANDOM_SEED, *algorithm_settings)
+
+
+def __get_result_cache_file_path():
+    return os.path.join(Configs.cache_folder, "results.json")
+
+
+def __read_result_cache():
+    file_path = __get_result_cache_file_path()
+    if not os.path.exists(file_path):
+        if not os.path.exists(Configs.cache_folder):
+            os.makedirs(Configs.cache_folder)
+        return {}
+    with open(file_path, "r") as fd:
+        return json.loads(fd.read())
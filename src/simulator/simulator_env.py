@@ -1,28 +1,33 @@
-import datetime
+import asyncio
+import bisect
 import os
+import pickle
 import sys
 import time
 
 from src.simulator.driver_simulator import DriverSimulator
 from src.simulator.history import History
 from src.common.dispatch_result import DispatchResult
+from src.common.driver_index import DriverIndex
 from src.common.inform import InputInform
 from src.configuration.config import Configs
 from src.utils.logging_engine import logger
+from src.utils.time_utils import timestamp_to_datetime
 
-from src.utils.json_tools import convert_input_info_to_json_files
+from src.utils.json_tools import convert_input_info_to_json_files, pre_serialize_orders
 from src.utils.json_tools import get_output_of_algorithm
-from src.utils.json_tools import subprocess_function, get_algorithm_calling_command
+from src.utils.json_tools import subprocess_function, async_subprocess_function, get_algorithm_calling_command
 from src.utils.tools import get_orders_to_be_dispatched_of_cur_time
 from src.utils.tools import get_order_list_of_drivers
 
 from src.utils.checker import Checker
 from src.utils.evaluator import Evaluator
+from src.utils.profiler import TickProfiler
 
 
 class SimulateEnvironment(object):
     def __init__(self, initial_time: int, time_interval: int, id_to_order: dict, id_to_driver: dict,
-                 id_to_location: dict, route_map):
+                 id_to_location: dict, route_map, order_source=None):
         '''
         Inputs:
         initial_time: unix timestamp, unit is second
@@ -31,6 +36,8 @@ class SimulateEnvironment(object):
         id_to_driver: total drivers
         id_to_location: total locations (customer + restaurant)
         route_map: map of route
+        order_source: optional, CsvOrderSource, orders are released as the simulation time passes
+                      and completed orders are retired (id_to_order only keeps the orders in flight)
         '''
         self.initial_time = initial_time
         self.time_interval = time_interval
@@ -51,17 +58,133 @@ class SimulateEnvironment(object):
         # driver simulator
         self.driver_simulator = DriverSimulator(route_map, id_to_location)
 
-        # dispatch result for each time interval
+        # dispatch result for each time interval, stream模式(有order_source)下不保存, 避免引用已经移出内存的订单
         self.time_to_dispatch_result = {}
 
         # 保存每个骑手服务过的node, evaluation可以用
         self.history = self.__ini_history()
 
-        # 目标函数
+        # 目标函数, 以及目标函数的组成部分(每个骑手的距离和每个订单的延误, Evaluator.calculate_objective_variants)
         self.total_score = sys.maxsize
+        self.score_components = None
 
         # 算法调用命令
         self.algorithm_calling_command = ''
+
+        # 每个时间片各环节的耗时和计数
+        self.profiler = SimulateEnvironment.__create_profiler()
+
+        # 所有订单的创建时间(排序), 事件驱动模式下用于确定下一个新订单的时间
+        sorted_orders = sorted(id_to_order.values(), key=lambda order: order.creation_time)
+        self.sorted_creation_times = [order.creation_time for order in sorted_orders]
+        self.order_ids_sorted_by_creation = [order.id for order in sorted_orders]
+
+        # 订单中不变的属性序列化后的缓存, {order_id: dict}, 每个时间片输出json时复用
+        self.order_id_to_serialized_order = {}
+
+        # 上一次算法的运行时间, 已经完成的时间片数量
+        self.used_seconds = 0
+        self.tick_index = 0
+
+        # 每Configs.CHECKPOINT_INTERVAL_TICKS个时间片保存一次检查点, 为空时不保存
+        self.checkpoint_folder = ""
+
+        # 流式订单来源, 已经完成并移出内存的订单数量(完成记录保存在history中)
+        self.order_source = order_source
+        self.retired_order_num = 0
+
+        # 骑手状态, 按状态, 空闲时间和空闲地点索引
+        for driver in id_to_driver.values():
+            driver.update_state(initial_time)
+        self.driver_index = DriverIndex(id_to_driver.values())
+
+        # 派单结果的记录(DispatchRecorder)和回放(DispatchReplayer), 回放时不调用派单算法
+        self.dispatch_recorder = None
+        self.dispatch_replayer = None
+
+
+    # 检查点中不保存的属性: 静态数据(由load_checkpoint重新提供), simpy环境, 可以重建的缓存,
+    # 不断增长的派单结果和耗时记录(恢复后从空的记录开始)
+    CHECKPOINT_EXCLUDED_ATTRIBUTES = ("route_map", "id_to_location", "driver_simulator", "order_id_to_serialized_order",
+                                      "dispatch_recorder", "dispatch_replayer", "time_to_dispatch_result", "profiler")
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.CHECKPOINT_EXCLUDED_ATTRIBUTES:
+            state.pop(name, None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.route_map = None
+        self.id_to_location = None
+        self.driver_simulator = None
+        self.order_id_to_serialized_order = {}
+        self.dispatch_recorder = None
+        self.dispatch_replayer = None
+        self.time_to_dispatch_result = {}
+        self.profiler = SimulateEnvironment.__create_profiler()
+
+
+    @staticmethod
+    def __create_profiler():
+        return TickProfiler(Configs.PROFILE_CPROFILE, Configs.PROFILE_TRACEMALLOC,
+                            os.path.join(Configs.output_folder, "profile", "cprofile"))
+
+
+    def attach_static_data(self, route_map, id_to_location: dict):
+        '''
+        恢复检查点之后, 重新提供地图和地点信息
+        '''
+        self.route_map = route_map
+        self.id_to_location = id_to_location
+        self.driver_simulator = DriverSimulator(route_map, id_to_location)
+
+
+    def dumps_state(self):
+        '''
+        当前状态(骑手, 订单, 历史记录, 当前时间等)序列化为bytes, 不包括地图和地点信息
+        '''
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+    @staticmethod
+    def loads_state(state: bytes, route_map, id_to_location: dict):
+        '''
+        dumps_state的反操作
+        '''
+        simulate_env = pickle.loads(state)
+        simulate_env.attach_static_data(route_map, id_to_location)
+        return simulate_env
+
+
+    def save_checkpoint(self, file_path=""):
+        '''
+        保存检查点, 默认路径为 checkpoint_folder/tick_{tick_index}.pkl
+        '''
+        file_path = file_path or os.path.join(self.checkpoint_folder, f"tick_{self.tick_index}.pkl")
+        folder = os.path.dirname(file_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        # 先写临时文件再替换, 写入过程中中断不会损坏已有的检查点
+        with open(f"{file_path}.tmp", "wb") as fd:
+            fd.write(self.dumps_state())
+        os.replace(f"{file_path}.tmp", file_path)
+        logger.info(f"Save the checkpoint of {timestamp_to_datetime(self.cur_time)} to {file_path}")
+        return file_path
+
+
+    @staticmethod
+    def load_checkpoint(file_path: str, route_map, id_to_location: dict):
+        '''
+        从检查点恢复, 调用run()从检查点的时间继续模拟
+        '''
+        with open(file_path, "rb") as fd:
+            simulate_env = SimulateEnvironment.loads_state(fd.read(), route_map, id_to_location)
+        logger.info(f"Load the checkpoint {file_path}, current time: {timestamp_to_datetime(simulate_env.cur_time)}")
+        return simulate_env
     
     
     def __ini_history(self):
@@ -71,7 +194,8 @@ class SimulateEnvironment(object):
         history = History()
         # initialize the history of drivers and orders
         for driver_id, driver in self.id_to_driver.items():
-            history.add_driver_position_history(driver_id, driver.gps_update_time, driver.current_location_id)
+            history.add_driver_position_history(driver_id, driver.gps_update_time, driver.current_location_id,
+                                                service_time=0)
         for order_id, order in self.id_to_order.items():
             history.add_order_status_history(order.delivery_state, self.initial_time, order.committed_completion_time, order_id)
 
@@ -80,73 +204,227 @@ class SimulateEnvironment(object):
     
     # simulation
     def run(self):
-        used_seconds = 0
-        # 迭代
+        # 迭代(从检查点恢复时从检查点的时间继续)
         while True:
-            logger.info(f"{'*' * 50}")
-            
-            # 确定当前时间, 取算法执行时间和模拟器的切片时间的大值
-            self.cur_time = self.pre_time + (used_seconds // self.time_interval + 1) * self.time_interval
-            logger.info(f"cur time: {datetime.datetime.fromtimestamp(self.cur_time)}, "
-                        f"pre time: {datetime.datetime.fromtimestamp(self.pre_time)}")
-            
-            # 更新时间段内的骑手信息和订单信息 [self.pre_time, self.cur_time]
-            updated_input_info = self.update_input()
+            # 模拟骑手, 确定当前时间, 更新时间段内的骑手信息和订单信息
+            updated_input_info = self.prepare_tick(self.used_seconds)
             
             # 派单环节, 设计与算法交互
             used_seconds, dispatch_result = self.dispatch(updated_input_info)
-            self.time_to_dispatch_result[self.cur_time] = dispatch_result
-            
-            # 校验, 车辆目的地不能改变
-            if not Checker.check_dispatch_result(dispatch_result, self.id_to_driver, self.id_to_order):
-                logger.error("Dispatch result is infeasible")
+
+            # 校验并执行派单结果
+            is_feasible, is_finished = self.complete_tick(used_seconds, dispatch_result)
+            if not is_feasible:
                 return
-            
-            # 根据派单指令更新车辆
-            self.deliver_control_command_to_drivers(dispatch_result)
-            
-            # 判断是否完成所有订单的派发
-            if self.complete_the_dispatch_of_all_orders():
+            if is_finished:
                 break
-            
-            self.pre_time = self.cur_time
-            
-            # 若订单已经超时, 但是算法依旧未分配, 模拟终止
-            if self.ignore_allocating_timeout_orders(dispatch_result):
-                logger.error('Simulator terminated')
-                sys.exit(-1)
-            
-            # 模拟完成车辆剩下的订单
-        self.simulate_the_left_ongoing_orders_of_drivers(self.id_to_driver)
+
+        self.finish_simulation()
+
+
+    async def run_async(self):
+        '''
+        异步流水线模式: 算法计算第N个时间片时, 同时写日志, 预先序列化第N+1个时间片将要释放的订单
+        只有这两项与算法并行; 历史记录和分数的更新依赖骑手的状态, 仍然在算法结束后依次执行
+        派单结果的校验和执行与run()完全相同
+        '''
+        while True:
+            updated_input_info = self.prepare_tick(self.used_seconds)
+            used_seconds, dispatch_result = await self.dispatch_async(updated_input_info)
+            is_feasible, is_finished = self.complete_tick(used_seconds, dispatch_result)
+            if not is_feasible:
+                return
+            if is_finished:
+                break
+
+        self.finish_simulation()
+
+
+    def prepare_tick(self, used_seconds):
+        '''
+        开始一个时间片: 模拟骑手, 确定当前时间, 更新骑手和订单信息, 返回派单算法的输入
+        '''
+        logger.tick_detail('*' * 50)
+        self.profiler.start_tick()
+
+        # 模拟骑手从pre_time开始的配送过程
+        self.simulate_drivers()
+        
+        # 确定当前时间(下一次派单的时间)
+        self.cur_time = self.get_next_dispatch_time(used_seconds)
+        logger.tick_detail("cur time: %s, pre time: %s", timestamp_to_datetime(self.cur_time),
+                           timestamp_to_datetime(self.pre_time))
+        
+        # 更新时间段内的骑手信息和订单信息 [self.pre_time, self.cur_time]
+        return self.update_input()
+
+
+    def complete_tick(self, used_seconds, dispatch_result):
+        '''
+        结束一个时间片: 校验派单结果, 更新骑手, 判断是否完成所有订单的派发
+        Output: (is_feasible, is_finished)
+        '''
+        if self.order_source is None:
+            self.time_to_dispatch_result[self.cur_time] = dispatch_result
+        self.used_seconds = used_seconds
+        
+        # 校验, 车辆目的地不能改变
+        with self.profiler.timer("checker"):
+            is_feasible = Checker.check_dispatch_result(dispatch_result, self.id_to_driver, self.id_to_order)
+        if not is_feasible:
+            logger.error("Dispatch result is infeasible")
+            self.profiler.stop()
+            return False, False
+
+        if self.dispatch_recorder is not None:
+            with self.profiler.timer("dispatch_recorder"):
+                self.dispatch_recorder.record(self.cur_time, used_seconds, dispatch_result)
+        
+        # 根据派单指令更新车辆
+        with self.profiler.timer("deliver_control_command"):
+            self.deliver_control_command_to_drivers(dispatch_result)
+        self.profiler.end_tick(self.cur_time)
+
+        logger.tick_summary(self.cur_time,
+                            unallocated_orders=len(self.id_to_generated_order),
+                            ongoing_orders=len(self.id_to_ongoing_order),
+                            completed_orders=len(self.id_to_completed_order) + self.retired_order_num,
+                            used_seconds=round(used_seconds, 3))
+        
+        # 判断是否完成所有订单的派发
+        if self.complete_the_dispatch_of_all_orders():
+            return True, True
+        
+        self.pre_time = self.cur_time
+        
+        # 若订单已经超时, 但是算法依旧未分配, 模拟终止
+        if self.ignore_allocating_timeout_orders(dispatch_result):
+            logger.error('Simulator terminated')
+            sys.exit(-1)
+
+        self.tick_index += 1
+        if (self.checkpoint_folder and Configs.CHECKPOINT_INTERVAL_TICKS > 0
+                and self.tick_index % Configs.CHECKPOINT_INTERVAL_TICKS == 0):
+            with self.profiler.timer("checkpoint"):
+                self.save_checkpoint()
+        return True, False
+
+
+    def finish_simulation(self):
+        '''
+        模拟完成车辆剩下的订单, 并计算指标
+        '''
+        with self.profiler.timer("simulate_left_ongoing_orders"):
+            self.simulate_the_left_ongoing_orders_of_drivers(self.id_to_driver)
 
         logger.info("finished the left ongoing orders")
+        if hasattr(self.route_map, "get_cache_stats"):
+            logger.info("Route cache: %s", self.route_map.get_cache_stats())
             
         # 根据self.history 计算指标
-        self.total_score = Evaluator.calculate_total_score(self.history, self.route_map, len(self.id_to_driver))    
+        with self.profiler.timer("evaluator"):
+            self.score_components = Evaluator.calculate_score_components(self.history, self.route_map,
+                                                                         len(self.id_to_driver))
+            self.total_score = Evaluator.calculate_score_of_components(self.score_components)
+        if self.dispatch_recorder is not None:
+            self.dispatch_recorder.close()
+        self.profiler.stop()
         
-    
+
+    def simulate_drivers(self):
+        '''
+        从pre_time开始模拟骑手的配送过程, 计算destination和planned route中每个node的到达和离开时间
+        '''
+        with self.profiler.timer("driver_simulator_run"):
+            self.driver_simulator.run(self.id_to_driver, self.pre_time)
+        # 只有模拟器移动过(有目的地)的骑手的空闲时间会改变
+        for driver_id in self.driver_simulator.moved_driver_ids:
+            driver = self.id_to_driver.get(driver_id)
+            driver.update_state(self.pre_time)
+            self.driver_index.update(driver)
+        self.profiler.count("drivers_moved", len(self.driver_simulator.moved_driver_ids))
+        self.profiler.count("nodes_visited", self.driver_simulator.visited_node_num)
+
+
+    def get_next_dispatch_time(self, used_seconds):
+        '''
+        确定下一次派单的时间
+        - fixed: 固定时间间隔, 取算法执行时间和模拟器的切片时间的大值
+        - event: 由事件触发(新订单释放后等待批处理窗口, 骑手完成路线变为空闲), 没有事件的时间段直接跳过,
+                 且不早于算法执行结束的时间
+        '''
+        if Configs.DISPATCH_MODE != "event":
+            return self.pre_time + (used_seconds // self.time_interval + 1) * self.time_interval
+
+        earliest_time = self.pre_time + max(used_seconds, Configs.MIN_DISPATCH_INTERVAL)
+        event_times = []
+
+        # 新订单释放, 等待批处理窗口
+        next_creation_time = self.get_next_order_creation_time()
+        if next_creation_time is not None:
+            event_times.append(next_creation_time + Configs.BATCHING_WINDOW)
+
+        # 骑手完成路线, 变为空闲
+        free_time = self.driver_index.get_next_free_time(self.pre_time)
+        if free_time is not None:
+            event_times.append(free_time)
+
+        if len(event_times) == 0:
+            return self.pre_time + self.time_interval
+        return max(earliest_time, min(event_times))
+
+
+    def get_next_order_creation_time(self):
+        '''
+        pre_time之后第一个新订单的创建时间, 没有新订单时返回None
+        '''
+        if self.order_source is not None:
+            return self.order_source.next_creation_time()
+        index = bisect.bisect_right(self.sorted_creation_times, self.pre_time)
+        if index < len(self.sorted_creation_times):
+            return self.sorted_creation_times[index]
+        return None
+
+
     def update_input(self):
         '''
         更新骑手和订单信息
         '''
-        logger.info(f"Start to update the input of {datetime.datetime.fromtimestamp(self.cur_time)}")
+        logger.tick_detail("Start to update the input of %s", timestamp_to_datetime(self.cur_time))
         
         # 获取车辆位置信息和订单状态
-        self.driver_simulator.run(self.id_to_driver, self.pre_time)
-        self.driver_simulator.parse_simulation_result(self.id_to_driver, self.cur_time)
+        with self.profiler.timer("parse_simulation_result"):
+            self.driver_simulator.parse_simulation_result(self.id_to_driver, self.cur_time)
 
-        # 增加车辆和订单历史记录
-        self.history.add_history_of_drivers(self.id_to_driver, self.cur_time)
-        self.history.add_history_of_orders(self.id_to_driver, self.cur_time)
+        # 增加车辆和订单历史记录(需要在更新车辆状态之前)
+        with self.profiler.timer("history"):
+            self.history.add_history_of_drivers(self.id_to_driver, self.cur_time)
+            self.history.add_history_of_orders(self.id_to_driver, self.cur_time)
         
         # 更新订单状态和车辆状态
-        self.update_status_of_orders(self.driver_simulator.completed_order_ids, self.driver_simulator.ongoing_order_ids)
-        self.update_status_of_drivers(self.driver_simulator.driver_id_to_cur_position_info,
-                                      self.driver_simulator.driver_id_to_destination,
-                                      self.driver_simulator.driver_id_to_carrying_orders)
+        with self.profiler.timer("update_status"):
+            self.update_status_of_orders(self.driver_simulator.completed_order_ids,
+                                         self.driver_simulator.ongoing_order_ids)
+            self.update_status_of_drivers(self.driver_simulator.driver_id_to_cur_position_info,
+                                          self.driver_simulator.driver_id_to_destination,
+                                          self.driver_simulator.driver_id_to_carrying_orders)
+            if self.order_source is not None:
+                self.retire_completed_orders()
         
         # 当前时间待分配的订单集合
-        self.id_to_generated_order = get_orders_to_be_dispatched_of_cur_time(self.id_to_order, self.cur_time)
+        with self.profiler.timer("get_orders_to_be_dispatched"):
+            if self.order_source is not None:
+                self.release_orders_of_source()
+            pre_generated_order_ids = self.id_to_generated_order.keys()
+            self.id_to_generated_order = get_orders_to_be_dispatched_of_cur_time(self.id_to_order, self.cur_time)
+            released_order_ids = self.id_to_generated_order.keys() - pre_generated_order_ids
+            self.profiler.count("orders_released", len(released_order_ids))
+        # 订单的创建时间(GENERATED), 用于计算配送时长等指标
+        with self.profiler.timer("history"):
+            for order_id in released_order_ids:
+                order = self.id_to_generated_order.get(order_id)
+                self.history.add_order_status_history(order.delivery_state, order.creation_time,
+                                                      order.committed_completion_time, order_id)
         
         
         # 汇总骑手，订单和路网信息，作为派单算法的输入
@@ -157,13 +435,49 @@ class SimulateEnvironment(object):
                                          self.route_map)
 
         # 打印更新结果
-        logger.info(f"Get {len(self.id_to_generated_order)} unallocated orders, "
-                    f"{len(self.id_to_ongoing_order)} ongoing orders, "
-                    f"{len(self.id_to_completed_order)} completed orders.")
+        logger.tick_detail("Get %d unallocated orders, %d ongoing orders, %d completed orders.",
+                           len(self.id_to_generated_order), len(self.id_to_ongoing_order),
+                           len(self.id_to_completed_order))
         
         return updated_input_info
     
     
+    def pre_serialize_next_orders(self):
+        '''
+        预先序列化(cur_time, cur_time + time_interval]之间将要释放的订单
+        '''
+        if self.order_source is not None:
+            orders = self.order_source.peek_orders(self.cur_time + self.time_interval)
+        else:
+            start_index = bisect.bisect_right(self.sorted_creation_times, self.cur_time)
+            end_index = bisect.bisect_right(self.sorted_creation_times, self.cur_time + self.time_interval)
+            orders = [self.id_to_order.get(order_id)
+                      for order_id in self.order_ids_sorted_by_creation[start_index:end_index]]
+        pre_serialize_orders(orders, self.order_id_to_serialized_order)
+
+
+    def release_orders_of_source(self):
+        '''
+        从流式订单来源释放cur_time之前创建的订单, 加入id_to_order和history
+        '''
+        orders = self.order_source.release_orders(self.cur_time)
+        for order in orders:
+            self.id_to_order[order.id] = order
+            self.history.add_order_status_history(order.delivery_state, order.creation_time,
+                                                  order.committed_completion_time, order.id)
+
+
+    def retire_completed_orders(self):
+        '''
+        已经完成的订单移出内存, 订单的完成记录保存在history中
+        '''
+        for order_id in self.id_to_completed_order:
+            self.id_to_order.pop(order_id, None)
+            self.order_id_to_serialized_order.pop(order_id, None)
+        self.retired_order_num += len(self.id_to_completed_order)
+        self.id_to_completed_order = {}
+    
+    
     def update_status_of_orders(self, completed_order_ids, ongoing_order_ids):
         '''
         更新订单状态
@@ -198,7 +512,9 @@ class SimulateEnvironment(object):
                                   driver_id_to_carrying_orders):
         '''
         更新每个骑手的状态: [位置，下一个目的地，订单]
+        只有这个时间片模拟器移动过的骑手重新计算状态和更新骑手索引, 空闲骑手的状态和索引中的位置不变
         '''
+        moved_driver_ids = set(self.driver_simulator.moved_driver_ids)
         for driver_id, driver in self.id_to_driver.items():
             # 更新骑手的位置信息和到达，离开时间
             if driver_id in driver_id_to_cur_position_info:
@@ -221,6 +537,10 @@ class SimulateEnvironment(object):
             else:
                 logger.error(f"Driver {driver_id} does not have the information of carrying orders")
 
+            # 计划路线清空之前更新骑手状态(空闲时间为原计划路线的完成时间)
+            if driver_id in moved_driver_ids:
+                driver.update_state(self.cur_time)
+                self.driver_index.update(driver)
             driver.planned_route = []
     
     
@@ -228,8 +548,12 @@ class SimulateEnvironment(object):
         '''
         根据输入信息进行派单
         '''
+        if self.dispatch_replayer is not None:
+            return self.replay_dispatch()
+
         # 准备派单输入json文件
-        convert_input_info_to_json_files(input_info)
+        with self.profiler.timer("json_export"):
+            convert_input_info_to_json_files(input_info, self.order_id_to_serialized_order)
 
         # 运行派单算法
         if not self.algorithm_calling_command:
@@ -238,16 +562,58 @@ class SimulateEnvironment(object):
 
         # route_map = input_info.route_map # add the route_map object
 
-        used_seconds, message = subprocess_function(self.algorithm_calling_command)
+        with self.profiler.timer("algorithm_subprocess"):
+            used_seconds, message = subprocess_function(self.algorithm_calling_command)
+
+        return used_seconds, self.parse_output_of_algorithm(message, time_start_algorithm)
+
 
-        # 解析算法输出json文件
+    async def dispatch_async(self, input_info):
+        '''
+        异步派单: 等待算法子进程时, 在线程池中写日志, 预先序列化下一个时间片的订单(不更新历史记录和分数)
+        '''
+        if self.dispatch_replayer is not None:
+            return self.replay_dispatch()
+
+        with self.profiler.timer("json_export"):
+            convert_input_info_to_json_files(input_info, self.order_id_to_serialized_order)
+
+        if not self.algorithm_calling_command:
+            self.algorithm_calling_command = get_algorithm_calling_command()
+        time_start_algorithm = time.time()
+
+        loop = asyncio.get_running_loop()
+        with self.profiler.timer("algorithm_subprocess"):
+            algorithm_task = asyncio.ensure_future(async_subprocess_function(self.algorithm_calling_command))
+            # 与算法并行的工作, 不修改骑手和订单的状态
+            with self.profiler.timer("overlapped_work"):
+                await asyncio.gather(loop.run_in_executor(None, self.pre_serialize_next_orders),
+                                     loop.run_in_executor(None, logger.flush))
+            used_seconds, message = await algorithm_task
+
+        return used_seconds, self.parse_output_of_algorithm(message, time_start_algorithm)
+
+
+    def replay_dispatch(self):
+        '''
+        回放记录的派单结果和算法运行时间
+        '''
+        with self.profiler.timer("dispatch_replayer"):
+            return self.dispatch_replayer.replay(self.cur_time, self.id_to_driver, self.id_to_order,
+                                                 self.id_to_location)
+
+
+    def parse_output_of_algorithm(self, message, time_start_algorithm):
+        '''
+        解析算法输出json文件, 转换成DispatchResult
+        '''
         if Configs.ALGORITHM_SUCCESS_FLAG in message:
             if (time_start_algorithm < os.stat(Configs.algorithm_output_destination_path).st_mtime < time.time()
                     and time_start_algorithm < os.stat(
                         Configs.algorithm_output_planned_route_path).st_mtime < time.time()):
-                driver_id_to_destination, driver_id_to_planned_route = get_output_of_algorithm(self.id_to_order)
-                dispatch_result = DispatchResult(driver_id_to_destination, driver_id_to_planned_route)
-                return used_seconds, dispatch_result
+                with self.profiler.timer("output_parsing"):
+                    driver_id_to_destination, driver_id_to_planned_route = get_output_of_algorithm(self.id_to_order)
+                return DispatchResult(driver_id_to_destination, driver_id_to_planned_route)
             else:
                 logger.error("Output_json files from the algorithm is not the newest.")
                 sys.exit(-1)
@@ -261,12 +627,14 @@ class SimulateEnvironment(object):
         '''
         判断是否完成了所有订单的分配
         '''
+        if self.order_source is not None and not self.order_source.is_exhausted():
+            return False
         for order in self.id_to_order.values():
             if order.delivery_state <= 1:
-                logger.info(f"{datetime.datetime.fromtimestamp(self.cur_time)}, Order {order.id}: "
-                            f"state = {order.delivery_state} < 2, we can not finish the simulation")
+                logger.tick_detail("%s, Order %s: state = %d < 2, we can not finish the simulation",
+                                   timestamp_to_datetime(self.cur_time), order.id, order.delivery_state)
                 return False
-        logger.info(f"{datetime.datetime.fromtimestamp(self.cur_time)}, the status of all orders is greater than 1, "
+        logger.info(f"{timestamp_to_datetime(self.cur_time)}, the status of all orders is greater than 1, "
                     f"we could finish the simulation")
         return True
     
@@ -320,9 +688,9 @@ class SimulateEnvironment(object):
         for order_id, order in self.id_to_generated_order.items():
             if order_id not in total_order_ids_in_dispatch_result:
                 if order.committed_completion_time < self.cur_time:
-                    logger.error(f"{datetime.datetime.fromtimestamp(self.cur_time)}, "
+                    logger.error(f"{timestamp_to_datetime(self.cur_time)}, "
                                  f"Order {order_id}'s committed_completion_time is "
-                                 f"{datetime.datetime.fromtimestamp(order.committed_completion_time)} "
+                                 f"{timestamp_to_datetime(order.committed_completion_time)} "
                                  f"which has timed out, "
                                  f"however it is still ignored in the dispatch result.")
                     return True
@@ -1,5 +1,5 @@
-import copy
-
+from src.utils.feasibility import check_capacity, check_destination, check_duplicate_orders
+from src.utils.feasibility import check_order_locations
 from src.utils.logging_engine import logger
 # from Food_delivery_simulator.utils.tools import get_order_list_of_drivers
 
@@ -48,8 +48,7 @@ class Checker(object):
 
             if len(route) > 0:
                 # 骑手容量约束
-                if not Checker.__meet_capacity_constraint(route, copy.deepcopy(driver.carrying_orders),
-                                                          driver.capacity):
+                if not Checker.__meet_capacity_constraint(route, driver.carrying_orders, driver.capacity):
                     logger.error(f"driver {driver_id} violates the capacity constraint")
                     return False
 
@@ -57,7 +56,7 @@ class Checker(object):
                 Checker.__contain_duplicated_nodes(driver_id, route)
 
                 # 重复订单约束
-                if Checker.__contain_duplicate_orders(route, copy.deepcopy(driver.carrying_orders)):
+                if Checker.__contain_duplicate_orders(route, driver.carrying_orders):
                     return False
 
                 # 
@@ -72,32 +71,10 @@ class Checker(object):
         '''
         检测算法分配的目的地是否有效
         '''
-        # driver原来的目的地
-        origin_destination = driver.destination
-        
-        if origin_destination is not None:
-            if returned_destination is None:
-                logger.error(f"driver {driver.id}, returned destination is None, "
-                             f"however the origin destination is not None.")
-                return False
-            else:
-                # 下一个目的地一旦确认，不可更改，车辆不处于停车状态
-                if origin_destination.id != returned_destination.id:
-                    logger.error(f"driver {driver.id}, returned destination id is {returned_destination.id}, "
-                                 f"however the origin destination id is {origin_destination.id}.")
-                    return False
-
-                if origin_destination.arrive_time != returned_destination.arrive_time:
-                    logger.error(f"driver {driver.id}, arrive time of returned destination is "
-                                 f"{returned_destination.arrive_time}, "
-                                 f"however the arrive time of origin destination is "
-                                 f"{origin_destination.arrive_time}.")
-                    return False
-        elif len(driver.current_location_id) == 0 and returned_destination is None:
-            logger.error(f"Currently, driver {driver.id} is not in the location(current_location_id==''), "
-                         f"however, returned destination is also None, we cannot locate the driver.")
+        message = check_destination(returned_destination, driver)
+        if message:
+            logger.error(message)
             return False
-
         return True
     
     
@@ -110,32 +87,10 @@ class Checker(object):
         - carrying_orders: 正在配送的订单
         - capacity: 骑手的capacity
         '''
-        left_capacity = capacity
-
-        # 检测去掉carrying_orders的剩余capacity
-        for order in carrying_orders:
-            left_capacity -= order.demand
-            if left_capacity < 0:
-                logger.error(f"left capacity {left_capacity} < 0")
-                return False
-
-        # 对运送路线上每个node进行检测
-        for node in route:
-            # 在food delivery问题中，一个node要么是餐厅(只有pickup)，要么是顾客(只有delivery)
-            delivery_orders = node.delivery_orders
-            pickup_orders = node.pickup_orders
-            # delivery orders
-            for order in delivery_orders:
-                left_capacity += order.demand
-                if left_capacity > capacity:
-                    logger.error(f"left capacity {left_capacity} > capacity {capacity}")
-                    return False
-            # pickup orders
-            for order in pickup_orders:
-                left_capacity -= order.demand
-                if left_capacity < 0:
-                    logger.error(f"left capacity {left_capacity} < 0")
-                    return False
+        message = check_capacity(route, carrying_orders, capacity)
+        if message:
+            logger.error(message)
+            return False
         return True
 
     
@@ -154,23 +109,10 @@ class Checker(object):
         '''
         检测路线中是否有重复的订单
         '''
-        order_id_list = []
-        # for carrying_orders
-        for order in carrying_orders:
-            if order.id not in order_id_list:
-                order_id_list.append(order.id)
-            else:
-                logger.error(f"order {order.id}: duplicate order id")
-                return True
-        # for pickup orders in route
-        for node in route:
-            pickup_orders = node.pickup_orders
-            for order in pickup_orders:
-                if order.id not in order_id_list:
-                    order_id_list.append(order.id)
-                else:
-                    logger.error(f"order {order.id}: duplicate order id")
-                    return True
+        message = check_duplicate_orders(route, carrying_orders)
+        if message:
+            logger.error(message)
+            return True
         return False
     
     
@@ -179,21 +121,8 @@ class Checker(object):
         '''
         检查pickup和delivery orders的地点是否正确对应
         '''
-        for node in route:
-            # 路线中的地点
-            location_id = node.id
-            # pickup orders
-            pickup_orders = node.pickup_orders
-            for order in pickup_orders:
-                if order.pickup_location_id != location_id:
-                    logger.error(f"Pickup location of order {order.id} is {order.pickup_location_id}, "
-                                 f"however you allocate the driver to pickup this order in {location_id}")
-                    return False
-            # delivery orders
-            delivery_orders = node.delivery_orders
-            for order in delivery_orders:
-                if order.delivery_location_id != location_id:
-                    logger.error(f"Delivery location of order {order.id} is {order.delivery_location_id}, "
-                                 f"however you allocate the driver to delivery this order in {location_id}")
-                    return False
-        return True
\ No newline at end of file
+        message = check_order_locations(route)
+        if message:
+            logger.error(message)
+            return False
+        return True
@@ -1,9 +1,32 @@
+import itertools
 import sys
 
+import numpy as np
+import pandas as pd
+
 from src.utils.logging_engine import logger
 from src.configuration.config import Configs
 
 
+class ScoreComponents(object):
+    def __init__(self, driver_ids: list, driver_distances, order_ids: list, over_times, driver_num: int,
+                 failed_order_ids=()):
+        '''
+        目标函数的组成部分, 模拟结束后保存, 不同的目标函数参数不需要重新模拟
+        Inputs:
+        - driver_ids, driver_distances: 每个骑手的行驶距离(km), numpy array
+        - order_ids, over_times: 每个已完成订单的延误时间(秒, 没有延误为0), numpy array
+        - driver_num: 骑手数量
+        - failed_order_ids: 没有完成记录的订单, 不为空时分数为sys.maxsize
+        '''
+        self.driver_ids = list(driver_ids)
+        self.driver_distances = np.asarray(driver_distances, dtype=float)
+        self.order_ids = list(order_ids)
+        self.over_times = np.asarray(over_times, dtype=float)
+        self.driver_num = driver_num
+        self.failed_order_ids = list(failed_order_ids)
+
+
 class Evaluator(object):
     
     @staticmethod
@@ -11,24 +34,109 @@ class Evaluator(object):
         '''
         目标函数
         '''
+        return Evaluator.calculate_score_of_components(
+            Evaluator.calculate_score_components(history, route_map, driver_num))
+
+
+    @staticmethod
+    def calculate_score_components(history, route_map, driver_num: int):
+        '''
+        每个骑手的行驶距离和每个订单的延误时间
+        Output: ScoreComponents
+        '''
+        driver_id_to_distance = Evaluator.calculate_distance_of_drivers(history.get_driver_position_history(),
+                                                                        route_map)
+        order_id_to_over_time, failed_order_ids = Evaluator.calculate_over_time_of_orders(
+            history.get_order_status_history())
+        return ScoreComponents(list(driver_id_to_distance.keys()), list(driver_id_to_distance.values()),
+                               list(order_id_to_over_time.keys()), list(order_id_to_over_time.values()),
+                               driver_num, failed_order_ids)
+
+
+    @staticmethod
+    def calculate_score_of_components(components: ScoreComponents, lamda=None):
+        '''
+        目标函数: 总距离 / 骑手数量 + 总延误时间(秒) * LAMDA / 3600
+        - lamda: 延误的系数, 默认Configs.LAMDA
+        '''
+        lamda = Configs.LAMDA if lamda is None else lamda
         # 所有骑手的总行驶距离
-        total_distance = Evaluator.calculate_total_distance(history.get_driver_position_history(), route_map)
+        total_distance = sum(components.driver_distances.tolist())
         logger.info(f"Total distance: {total_distance: .3f}")
-        
+
         # 所有骑手的总延误时间
-        total_over_time = Evaluator.calculate_total_over_time(history.get_order_status_history())
+        if len(components.failed_order_ids) > 0:
+            total_over_time = sys.maxsize
+        else:
+            total_over_time = sum(components.over_times.tolist())
         logger.info(f"Sum over time: {total_over_time: .3f}")
-        
+
         # 最终分数
-        total_score = total_distance / driver_num + total_over_time * Configs.LAMDA / 3600
+        total_score = total_distance / components.driver_num + total_over_time * lamda / 3600
         logger.info(f"Total score: {total_score: .3f}")
         return total_score
+
+
+    @staticmethod
+    def calculate_objective_variants(components: ScoreComponents, lamdas=None, lateness_caps=(None,),
+                                     lateness_percentiles=(None,)):
+        '''
+        在(LAMDA, 延误上限, 延误分位数上限)的参数网格上一次计算所有目标函数的分数(向量化)
+        每个订单的延误先截断到上限, 再求和: 总距离 / 骑手数量 + sum(min(延误, 上限)) * LAMDA / 3600
+        Inputs:
+        - lamdas: 延误系数列表, 默认[Configs.LAMDA]
+        - lateness_caps: 每个订单延误时间的上限(秒)列表, None表示不截断
+        - lateness_percentiles: 延误订单的延误时间的分位数(0-100)列表, 作为上限, None表示不截断
+        Output:
+        - DataFrame, 每个参数组合一行: lamda, lateness_cap, lateness_percentile, 实际使用的上限,
+          总距离, 截断后的总延误时间, 距离项, 延误项, 分数; 有订单没有完成记录时分数为sys.maxsize
+        '''
+        lamdas = [Configs.LAMDA] if lamdas is None else list(lamdas)
+        variants = pd.DataFrame(list(itertools.product(lamdas, lateness_caps, lateness_percentiles)),
+                                columns=["lamda", "lateness_cap", "lateness_percentile"])
+
+        # 所有组合的上限, 取两种上限的小值
+        late_times = components.over_times[components.over_times > 0]
+        caps = variants["lateness_cap"].to_numpy(dtype=float, na_value=np.inf)
+        percentiles = variants["lateness_percentile"].to_numpy(dtype=float, na_value=np.nan)
+        has_percentile = ~np.isnan(percentiles)
+        if has_percentile.any() and len(late_times) > 0:
+            caps[has_percentile] = np.minimum(caps[has_percentile],
+                                              np.percentile(late_times, percentiles[has_percentile]))
+
+        # sum(min(延误, 上限)) = 小于上限的延误之和 + 上限 * 不小于上限的订单数量, 排序后每个上限为O(log n)
+        sorted_times = np.sort(late_times)
+        prefix_sums = np.concatenate(([0.0], np.cumsum(sorted_times)))
+        counts = np.searchsorted(sorted_times, caps, side="left")
+        over_times = prefix_sums[counts] + np.where(counts < len(sorted_times), caps, 0) * (len(sorted_times) - counts)
+
+        total_distance = sum(components.driver_distances.tolist())
+        variants["applied_cap"] = caps
+        variants["total_distance"] = total_distance
+        variants["total_over_time"] = over_times
+        variants["distance_term"] = total_distance / components.driver_num
+        variants["lateness_term"] = over_times * variants["lamda"].to_numpy(dtype=float) / 3600
+        variants["score"] = variants["distance_term"] + variants["lateness_term"]
+        if len(components.failed_order_ids) > 0:
+            variants["score"] = sys.maxsize
+        return variants
     
     
     @staticmethod
     def calculate_total_over_time(order_id_to_status_list: dict):
         '''
-        计算所有订单总的延误
+        计算所有订单总的延误, 有订单没有完成记录时返回sys.maxsize
+        '''
+        order_id_to_over_time, failed_order_ids = Evaluator.calculate_over_time_of_orders(order_id_to_status_list)
+        if len(failed_order_ids) > 0:
+            return sys.maxsize
+        return sum(order_id_to_over_time.values())
+
+
+    @staticmethod
+    def calculate_over_time_of_orders(order_id_to_status_list: dict):
+        '''
+        计算每个订单的延误(没有延误为0)
         Inputs:
         - order_id_to_status_list: dict, {order_id: status_info_list}, 
         output of history.get_order_status_history()
@@ -39,16 +147,15 @@ class Evaluator(object):
             "finished time": del_time,
             "order_id": order_id}     
         ]
+        Output: ({order_id: over_time}, 没有完成记录的订单id列表)
         '''
-        total_over_time = 0
+        order_id_to_over_time = {}
+        failed_order_ids = []
 
         # 订单完成时间和预估送达时间信息
         order_id_to_complete_time = {}
         order_id_to_committed_completion_time = {}
         
-        # 是否成功
-        failure_flag = False
-        
         for order_id, status_info_list in order_id_to_status_list.items():
             # 筛选出已经完成的订单
             selected_status_info_list = [status_info for status_info in status_info_list
@@ -56,7 +163,7 @@ class Evaluator(object):
 
             if len(selected_status_info_list) == 0:
                 logger.error(f"order {order_id} has no history of completion status")
-                failure_flag = True
+                failed_order_ids.append(order_id)
                 continue
             
             # 按照update time进行排序，计算order status变成completed的时间
@@ -66,17 +173,12 @@ class Evaluator(object):
             if order_id not in order_id_to_committed_completion_time:
                 order_id_to_committed_completion_time[order_id] = selected_status_info_list[0].get("committed_completion_time")
             
-        if failure_flag:
-            return sys.maxsize
-
-        # 计算延误总时间
+        # 计算每个订单的延误时间
         for order_id, order_complete_time in order_id_to_complete_time.items():
             committed_completion_time = order_id_to_committed_completion_time.get(order_id)
-            over_time = order_complete_time - committed_completion_time
-            if over_time > 0:
-                total_over_time += over_time
+            order_id_to_over_time[order_id] = max(order_complete_time - committed_completion_time, 0)
 
-        return total_over_time
+        return order_id_to_over_time, failed_order_ids
     
     
     @staticmethod
@@ -87,10 +189,16 @@ class Evaluator(object):
         - driver_id_node_list: {driver_id: [visiting nodes]}
         - route_map: Map类
         '''
-        total_distance = 0
-        if not driver_id_to_node_list:
-            return total_distance
+        return sum(Evaluator.calculate_distance_of_drivers(driver_id_to_node_list, route_map).values())
+
 
+    @staticmethod
+    def calculate_distance_of_drivers(driver_id_to_node_list: dict, route_map):
+        '''
+        计算每个骑手的路线长度
+        Output: {driver_id: distance}
+        '''
+        driver_id_to_distance = {}
         for driver_id, nodes in driver_id_to_node_list.items():
             # driver访问过地点的id集合
             travel_location_list = []
@@ -98,10 +206,10 @@ class Evaluator(object):
                 travel_location_list.append(node['location_id'])
             
             distance = calculate_traveling_distance_of_routes(travel_location_list, route_map)
-            total_distance += distance
-            logger.info(f"Traveling Distance of driver {driver_id} is {distance: .3f}, "
-                        f"visited node list: {len(travel_location_list)}")
-        return total_distance
+            driver_id_to_distance[driver_id] = distance
+            logger.info("Traveling Distance of driver %s is % .3f, visited node list: %d",
+                        driver_id, distance, len(travel_location_list))
+        return driver_id_to_distance
 
     
 def calculate_traveling_distance_of_routes(location_id_list, route_map):
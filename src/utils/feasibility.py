@@ -0,0 +1,217 @@
+from src.common.node import Node
+from src.utils.logging_engine import logger
+
+
+'''
+派单结果的可行性规则, 模拟器的Checker和派单算法共用(check_pickup_before_delivery只用于派单算法)
+每个规则返回错误信息, 可行时返回""; 不输出日志, 由调用者决定日志级别
+路线: [destination] + planned_route, 每个节点先送货后取货(与Checker的载重计算相同)
+'''
+
+
+def check_destination(returned_destination, driver):
+    '''
+    目的地一旦确定不可更改(地点和到达时间); 不在任何地点的骑手必须有目的地
+    '''
+    origin_destination = driver.destination
+    if origin_destination is not None:
+        if returned_destination is None:
+            return (f"driver {driver.id}, returned destination is None, "
+                    f"however the origin destination is not None.")
+        # 下一个目的地一旦确认，不可更改，车辆不处于停车状态
+        if origin_destination.id != returned_destination.id:
+            return (f"driver {driver.id}, returned destination id is {returned_destination.id}, "
+                    f"however the origin destination id is {origin_destination.id}.")
+        if origin_destination.arrive_time != returned_destination.arrive_time:
+            return (f"driver {driver.id}, arrive time of returned destination is "
+                    f"{returned_destination.arrive_time}, "
+                    f"however the arrive time of origin destination is "
+                    f"{origin_destination.arrive_time}.")
+    elif len(driver.current_location_id) == 0 and returned_destination is None:
+        return (f"Currently, driver {driver.id} is not in the location(current_location_id==''), "
+                f"however, returned destination is also None, we cannot locate the driver.")
+    return ""
+
+
+def check_capacity(route: list, carrying_orders: list, capacity):
+    '''
+    载重约束: 剩余容量 = capacity - 正在配送的订单, 送货增加, 取货减少, 始终在[0, capacity]内
+    '''
+    left_capacity = capacity
+    for order in carrying_orders:
+        left_capacity -= order.demand
+        if left_capacity < 0:
+            return f"left capacity {left_capacity} < 0"
+
+    for node in route:
+        for order in node.delivery_orders:
+            left_capacity += order.demand
+            if left_capacity > capacity:
+                return f"left capacity {left_capacity} > capacity {capacity}"
+        for order in node.pickup_orders:
+            left_capacity -= order.demand
+            if left_capacity < 0:
+                return f"left capacity {left_capacity} < 0"
+    return ""
+
+
+def check_duplicate_orders(route: list, carrying_orders: list):
+    '''
+    正在配送的订单和路线中取货的订单不能重复
+    '''
+    order_ids = set()
+    for order in carrying_orders:
+        if order.id in order_ids:
+            return f"order {order.id}: duplicate order id"
+        order_ids.add(order.id)
+    for node in route:
+        for order in node.pickup_orders:
+            if order.id in order_ids:
+                return f"order {order.id}: duplicate order id"
+            order_ids.add(order.id)
+    return ""
+
+
+def check_order_locations(route: list):
+    '''
+    取货和送货的地点必须与订单的餐厅和顾客对应
+    '''
+    for node in route:
+        for order in node.pickup_orders:
+            if order.pickup_location_id != node.id:
+                return (f"Pickup location of order {order.id} is {order.pickup_location_id}, "
+                        f"however you allocate the driver to pickup this order in {node.id}")
+        for order in node.delivery_orders:
+            if order.delivery_location_id != node.id:
+                return (f"Delivery location of order {order.id} is {order.delivery_location_id}, "
+                        f"however you allocate the driver to delivery this order in {node.id}")
+    return ""
+
+
+def check_pickup_before_delivery(route: list, carrying_orders: list):
+    '''
+    送货的订单必须正在配送, 或者在路线中之前的节点已经取货, 且只送货一次
+    只用于派单算法的预检查和修复, 模拟器的Checker不检查这条规则
+    '''
+    on_board_order_ids = {order.id for order in carrying_orders}
+    for node in route:
+        for order in node.delivery_orders:
+            if order.id not in on_board_order_ids:
+                return f"order {order.id} is delivered in {node.id} before it is picked up"
+            on_board_order_ids.remove(order.id)
+        on_board_order_ids.update(order.id for order in node.pickup_orders)
+    return ""
+
+
+def get_route_violations(driver, destination, planned_route: list):
+    '''
+    检查一个骑手的派单结果
+    Output: 错误信息列表, 可行时为[]
+    '''
+    violations = [check_destination(destination, driver)]
+    route = ([destination] if destination is not None else []) + list(planned_route)
+    if len(route) > 0:
+        violations.append(check_capacity(route, driver.carrying_orders, driver.capacity))
+        violations.append(check_duplicate_orders(route, driver.carrying_orders))
+        violations.append(check_order_locations(route))
+        violations.append(check_pickup_before_delivery(route, driver.carrying_orders))
+    return [violation for violation in violations if violation]
+
+
+def repair_route(driver, destination, planned_route: list, id_to_location: dict):
+    '''
+    修复一个骑手的派单结果, 不可行的订单移出路线(留到下一次派单)
+    - 目的地: 恢复原目的地(地点和到达时间), 订单保留
+    - 取货: 地点不对应, 重复, 超过载重的订单不取货(同时删除送货)
+    - 送货: 地点不对应, 没有取货的订单不送货; 正在配送或已取货但没有送货的订单在路线最后送货
+    - 删除没有订单的节点(目的地除外), 合并相邻的相同地点
+    Output: (destination, planned_route, 移出路线的订单id列表)
+    '''
+    if driver.destination is not None and (destination is None or destination.id != driver.destination.id
+                                           or destination.arrive_time != driver.destination.arrive_time):
+        origin = driver.destination
+        location = id_to_location.get(origin.id)
+        destination = Node(origin.id, location.lat, location.lng, list(origin.pickup_orders),
+                           list(origin.delivery_orders), origin.arrive_time, origin.leave_time)
+    elif driver.destination is None and destination is None and len(planned_route) > 0:
+        destination, planned_route = planned_route[0], planned_route[1:]
+    route = ([destination] if destination is not None else []) + list(planned_route)
+
+    # 取货: 按顺序模拟载重
+    left_capacity = driver.capacity - sum(order.demand for order in driver.carrying_orders)
+    picked_order_ids = {order.id for order in driver.carrying_orders}
+    on_board_order_ids = set(picked_order_ids)
+    removed_order_ids = []
+    new_route = []
+    for node in route:
+        delivery_orders = []
+        for order in node.delivery_orders:
+            if order.id in on_board_order_ids and order.delivery_location_id == node.id:
+                delivery_orders.append(order)
+                on_board_order_ids.remove(order.id)
+                left_capacity += order.demand
+        pickup_orders = []
+        for order in node.pickup_orders:
+            if order.pickup_location_id != node.id or order.id in picked_order_ids or order.demand > left_capacity:
+                if order.id not in picked_order_ids:
+                    removed_order_ids.append(order.id)
+                continue
+            pickup_orders.append(order)
+            picked_order_ids.add(order.id)
+            on_board_order_ids.add(order.id)
+            left_capacity -= order.demand
+        new_route.append(Node(node.id, node.lat, node.lng, pickup_orders, delivery_orders, node.arrive_time,
+                              node.leave_time))
+
+    # 没有送货的订单在路线最后送货(按取货顺序)
+    for order in list(driver.carrying_orders) + [order for node in new_route for order in node.pickup_orders]:
+        if order.id in on_board_order_ids:
+            location = id_to_location.get(order.delivery_location_id)
+            new_route.append(Node(order.delivery_location_id, location.lat, location.lng, [], [order]))
+            on_board_order_ids.remove(order.id)
+
+    # 删除空节点, 合并相邻的相同地点
+    repaired_route = []
+    for index, node in enumerate(new_route):
+        is_destination = index == 0 and destination is not None
+        if not is_destination and len(node.pickup_orders) == 0 and len(node.delivery_orders) == 0:
+            continue
+        if len(repaired_route) > 0 and repaired_route[-1].id == node.id:
+            repaired_route[-1].delivery_orders.extend(node.delivery_orders)
+            repaired_route[-1].pickup_orders.extend(node.pickup_orders)
+            continue
+        repaired_route.append(node)
+    for node in repaired_route:
+        node.update_service_time()
+
+    # 有目的地时第一个节点为目的地
+    if len(repaired_route) > 0:
+        return repaired_route[0], repaired_route[1:], removed_order_ids
+    return None, [], removed_order_ids
+
+
+def repair_dispatch_result(id_to_driver: dict, driver_id_to_destination: dict, driver_id_to_planned_route: dict,
+                           id_to_location: dict):
+    '''
+    派单算法输出前检查所有骑手的派单结果, 只修复不可行的骑手, 可行的结果保持不变
+    Output: driver_id_to_destination, driver_id_to_planned_route
+    '''
+    repaired_driver_num = 0
+    removed_order_num = 0
+    for driver_id, driver in id_to_driver.items():
+        destination = driver_id_to_destination.get(driver_id)
+        planned_route = driver_id_to_planned_route.get(driver_id) or []
+        violations = get_route_violations(driver, destination, planned_route)
+        if len(violations) == 0:
+            continue
+        logger.warning(f"Repair the route of driver {driver_id}: {'; '.join(violations)}")
+        destination, planned_route, removed_order_ids = repair_route(driver, destination, planned_route,
+                                                                     id_to_location)
+        driver_id_to_destination[driver_id] = destination
+        driver_id_to_planned_route[driver_id] = planned_route
+        repaired_driver_num += 1
+        removed_order_num += len(removed_order_ids)
+    if repaired_driver_num > 0:
+        logger.warning(f"Repaired {repaired_driver_num} drivers, {removed_order_num} orders are left for the next "
+                       f"dispatch")
+    return driver_id_to_destination, driver_id_to_planned_route
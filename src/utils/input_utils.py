@@ -1,18 +1,23 @@
-import datetime
-import time
+import hashlib
+import os
+import pickle
+
 import pandas as pd
 
 from src.common.restaurant import Restaurant
 from src.common.customer import Customer
 from src.common.order import Order
-from src.common.route import Map
+from src.common.route import Map, LazyMap
+from src.common.road_network import RoadNetworkMap
 from src.common.route import RouteInfo
 from src.common.driver import Driver
 from src.configuration.config import Configs
 from src.utils.logging_engine import logger
+from src.utils.time_utils import combine_date_and_time
 
 def get_initial_data(data_file_path:str, driver_info_file_path:str, route_info_file_path:str,
-                        customer_location_info_file_path:str, restaurant_location_info_file_path:str, initial_time:str):
+                        customer_location_info_file_path:str, restaurant_location_info_file_path:str, initial_time:str,
+                        route_map=None):
     '''
     获取模拟器的输入数据, 包括订单, 骑手, 地图, 餐厅和顾客地点等
     Inputs:
@@ -22,6 +27,7 @@ def get_initial_data(data_file_path:str, driver_info_file_path:str, route_info_f
     - customer_location_info_file_path: 顾客数据文件路径
     - restaurant_location_info_file_path: 餐厅数据文件路径
     - initial_time: unix timestampe, 开始时间
+    - route_map: 可选, 已经加载的地图(e.g., 共享内存中的SharedMap), 为None时从route_info_file_path读取
     Output:
     - id_to_order: Dict {id: Order object}
     - id_to_driver: Dict {id: Driver object}
@@ -36,21 +42,114 @@ def get_initial_data(data_file_path:str, driver_info_file_path:str, route_info_f
     logger.info(f"Get {len(id_to_customer_location) + len(id_to_restaurant_location)} locations")
     
     # 获取地图信息
-    code_to_route = get_route_map(route_info_file_path)
-    logger.info(f"Get {len(code_to_route)} routes")
-    route_map = Map(code_to_route)
+    if route_map is None and Configs.ROUTE_MAP_MODE == "lazy":
+        route_map = LazyMap(id_to_location)
+        logger.info(f"Compute the routes between {len(id_to_location)} locations on demand")
+    elif route_map is None and Configs.ROUTE_MAP_MODE == "road":
+        route_map = get_road_network_map(Configs.road_edge_file_path, Configs.road_node_file_path, id_to_location,
+                                         list(id_to_restaurant_location.keys()))
+    elif route_map is None:
+        code_to_route = get_route_map(route_info_file_path)
+        logger.info(f"Get {len(code_to_route)} routes")
+        route_map = Map(code_to_route)
+        if Configs.ROUTE_FALLBACK_TO_HAVERSINE:
+            route_map.fallback_map = LazyMap(id_to_location)
     
     # 获取车辆信息
     id_to_driver = get_driver_info(driver_info_file_path)
     logger.info(f"Get {len(id_to_driver)} drivers")
     
-    # 获取订单信息
-    id_to_order = get_order_info(data_file_path, initial_time)
-    logger.info(f"Get {len(id_to_order)} orders")
+    # 获取订单信息, stream, socket, file模式下订单由订单来源(order_source.py)在模拟过程中读取
+    if Configs.ORDER_SOURCE_MODE != "memory":
+        id_to_order = {}
+    else:
+        id_to_order = get_order_info(data_file_path, initial_time)
+        logger.info(f"Get {len(id_to_order)} orders")
     
     return id_to_order, id_to_driver, route_map, id_to_restaurant_location, id_to_location
 
 
+def get_initial_data_with_cache(data_file_path:str, driver_info_file_path:str, route_info_file_path:str,
+                                customer_location_info_file_path:str, restaurant_location_info_file_path:str,
+                                initial_time:int, route_map=None):
+    '''
+    与get_initial_data相同, 但是会把编译好的初始化数据保存为快照(pickle), 文件内容和开始时间不变时直接读取快照
+    快照保存在 Output/cache/instance_{digest}.pkl
+    传入route_map时, 快照中不包含地图(地图由调用者提供)
+    快照的key包含src/common和src/utils的代码(订单, 司机, 地图的类和读取函数), 代码修改后旧的快照不再使用
+    '''
+    file_paths = [data_file_path, driver_info_file_path, customer_location_info_file_path,
+                  restaurant_location_info_file_path]
+    file_paths += get_source_file_paths([os.path.join(Configs.src_folder_path, "common"),
+                                         os.path.join(Configs.src_folder_path, "utils")])
+    if route_map is None and Configs.ROUTE_MAP_MODE == "lazy":
+        digest = get_content_digest(file_paths, initial_time, "lazy", Configs.DRIVER_SPEED, Configs.ROUTE_CACHE_SIZE)
+    elif route_map is None and Configs.ROUTE_MAP_MODE == "road":
+        digest = get_content_digest(file_paths + [Configs.road_edge_file_path, Configs.road_node_file_path],
+                                    initial_time, "road", Configs.DRIVER_SPEED, Configs.ROAD_TREE_CACHE_SIZE)
+    elif route_map is None:
+        digest = get_content_digest(file_paths + [route_info_file_path], initial_time,
+                                    Configs.ROUTE_FALLBACK_TO_HAVERSINE)
+    else:
+        digest = get_content_digest(file_paths, initial_time, "without_route_map")
+    if Configs.ORDER_SOURCE_MODE != "memory":
+        digest = get_content_digest([], digest, "without_orders")
+    snapshot_file_path = os.path.join(Configs.cache_folder, f"instance_{digest}.pkl")
+
+    if os.path.exists(snapshot_file_path):
+        with open(snapshot_file_path, "rb") as fd:
+            initial_data = pickle.load(fd)
+        logger.info(f"Load the instance snapshot {snapshot_file_path}")
+        return initial_data if route_map is None else __replace_route_map(initial_data, route_map)
+
+    initial_data = get_initial_data(data_file_path, driver_info_file_path, route_info_file_path,
+                                    customer_location_info_file_path, restaurant_location_info_file_path, initial_time,
+                                    route_map)
+    if not os.path.exists(Configs.cache_folder):
+        os.makedirs(Configs.cache_folder)
+    with open(snapshot_file_path, "wb") as fd:
+        pickle.dump(initial_data if route_map is None else __replace_route_map(initial_data, None), fd,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    logger.info(f"Save the instance snapshot {snapshot_file_path}")
+    return initial_data
+
+
+def __replace_route_map(initial_data: tuple, route_map):
+    '''
+    替换初始化数据中的route_map(get_initial_data输出的第3项)
+    '''
+    id_to_order, id_to_driver, _, id_to_restaurant_location, id_to_location = initial_data
+    return id_to_order, id_to_driver, route_map, id_to_restaurant_location, id_to_location
+
+
+def get_content_digest(file_paths: list, *extra_keys):
+    '''
+    根据文件内容和其他参数计算哈希值, 作为缓存的key
+    '''
+    sha = hashlib.sha1()
+    for file_path in file_paths:
+        with open(file_path, "rb") as fd:
+            for chunk in iter(lambda: fd.read(1 << 20), b""):
+                sha.update(chunk)
+    for key in extra_keys:
+        sha.update(str(key).encode())
+    return sha.hexdigest()
+
+
+def get_source_file_paths(folder_paths: list):
+    '''
+    文件夹(包括子文件夹)中所有的.py文件, 按路径排序, 用于在缓存的key中包含代码的版本
+    '''
+    file_paths = []
+    for folder_path in folder_paths:
+        for dir_path, dir_names, file_names in os.walk(folder_path):
+            dir_names[:] = sorted(dir_name for dir_name in dir_names if dir_name != "__pycache__"
+                                  and os.path.join(dir_path, dir_name) != Configs.output_folder)
+            file_paths += [os.path.join(dir_path, file_name) for file_name in sorted(file_names)
+                           if file_name.endswith(".py")]
+    return file_paths
+
+
 def get_customer_info(file_path: str):
     '''
     获取顾客信息
@@ -101,40 +200,39 @@ def get_order_info(file_path: str, ini_time: int):
     id_to_order = {}
     for index, row in order_df.iterrows():
         # 读取每个订单信息
-        order_id = str(row['order_id'])
-        pickup_id = str(row['pickup_id']).strip()
-        delivery_id = str(row['delivery_id']).strip()
-        demand = float(row['demand'])
-        load_time = int(row['load_time']) # restaurant pickup time
-        unload_time = int(row['unload_time']) # customer delivery time
-        
-        # 开始的时间
-        ini_datetime = datetime.datetime.fromtimestamp(ini_time)
-        
-        # 结合date和time
-        creation_datetime = datetime.datetime.combine(
-            ini_datetime.date(), datetime.datetime.strptime(row['creation_time'], '%H:%M:%S').time())
-        creation_time = time.mktime(creation_datetime.timetuple())
-        
-        committed_completion_datetime = datetime.datetime.combine(
-            ini_datetime.date(), datetime.datetime.strptime(row['committed_completion_time'], '%H:%M:%S').time())
-        committed_completion_time = time.mktime(committed_completion_datetime.timetuple())
-        
-        # 不清楚其功能
-        if committed_completion_time < creation_time:
-            committed_completion_time += Configs.A_DAY_TIME_SECONDS
-        
-        order = Order(order_id, demand, order_restaurant_id=pickup_id, order_customer_id=delivery_id, 
-                      creation_time=int(creation_time), committed_completion_time=int(committed_completion_time),
-                      load_time=load_time, unload_time=unload_time)
+        order = get_order_from_row(row, ini_time)
 
         # 添加订单至id_to_order Dict
-        if order_id not in id_to_order:
-            id_to_order[order_id] = order
+        if order.id not in id_to_order:
+            id_to_order[order.id] = order
 
     return id_to_order
 
 
+def get_order_from_row(row, ini_time: int):
+    '''
+    订单信息表的一行转换成Order, 创建时间和承诺送达时间为ini_time所在的日期
+    '''
+    order_id = str(row['order_id'])
+    pickup_id = str(row['pickup_id']).strip()
+    delivery_id = str(row['delivery_id']).strip()
+    demand = float(row['demand'])
+    load_time = int(row['load_time']) # restaurant pickup time
+    unload_time = int(row['unload_time']) # customer delivery time
+    
+    # 结合模拟开始的日期和time
+    creation_time = combine_date_and_time(ini_time, row['creation_time'])
+    committed_completion_time = combine_date_and_time(ini_time, row['committed_completion_time'])
+    
+    # 承诺送达时间跨过了0点
+    if committed_completion_time < creation_time:
+        committed_completion_time += Configs.A_DAY_TIME_SECONDS
+    
+    return Order(order_id, demand, order_restaurant_id=pickup_id, order_customer_id=delivery_id,
+                 creation_time=int(creation_time), committed_completion_time=int(committed_completion_time),
+                 load_time=load_time, unload_time=unload_time)
+
+
 def get_route_map(file_path: str):
     '''
     获取路网信息, 路线的距离和时间
@@ -155,6 +253,18 @@ def get_route_map(file_path: str):
     return code_to_route
 
 
+def get_road_network_map(edge_file_path: str, node_file_path: str, id_to_location: dict,
+                         precompute_location_ids: list):
+    '''
+    读取路网, 创建RoadNetworkMap
+    - edge file: ['start_node_id', 'end_node_id', 'distance', 'time', 'oneway'(可选)]
+    - node file: ['node_id', 'latitude', 'longitude']
+    '''
+    edge_df = pd.read_csv(edge_file_path)
+    node_df = pd.read_csv(node_file_path)
+    return RoadNetworkMap(edge_df, node_df, id_to_location, precompute_location_ids)
+
+
 def get_driver_info(file_path: str):
     '''
     获取骑手信息
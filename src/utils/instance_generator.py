@@ -0,0 +1,147 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.configuration.config import Configs
+from src.utils.logging_engine import logger
+from src.utils.tools import haversine_distance
+
+
+# 默认每小时订单强度(6点到22点), 午餐和晚餐高峰
+DEFAULT_HOURLY_WEIGHTS = {6: 0.5, 7: 1, 8: 1.5, 9: 1.5, 10: 2, 11: 4, 12: 5, 13: 3, 14: 1.5, 15: 1, 16: 1.5,
+                          17: 3, 18: 5, 19: 4, 20: 2, 21: 1}
+
+# 默认地点范围的中心(与Benchmark中的地点一致)
+DEFAULT_CENTER = (1.33, 103.80)
+
+
+def generate_instance(folder_path: str, instance: str, order_num: int, driver_num: int, customer_num: int,
+                      restaurant_num: int, hourly_weights=None, arrival_intensity=1.0, capacity=10,
+                      delivery_minutes=45, radius_km=4.0, seed=0):
+    '''
+    生成与get_initial_data兼容的测试例, 可以指定规模和订单到达强度
+    输出文件(与Benchmark文件夹结构一致):
+    - folder_path/customer_info.csv, restaurant_info.csv, route_info.csv
+    - folder_path/instance/driver_info.csv, instance/{instance}.csv
+    Inputs:
+    - folder_path: 输出文件夹
+    - instance: 测试例名称(文件夹名)
+    - order_num: 订单数量(arrival_intensity = 1时)
+    - driver_num, customer_num, restaurant_num: 骑手, 顾客, 餐厅数量
+    - hourly_weights: dict, {hour: weight}, 订单在各小时的分布
+    - arrival_intensity: 订单强度系数, 订单数量 = order_num * arrival_intensity
+    - capacity: 骑手容量
+    - delivery_minutes: 承诺送达时间(分钟)
+    - radius_km: 地点分布的半径
+    - seed: 随机种子
+    '''
+    rng = np.random.default_rng(seed)
+    if hourly_weights is None:
+        hourly_weights = DEFAULT_HOURLY_WEIGHTS
+
+    instance_folder_path = os.path.join(folder_path, instance)
+    if not os.path.exists(instance_folder_path):
+        os.makedirs(instance_folder_path)
+
+    # 地点
+    restaurant_df = __generate_restaurants(restaurant_num, radius_km, rng)
+    customer_df = __generate_customers(customer_num, radius_km, rng)
+    restaurant_df.to_csv(os.path.join(folder_path, Configs.restaurant_info_file), index=False)
+    customer_df.to_csv(os.path.join(folder_path, Configs.customer_info_file), index=False)
+
+    # 路线
+    location_ids = list(restaurant_df["restaurant_id"]) + list(customer_df["customer_id"])
+    lats = np.concatenate([restaurant_df["latitude"].to_numpy(), customer_df["latitude"].to_numpy()])
+    lngs = np.concatenate([restaurant_df["longitude"].to_numpy(), customer_df["longitude"].to_numpy()])
+    route_df = __generate_routes(location_ids, lats, lngs)
+    route_df.to_csv(os.path.join(folder_path, Configs.route_info_file), index=False)
+
+    # 骑手
+    driver_df = pd.DataFrame({"car_num": [f"D_{i + 1}" for i in range(driver_num)],
+                              "capacity": capacity,
+                              "operation_time": 24,
+                              "gps_id": [f"G_{i + 1}" for i in range(driver_num)]})
+    driver_df.to_csv(os.path.join(instance_folder_path, "driver_info.csv"), index=False)
+
+    # 订单
+    order_df = __generate_orders(int(order_num * arrival_intensity), hourly_weights, list(restaurant_df["restaurant_id"]),
+                                 list(customer_df["customer_id"]), delivery_minutes, rng)
+    order_df.to_csv(os.path.join(instance_folder_path, f"{instance}.csv"), index=False)
+
+    logger.info(f"Generate {instance}: {len(order_df)} orders, {driver_num} drivers, {customer_num} customers, "
+                f"{restaurant_num} restaurants, {len(route_df)} routes")
+    return instance_folder_path
+
+
+def __generate_restaurants(restaurant_num: int, radius_km: float, rng):
+    lats, lngs = __random_coordinates(restaurant_num, radius_km / 2, rng)
+    return pd.DataFrame({"restaurant_id": [f"Restaurant_{i + 1}" for i in range(restaurant_num)],
+                         "latitude": lats,
+                         "longitude": lngs,
+                         "dispatch_radius": 5,
+                         "customer_radius": 5,
+                         "wait_time": 120})
+
+
+def __generate_customers(customer_num: int, radius_km: float, rng):
+    lats, lngs = __random_coordinates(customer_num, radius_km, rng)
+    return pd.DataFrame({"customer_id": [f"{100000 + i} Synthetic" for i in range(customer_num)],
+                         "latitude": lats,
+                         "longitude": lngs})
+
+
+def __random_coordinates(num: int, radius_km: float, rng):
+    '''
+    在DEFAULT_CENTER附近半径radius_km的圆内均匀生成坐标
+    '''
+    radius = radius_km / 111.0 * np.sqrt(rng.random(num))
+    angle = rng.random(num) * 2 * np.pi
+    return DEFAULT_CENTER[0] + radius * np.sin(angle), DEFAULT_CENTER[1] + radius * np.cos(angle)
+
+
+def __generate_routes(location_ids: list, lats, lngs):
+    '''
+    所有地点两两之间的路线(单向, Map会查询两个方向), 距离为haversine距离, 时间 = 距离 / Configs.DRIVER_SPEED
+    '''
+    start_index, end_index = np.triu_indices(len(location_ids), k=1)
+    distance = haversine_distance(lats[start_index], lngs[start_index], lats[end_index], lngs[end_index])
+    location_ids = np.array(location_ids, dtype=object)
+    start_ids = location_ids[start_index]
+    end_ids = location_ids[end_index]
+    return pd.DataFrame({"route_code": start_ids + "-" + end_ids,
+                         "start_location_id": start_ids,
+                         "end_location_id": end_ids,
+                         "distance": np.round(distance, 3),
+                         "time": (distance * 3600 / Configs.DRIVER_SPEED).astype(int)})
+
+
+def __generate_orders(order_num: int, hourly_weights: dict, restaurant_ids: list, customer_ids: list,
+                      delivery_minutes: int, rng):
+    '''
+    按照每小时的权重生成订单的创建时间, 随机选择餐厅和顾客
+    '''
+    hours = np.array(list(hourly_weights.keys()))
+    weights = np.array(list(hourly_weights.values()), dtype=float)
+    hour_order_num = rng.multinomial(order_num, weights / weights.sum())
+
+    creation_seconds = np.concatenate([hour * 3600 + rng.integers(0, 3600, num)
+                                       for hour, num in zip(hours, hour_order_num)])
+    creation_seconds.sort()
+    committed_seconds = np.minimum(creation_seconds + delivery_minutes * 60, Configs.A_DAY_TIME_SECONDS - 1)
+
+    creation_times = [__seconds_to_str(int(second)) for second in creation_seconds]
+    return pd.DataFrame({"order_id": [creation_time.replace(":", "") + f"{index:05d}"
+                                      for index, creation_time in enumerate(creation_times)],
+                         "demand": 1,
+                         "creation_time": creation_times,
+                         "committed_completion_time": [__seconds_to_str(int(second)) for second in committed_seconds],
+                         "load_time": 60,
+                         "unload_time": 60,
+                         "pickup_id": rng.choice(restaurant_ids, order_num),
+                         "delivery_id": rng.choice(customer_ids, order_num)})
+
+
+def __seconds_to_str(seconds: int):
+    return str(datetime.timedelta(seconds=seconds)).zfill(8)
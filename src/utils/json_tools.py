@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import platform
@@ -70,6 +71,23 @@ def subprocess_function(cmd):
         sys.exit(-1)
 
 
+async def async_subprocess_function(cmd):
+    '''
+    异步调用算法, 等待算法运行时事件循环可以执行其他任务
+    Output: (算法运行时间, 算法返回值)
+    '''
+    start_time = time.time()
+    sub_process = await asyncio.create_subprocess_shell(cmd, stdout=asyncio.subprocess.PIPE)
+    try:
+        # 设置超时
+        stdout, _ = await asyncio.wait_for(sub_process.communicate(), Configs.MAX_RUNTIME_OF_ALGORITHM)
+    except asyncio.TimeoutError:
+        sub_process.kill()
+        logger.error("The algorithm exceeds the maximum running time %s seconds", Configs.MAX_RUNTIME_OF_ALGORITHM)
+        sys.exit(-1)
+    return time.time() - start_time, stdout.decode()
+
+
 """ IO"""
 
 
@@ -88,20 +106,51 @@ def write_json_to_file(file_name, data):
 """ create the input of the algorithm (output json of simulation)"""
 
 
-def convert_input_info_to_json_files(input_info):
+def convert_input_info_to_json_files(input_info, order_id_to_serialized_order=None):
     '''
     输出input_info数据到input.json
+    Inputs:
+    - input_info: 骑手和订单信息
+    - order_id_to_serialized_order: 可选, 订单不变属性的序列化缓存(见pre_serialize_orders), 为None时不使用缓存
     '''
     driver_info_list = __get_driver_info_list(input_info.id_to_driver)
     write_json_to_file(Configs.algorithm_driver_input_info_path, driver_info_list)
 
-    unallocated_orders = convert_dict_to_list(input_info.id_to_unallocated_order)
+    if order_id_to_serialized_order is None:
+        unallocated_orders = convert_dict_to_list(input_info.id_to_unallocated_order)
+        ongoing_orders = convert_dict_to_list(input_info.id_to_ongoing_order)
+    else:
+        unallocated_orders = __convert_orders_to_list(input_info.id_to_unallocated_order, order_id_to_serialized_order)
+        ongoing_orders = __convert_orders_to_list(input_info.id_to_ongoing_order, order_id_to_serialized_order)
     write_json_to_file(Configs.algorithm_unallocated_orders_input_path, unallocated_orders)
-
-    ongoing_orders = convert_dict_to_list(input_info.id_to_ongoing_order)
     write_json_to_file(Configs.algorithm_ongoing_orders_input_path, ongoing_orders)
 
 
+def pre_serialize_orders(orders: list, order_id_to_serialized_order: dict):
+    '''
+    序列化订单的属性, 结果存到order_id_to_serialized_order中; delivery_state会改变, 只保留key的位置, 输出时重新读取
+    '''
+    for order in orders:
+        if order is None or order.id in order_id_to_serialized_order:
+            continue
+        d = order.__dict__
+        order_id_to_serialized_order[order.id] = {key: None if key == "delivery_state" else d[key] for key in d
+                                                  if "__" not in key}
+
+
+def __convert_orders_to_list(id_to_order: dict, order_id_to_serialized_order: dict):
+    '''
+    与convert_dict_to_list的输出相同(包括key的顺序), 不变的属性从缓存中读取, delivery_state每次重新读取
+    '''
+    pre_serialize_orders(id_to_order.values(), order_id_to_serialized_order)
+    _list = []
+    for order_id, order in id_to_order.items():
+        order_dict = dict(order_id_to_serialized_order.get(order.id))
+        order_dict["delivery_state"] = order.delivery_state
+        _list.append(order_dict)
+    return _list
+
+
 def __get_driver_info_list(id_to_driver: dict):
     '''
     获取每个骑手的信息, 输出一个列表, 每个元素为一个python dict
@@ -129,7 +178,10 @@ def __convert_driver_to_dict(driver):
         "arrive_time_at_current_location": driver.arrive_time_at_current_location,
         "leave_time_at_current_location": driver.leave_time_at_current_location,
         "carrying_orders": [order.id for order in carrying_orders],
-        "destination": __convert_destination_to_dict(driver.destination)
+        "destination": __convert_destination_to_dict(driver.destination),
+        "state": driver.state,
+        "next_free_time": driver.next_free_time,
+        "next_free_location_id": driver.next_free_location_id
     }
     return driver_property
 
@@ -197,9 +249,8 @@ def get_driver_instance_dict(driver_infos: list, id_to_order: dict, id_to_locati
         leave_time_at_current_location = driver_info.get("leave_time_at_current_location")
         update_time = driver_info.get("update_time")
 
-        logger.debug(f"Get driver {driver_id} instance from json, "
-                     f"order id list = {len(carrying_order_id_list)},"
-                     f"order list = {len(carrying_orders)}")
+        logger.debug("Get driver %s instance from json, order id list = %d,order list = %d",
+                     driver_id, len(carrying_order_id_list), len(carrying_orders))
         
         # 添加新的骑手信息到id_to_driver dict中
         if driver_id not in id_to_driver:
@@ -207,6 +258,12 @@ def get_driver_instance_dict(driver_infos: list, id_to_order: dict, id_to_locati
             driver.destination = destination
             driver.set_cur_position_info(current_location_id, update_time,
                                           arrive_time_at_current_location, leave_time_at_current_location)
+            # 骑手状态由模拟器计算(包括计划路线的完成时间), 没有时只根据目的地计算
+            driver.update_state(update_time)
+            if "state" in driver_info:
+                driver.state = driver_info.get("state")
+                driver.next_free_time = driver_info.get("next_free_time")
+                driver.next_free_location_id = driver_info.get("next_free_location_id")
             id_to_driver[driver_id] = driver
     
     return id_to_driver
@@ -0,0 +1,234 @@
+import os
+import pickle
+
+import numpy as np
+
+from src.configuration.config import Configs
+from src.utils.input_utils import get_content_digest, get_customer_info, get_restaurant_info
+from src.utils.logging_engine import logger
+from src.utils.tools import haversine_distance
+
+
+class LocationIndex(object):
+    def __init__(self, location_ids: list, knn_indexes, knn_distances, restaurant_id_to_clusters: dict,
+                 cluster_levels: list):
+        '''
+        地点的近邻和聚类索引, 由build_location_index创建
+        Inputs:
+        - location_ids: 所有地点(顾客和餐厅)的id, 与数组的下标对应
+        - knn_indexes, knn_distances: (n, k) 每个地点最近的k个地点(包括自身)的下标和距离(km), 按距离升序
+        - restaurant_id_to_clusters: {restaurant_id: (配送范围内的顾客id列表, (顾客数, 层数)的聚类标签)}
+        - cluster_levels: 每层聚类的直径上限(km), 升序
+        '''
+        self.location_ids = list(location_ids)
+        self.location_id_to_index = {location_id: index for index, location_id in enumerate(self.location_ids)}
+        self.knn_indexes = knn_indexes
+        self.knn_distances = knn_distances
+        self.restaurant_id_to_clusters = restaurant_id_to_clusters
+        self.cluster_levels = list(cluster_levels)
+
+        # {restaurant_id: {customer_id: 顾客在聚类标签中的行}}
+        self.__restaurant_id_to_customer_rows = {
+            restaurant_id: {customer_id: row for row, customer_id in enumerate(customer_ids)}
+            for restaurant_id, (customer_ids, _) in restaurant_id_to_clusters.items()}
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("location_id_to_index", None)
+        state.pop("_LocationIndex__restaurant_id_to_customer_rows", None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__init__(state["location_ids"], state["knn_indexes"], state["knn_distances"],
+                      state["restaurant_id_to_clusters"], state["cluster_levels"])
+
+
+    def contains(self, location_ids):
+        return all(location_id in self.location_id_to_index for location_id in location_ids)
+
+
+    def get_neighbors(self, location_id: str, max_distance=None):
+        '''
+        Output: [(location_id, distance)], 最近的k个地点(包括自身), 按距离升序; max_distance不为None时只包括该距离内的地点
+        '''
+        index = self.location_id_to_index[location_id]
+        neighbors = []
+        for neighbor_index, distance in zip(self.knn_indexes[index], self.knn_distances[index]):
+            if max_distance is not None and distance > max_distance:
+                break
+            neighbors.append((self.location_ids[neighbor_index], float(distance)))
+        return neighbors
+
+
+    def covers(self, location_ids: list, max_distance: float):
+        '''
+        每个地点的k近邻是否包括了max_distance内的所有地点(第k个近邻的距离大于max_distance)
+        '''
+        if self.knn_indexes.shape[1] == len(self.location_ids):
+            return True
+        indexes = [self.location_id_to_index[location_id] for location_id in location_ids]
+        return bool((self.knn_distances[indexes, -1] > max_distance).all())
+
+
+    def get_neighbor_matrix(self, location_ids: list, max_distance: float):
+        '''
+        地点两两之间是否在max_distance内(只检查k近邻, O(m * k)), 一个地点在另一个地点的k近邻中即可
+        Output: (m, m) bool矩阵, 对称
+        '''
+        indexes = np.array([self.location_id_to_index[location_id] for location_id in location_ids], dtype=int)
+        neighbor_indexes = np.where(self.knn_distances[indexes] <= max_distance, self.knn_indexes[indexes], -1)
+        is_neighbor = (neighbor_indexes[:, :, None] == indexes[None, None, :]).any(axis=1)
+        return is_neighbor | is_neighbor.T | (indexes[:, None] == indexes[None, :])
+
+
+    def get_cluster_level(self, max_distance: float):
+        '''
+        直径上限不超过max_distance的最高一层(同一聚类的顾客两两距离不超过max_distance), 没有时返回None
+        '''
+        levels = [level for level, diameter in enumerate(self.cluster_levels) if diameter <= max_distance]
+        return levels[-1] if levels else None
+
+
+    def get_cluster_matrix(self, restaurant_id: str, customer_ids: list, level: int):
+        '''
+        顾客两两之间是否在餐厅配送范围内第level层的同一个聚类中, 不在范围内的顾客只与自身在同一个聚类
+        Output: (m, m) bool矩阵, 对称
+        '''
+        _, labels = self.restaurant_id_to_clusters.get(restaurant_id, ([], None))
+        customer_rows = self.__restaurant_id_to_customer_rows.get(restaurant_id, {})
+        rows = [customer_rows.get(customer_id) for customer_id in customer_ids]
+        cluster_labels = np.array([labels[row, level] if row is not None else -1 - index
+                                   for index, row in enumerate(rows)], dtype=int)
+        return cluster_labels[:, None] == cluster_labels[None, :]
+
+
+    def get_cluster_members(self, restaurant_id: str, customer_id: str, level: int):
+        '''
+        餐厅配送范围内, 与顾客在第level层同一个聚类中的顾客id(包括自身), 顾客不在范围内时返回[]
+        '''
+        if restaurant_id not in self.restaurant_id_to_clusters:
+            return []
+        customer_ids, labels = self.restaurant_id_to_clusters[restaurant_id]
+        row = self.__restaurant_id_to_customer_rows[restaurant_id].get(customer_id)
+        if row is None:
+            return []
+        return [customer_ids[member] for member in np.flatnonzero(labels[:, level] == labels[row, level])]
+
+
+def build_location_index(id_to_customer: dict, id_to_restaurant: dict, k=None, cluster_levels=None,
+                         cluster_radius=None):
+    '''
+    Inputs:
+    - id_to_customer, id_to_restaurant: {location_id: location}
+    - k: 每个地点的近邻数量, 默认Configs.LOCATION_INDEX_K
+    - cluster_levels: 每层聚类的直径上限(km), 默认Configs.LOCATION_CLUSTER_LEVELS
+    - cluster_radius: 餐厅的配送范围(km), 只对范围内的顾客聚类, 默认Configs.LOCATION_CLUSTER_RADIUS
+    Output: LocationIndex
+    '''
+    k = k or Configs.LOCATION_INDEX_K
+    cluster_levels = sorted(Configs.LOCATION_CLUSTER_LEVELS if cluster_levels is None else cluster_levels)
+    cluster_radius = Configs.LOCATION_CLUSTER_RADIUS if cluster_radius is None else cluster_radius
+
+    id_to_location = {**id_to_customer, **id_to_restaurant}
+    location_ids = list(id_to_location.keys())
+    lats = np.array([id_to_location.get(location_id).lat for location_id in location_ids])
+    lngs = np.array([id_to_location.get(location_id).lng for location_id in location_ids])
+    knn_indexes, knn_distances = __get_k_nearest_neighbors(lats, lngs, min(k, len(location_ids)))
+
+    customer_ids = list(id_to_customer.keys())
+    customer_lats = lats[:len(customer_ids)]
+    customer_lngs = lngs[:len(customer_ids)]
+    restaurant_id_to_clusters = {}
+    for restaurant_id, restaurant in id_to_restaurant.items():
+        distances = haversine_distance(restaurant.lat, restaurant.lng, customer_lats, customer_lngs)
+        rows = np.flatnonzero(distances <= cluster_radius)
+        pairwise_distances = haversine_distance(customer_lats[rows, None], customer_lngs[rows, None],
+                                                customer_lats[None, rows], customer_lngs[None, rows])
+        labels = __complete_linkage(pairwise_distances, cluster_levels)
+        restaurant_id_to_clusters[restaurant_id] = ([customer_ids[row] for row in rows], labels)
+    logger.info(f"Build the location index of {len(location_ids)} locations, k = {knn_indexes.shape[1]}, "
+                f"cluster levels: {cluster_levels} km")
+    return LocationIndex(location_ids, knn_indexes, knn_distances, restaurant_id_to_clusters, cluster_levels)
+
+
+def __get_k_nearest_neighbors(lats, lngs, k: int, block_size=1024):
+    '''
+    分块计算距离, 每行用argpartition选出最近的k个, 内存为O(block_size * n)
+    '''
+    location_num = len(lats)
+    knn_indexes = np.zeros((location_num, k), dtype=np.int32)
+    knn_distances = np.zeros((location_num, k))
+    for start in range(0, location_num, block_size):
+        end = min(start + block_size, location_num)
+        distances = haversine_distance(lats[start:end, None], lngs[start:end, None], lats[None, :], lngs[None, :])
+        if k < location_num:
+            candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(location_num), (end - start, 1))
+        candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+        order = np.argsort(candidate_distances, axis=1, kind="stable")
+        knn_indexes[start:end] = np.take_along_axis(candidates, order, axis=1)
+        knn_distances[start:end] = np.take_along_axis(candidate_distances, order, axis=1)
+    return knn_indexes, knn_distances
+
+
+def __complete_linkage(distances, levels: list):
+    '''
+    全连接层次聚类(Lance-Williams更新), 合并距离超过最大的层时停止
+    Output: (n, 层数)的聚类标签, 第l层每个聚类的直径不超过levels[l]
+    '''
+    location_num = len(distances)
+    labels = np.zeros((location_num, len(levels)), dtype=np.int32)
+    if location_num == 0:
+        return labels
+
+    distances = np.array(distances, dtype=float)
+    np.fill_diagonal(distances, np.inf)
+    cluster_ids = np.arange(location_num)
+    level = 0
+    while level < len(levels):
+        i, j = divmod(int(np.argmin(distances)), location_num)
+        merge_distance = distances[i, j]
+        while level < len(levels) and merge_distance > levels[level]:
+            labels[:, level] = np.unique(cluster_ids, return_inverse=True)[1]
+            level += 1
+        if level == len(levels):
+            break
+        # 合并j到i, 新聚类到其他聚类的距离为两者的最大值
+        merged_distances = np.maximum(distances[i], distances[j])
+        distances[i, :] = merged_distances
+        distances[:, i] = merged_distances
+        distances[j, :] = np.inf
+        distances[:, j] = np.inf
+        cluster_ids[cluster_ids == j] = i
+    return labels
+
+
+def get_location_index(customer_info_file_path=None, restaurant_info_file_path=None):
+    '''
+    读取(或创建并保存)地点索引, 按文件内容和参数的哈希值缓存在 Output/cache/location_index_{digest}.pkl
+    模拟器初始化时预先创建, 算法进程直接读取
+    '''
+    customer_info_file_path = customer_info_file_path or Configs.customer_info_file_path
+    restaurant_info_file_path = restaurant_info_file_path or Configs.restaurant_info_file_path
+    digest = get_content_digest([customer_info_file_path, restaurant_info_file_path], "location_index",
+                                Configs.LOCATION_INDEX_K, sorted(Configs.LOCATION_CLUSTER_LEVELS),
+                                Configs.LOCATION_CLUSTER_RADIUS)
+    index_file_path = os.path.join(Configs.cache_folder, f"location_index_{digest}.pkl")
+    if os.path.exists(index_file_path):
+        with open(index_file_path, "rb") as fd:
+            return pickle.load(fd)
+
+    location_index = build_location_index(get_customer_info(customer_info_file_path),
+                                          get_restaurant_info(restaurant_info_file_path))
+    if not os.path.exists(Configs.cache_folder):
+        os.makedirs(Configs.cache_folder)
+    # 先写临时文件再重命名, 并行的进程不会读到不完整的文件
+    temp_file_path = f"{index_file_path}.{os.getpid()}.tmp"
+    with open(temp_file_path, "wb") as fd:
+        pickle.dump(location_index, fd, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file_path, index_file_path)
+    logger.info(f"Save the location index {index_file_path}")
+    return location_index
@@ -12,6 +12,7 @@ def ini_logger(file_name, level='info'):
     delete_files(log_folder, Configs.MAX_LOG_FILE_NUM)
     log_file = os.path.join(log_folder, file_name)
     logger.add_file_output(log_file, level)
+    logger.set_tick_summary_mode(Configs.LOG_TICK_SUMMARY)
 
 
 def remove_file_handler_of_logging(file_name: str):
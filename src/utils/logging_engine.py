@@ -1,9 +1,35 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import sys
 
+from src.configuration.config import Configs
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    '''
+    调用线程只负责把日志放入队列, 时间戳和格式化在后台写线程中完成
+    '''
+    def prepare(self, record):
+        # 合并message和参数, 避免后台线程格式化时参数已经被修改
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
 
 class LoggingEngine:
-    def __init__(self, level="debug", contents=None, logger_name=None):
+    def __init__(self, level="debug", contents=None, logger_name=None, asynchronous=False):
+        '''
+        Inputs:
+        - level: 日志级别
+        - logger_name: logger名称
+        - asynchronous: True时所有handler都在后台线程中写日志(queue + QueueListener)
+        '''
         self.logging_level_dict = {
             "debug": logging.DEBUG,
             "info": logging.INFO,
@@ -26,16 +52,32 @@ class LoggingEngine:
         logger = logging.getLogger(logger_name)
         logger.setLevel(level=logging_level)
         formatter = logging.Formatter(logging_fmt)
+
+        self.queue = None
+        self.listener = None
+        # 后台写线程是否在运行
+        self.is_listening = False
         if not logger.handlers:
             handler = logging.StreamHandler(sys.stdout)
             handler.setFormatter(formatter)
-            logger.addHandler(handler)
+            if asynchronous:
+                self.queue = queue.Queue(-1)
+                self.listener = logging.handlers.QueueListener(self.queue, handler, respect_handler_level=True)
+                logger.addHandler(NonBlockingQueueHandler(self.queue))
+                self.listener.start()
+                self.is_listening = True
+                atexit.register(self.stop)
+            else:
+                logger.addHandler(handler)
 
         self.logger = logger
         self.logger_name = logger_name
         self.handlers = {}
         self.formatter = formatter
 
+        # 每个时间片只输出一条结构化的汇总日志, 时间片内的详细日志降为debug
+        self.tick_summary_mode = False
+
         self.import_log_funcs()
 
     def import_log_funcs(self):
@@ -50,11 +92,64 @@ class LoggingEngine:
             handler.setFormatter(self.formatter)
             handler.setLevel(self.logging_level_dict.get(level.lower(), logging.DEBUG))
             self.handlers[filename] = handler
-            self.logger.addHandler(handler)
+            if self.listener is not None:
+                self.listener.handlers = self.listener.handlers + (handler,)
+            else:
+                self.logger.addHandler(handler)
 
     def remove_file_handler(self, file_path):
         if file_path in self.handlers:
-            self.logger.removeHandler(self.handlers.get(file_path))
+            handler = self.handlers.pop(file_path)
+            if self.listener is not None:
+                # 先写完队列中的日志再移除
+                self.flush()
+                self.listener.handlers = tuple(h for h in self.listener.handlers if h is not handler)
+            else:
+                self.logger.removeHandler(handler)
+            handler.close()
+
+    def flush(self):
+        '''
+        等待后台线程写完队列中的日志
+        '''
+        if self.is_listening:
+            self.queue.join()
+        handlers = self.listener.handlers if self.listener is not None else self.logger.handlers
+        for handler in handlers:
+            handler.flush()
+
+    def stop(self):
+        '''
+        停止后台写线程, 队列中剩余的日志会被写完
+        '''
+        if self.is_listening:
+            self.listener.stop()
+            self.is_listening = False
+
+    def is_enabled_for(self, level: str):
+        '''
+        判断某个级别的日志是否会被输出, 用于避免在热点路径上拼接不会输出的字符串
+        '''
+        return self.logger.isEnabledFor(self.logging_level_dict.get(level.lower(), logging.DEBUG))
+
+    def set_tick_summary_mode(self, enabled: bool):
+        self.tick_summary_mode = enabled
+
+    def tick_detail(self, msg: str, *args):
+        '''
+        时间片内的详细日志, 汇总模式下降为debug
+        '''
+        if self.tick_summary_mode:
+            self.logger.debug(msg, *args, stacklevel=2)
+        else:
+            self.logger.info(msg, *args, stacklevel=2)
+
+    def tick_summary(self, cur_time: int, **fields):
+        '''
+        汇总模式下, 每个时间片输出一条结构化(json)日志
+        '''
+        if self.tick_summary_mode and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("TICK %s", json.dumps({"time": cur_time, **fields}), stacklevel=2)
 
     def debug(self, msg: str):
         pass
@@ -76,11 +171,12 @@ class LoggingEngine:
 
 
 logger = LoggingEngine(logger_name="glob_logging_engine",
-                       level="info")
+                       level="info",
+                       asynchronous=Configs.LOG_ASYNCHRONOUS)
 
 
 def test_log():
     log = LoggingEngine(level="debug",
                         contents=["asctime", "levelname", "filename", "lineno", "funcName", "message"])
 
-    log.info("Hello World!")
\ No newline at end of file
+    log.info("Hello World!")
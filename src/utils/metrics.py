@@ -0,0 +1,247 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.configuration.config import Configs
+from src.utils.logging_engine import logger
+from src.utils.time_utils import timestamp_to_datetime
+
+
+'''
+服务水平指标: 遍历一次History(订单状态和骑手位置的事件记录), 其余计算全部向量化
+- 订单: 配送时长(创建到送达)的p50/p95/p99, 准时率, 餐厅等待时长(创建到取餐), 每小时创建和完成的订单数量
+- 骑手: 忙碌时间(行驶 + 服务), 空闲时间, 利用率
+按小时(Configs.METRICS_BUCKET_SECONDS)分组, 订单按创建时间分组, 骑手的忙碌时间按实际发生的时间段分配
+'''
+
+DELIVERY_PERCENTILES = [50, 95, 99]
+
+
+def get_order_event_table(order_id_to_status_list: dict):
+    '''
+    每个订单一行: 创建(GENERATED), 取餐(ONGOING), 送达(COMPLETED)的最早时间和承诺送达时间, 没有的事件为nan
+    Inputs:
+    - order_id_to_status_list: history.get_order_status_history()
+    Output: (order_ids, creation_times, pickup_times, completion_times, committed_completion_times), numpy arrays
+    '''
+    status_info_lists = list(order_id_to_status_list.values())
+    status_infos = [status_info for status_info_list in status_info_lists for status_info in status_info_list]
+    rows = np.repeat(np.arange(len(status_info_lists)), [len(status_info_list)
+                                                         for status_info_list in status_info_lists])
+    states = np.array([status_info["state"] for status_info in status_infos], dtype=np.int64)
+    update_times = np.array([status_info["update_time"] for status_info in status_infos], dtype=float)
+
+    event_times = []
+    for state_name in ["GENERATED", "ONGOING", "COMPLETED"]:
+        is_state = states == Configs.ORDER_STATUS_TO_CODE.get(state_name)
+        times = np.full(len(status_info_lists), np.inf)
+        np.minimum.at(times, rows[is_state], update_times[is_state])
+        times[np.isinf(times)] = np.nan
+        event_times.append(times)
+    committed_completion_times = np.array([status_info_list[0]["committed_completion_time"]
+                                           for status_info_list in status_info_lists], dtype=float)
+    return (np.array(list(order_id_to_status_list.keys()), dtype=object), *event_times, committed_completion_times)
+
+
+def get_driver_visit_table(driver_id_to_node_list: dict):
+    '''
+    每个骑手的访问记录(同一次访问在多个时间片中重复记录, 按(骑手, 到达时间, 地点)合并)
+    - 服务结束时间: 最早的离开时间(之后的记录中停车的骑手离开时间会延长)
+    - 出发时间: 最晚的离开时间
+    - 服务时间: 记录的服务时间, 未知时为服务结束时间 - 到达时间
+    Output: DataFrame(driver_id, location_id, arrive_time, service_end_time, depart_time, service_time),
+            按骑手和到达时间排序
+    '''
+    driver_ids = list(driver_id_to_node_list.keys())
+    node_lists = list(driver_id_to_node_list.values())
+    nodes = [node for node_list in node_lists for node in node_list]
+    driver_codes = np.repeat(np.arange(len(node_lists)), [len(node_list) for node_list in node_lists])
+    location_codes, location_ids = pd.factorize(np.array([node["location_id"] for node in nodes], dtype=object))
+    leave_times = np.array([node["update time"] for node in nodes], dtype=float)
+    arrive_times = np.array([node["arrive_time"] for node in nodes], dtype=float)
+    # 未知的服务时间(None)为nan
+    service_times = np.array([np.nan if node["service_time"] is None else node["service_time"] for node in nodes],
+                             dtype=float)
+
+    # 排序后, 每组相同(骑手, 到达时间, 地点)的第一行
+    order = np.lexsort((location_codes, arrive_times, driver_codes))
+    driver_codes, location_codes = driver_codes[order], location_codes[order]
+    arrive_times, leave_times, service_times = arrive_times[order], leave_times[order], service_times[order]
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = ((driver_codes[1:] != driver_codes[:-1]) | (arrive_times[1:] != arrive_times[:-1])
+                    | (location_codes[1:] != location_codes[:-1]))
+    starts = np.flatnonzero(is_first)
+    if len(starts) == 0:
+        return pd.DataFrame(columns=["driver_id", "location_id", "arrive_time", "service_end_time", "depart_time",
+                                     "service_time"])
+
+    service_end_times = np.minimum.reduceat(leave_times, starts)
+    service_times = np.fmax.reduceat(service_times, starts)
+    visits = pd.DataFrame({"driver_id": np.array(driver_ids, dtype=object)[driver_codes[starts]],
+                           "location_id": location_ids[location_codes[starts]],
+                           "arrive_time": arrive_times[starts],
+                           "service_end_time": service_end_times,
+                           "depart_time": np.maximum.reduceat(leave_times, starts),
+                           "service_time": np.where(np.isnan(service_times), service_end_times - arrive_times[starts],
+                                                    service_times)})
+    return visits
+
+
+def calculate_service_metrics(history, initial_time: int, bucket_seconds=None):
+    '''
+    Inputs:
+    - history: History
+    - initial_time: 模拟开始时间, 第一个时间段的开始
+    - bucket_seconds: 时间段长度(秒), 默认Configs.METRICS_BUCKET_SECONDS
+    Output:
+    - summary: dict, 整体指标
+    - hourly: DataFrame, 每个时间段一行
+    - drivers: DataFrame, 每个骑手一行
+    '''
+    bucket_seconds = bucket_seconds or Configs.METRICS_BUCKET_SECONDS
+    order_ids, creation_times, pickup_times, completion_times, committed_times = get_order_event_table(
+        history.get_order_status_history())
+    visits = get_driver_visit_table(history.get_driver_position_history())
+
+    # 订单指标
+    is_completed = ~np.isnan(completion_times) & ~np.isnan(creation_times)
+    delivery_times = completion_times - creation_times
+    restaurant_waits = pickup_times - creation_times
+    is_on_time = completion_times <= committed_times
+
+    # 骑手的忙碌时间段: 在地点的服务 [到达, 到达 + 服务时间], 行驶 [出发, 到达下一个地点]
+    driver_codes, driver_ids = pd.factorize(visits["driver_id"], sort=False)
+    arrive_times = visits["arrive_time"].to_numpy()
+    depart_times = visits["depart_time"].to_numpy()
+    service_times = visits["service_time"].to_numpy()
+    has_next = np.zeros(len(visits), dtype=bool)
+    has_next[:-1] = driver_codes[1:] == driver_codes[:-1]
+    next_arrive_times = np.roll(arrive_times, -1)
+    busy_starts = np.concatenate((arrive_times, depart_times[has_next]))
+    busy_ends = np.concatenate((arrive_times + service_times, next_arrive_times[has_next]))
+    busy_driver_codes = np.concatenate((driver_codes, driver_codes[has_next]))
+
+    # 统计的时间范围: 模拟开始到最后一个事件
+    end_time = np.nanmax(np.concatenate(([initial_time], completion_times, busy_ends)))
+    bucket_num = max(int(np.ceil((end_time - initial_time) / bucket_seconds)), 1)
+    bucket_starts = initial_time + np.arange(bucket_num + 1) * bucket_seconds
+    bucket_lengths = np.diff(np.minimum(bucket_starts, end_time))
+
+    # 每个时间段的忙碌时间
+    bucket_busy = np.diff(__get_cumulative_busy_time(busy_starts, busy_ends, bucket_starts))
+    driver_num = len(driver_ids)
+    driver_busy = np.bincount(busy_driver_codes, weights=busy_ends - busy_starts, minlength=driver_num)
+    horizon = end_time - initial_time
+
+    creation_buckets = __get_buckets(creation_times, initial_time, bucket_seconds, bucket_num)
+    completion_buckets = __get_buckets(completion_times, initial_time, bucket_seconds, bucket_num)
+    completed_buckets = creation_buckets[is_completed]
+    hourly = pd.DataFrame({"bucket_start": [timestamp_to_datetime(time) for time in bucket_starts[:-1]],
+                           "created_orders": np.bincount(creation_buckets[creation_buckets >= 0],
+                                                         minlength=bucket_num),
+                           "completed_orders": np.bincount(completion_buckets[completion_buckets >= 0],
+                                                           minlength=bucket_num)})
+    hourly["orders_per_hour"] = hourly["completed_orders"] * 3600 / np.maximum(bucket_lengths, 1)
+    for percentile, values in zip(DELIVERY_PERCENTILES, __get_grouped_percentiles(
+            completed_buckets, delivery_times[is_completed], DELIVERY_PERCENTILES, bucket_num)):
+        hourly[f"delivery_time_p{percentile}"] = values
+    hourly["on_time_rate"] = __get_grouped_mean(completed_buckets, is_on_time[is_completed], bucket_num)
+    is_picked_up = ~np.isnan(restaurant_waits)
+    hourly["restaurant_wait_mean"] = __get_grouped_mean(creation_buckets[is_picked_up],
+                                                        restaurant_waits[is_picked_up], bucket_num)
+    hourly["restaurant_wait_p95"] = __get_grouped_percentiles(creation_buckets[is_picked_up],
+                                                              restaurant_waits[is_picked_up], [95], bucket_num)[0]
+    hourly["driver_busy_seconds"] = bucket_busy
+    hourly["driver_idle_seconds"] = np.maximum(bucket_lengths * driver_num - bucket_busy, 0)
+    hourly["driver_utilization"] = bucket_busy / np.maximum(bucket_lengths * driver_num, 1)
+
+    drivers = pd.DataFrame({"driver_id": driver_ids,
+                            "visits": np.bincount(driver_codes, minlength=driver_num),
+                            "busy_seconds": driver_busy,
+                            "idle_seconds": np.maximum(horizon - driver_busy, 0),
+                            "utilization": driver_busy / max(horizon, 1)})
+
+    summary = {"orders": len(order_ids),
+               "completed_orders": int(is_completed.sum()),
+               "on_time_rate": float(is_on_time[is_completed].mean()) if is_completed.any() else None,
+               "restaurant_wait_mean": float(restaurant_waits[is_picked_up].mean()) if is_picked_up.any() else None,
+               "orders_per_hour": float(is_completed.sum() * 3600 / max(horizon, 1)),
+               "drivers": driver_num,
+               "driver_utilization": float(driver_busy.sum() / max(horizon * driver_num, 1)),
+               "driver_idle_seconds_mean": float(drivers["idle_seconds"].mean()) if driver_num > 0 else None}
+    for percentile in DELIVERY_PERCENTILES:
+        summary[f"delivery_time_p{percentile}"] = (float(np.percentile(delivery_times[is_completed], percentile))
+                                                   if is_completed.any() else None)
+    return summary, hourly, drivers
+
+
+def export_service_metrics(history, initial_time: int, file_path_prefix: str):
+    '''
+    输出指标: {prefix}_hourly.csv, {prefix}_drivers.csv, {prefix}_summary.json
+    '''
+    folder = os.path.dirname(file_path_prefix)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    summary, hourly, drivers = calculate_service_metrics(history, initial_time)
+    hourly.to_csv(f"{file_path_prefix}_hourly.csv", index=False)
+    drivers.to_csv(f"{file_path_prefix}_drivers.csv", index=False)
+    with open(f"{file_path_prefix}_summary.json", "w") as fd:
+        fd.write(json.dumps(summary, indent=4))
+    logger.info(f"Write the service metrics to {file_path_prefix}_*.csv/json")
+    return summary, hourly, drivers
+
+
+def __get_buckets(times, initial_time: int, bucket_seconds: int, bucket_num: int):
+    '''
+    每个时间所在的时间段, 没有时间(nan)为-1, 超出范围的归入最后一个时间段
+    '''
+    buckets = np.full(len(times), -1, dtype=np.int64)
+    has_time = ~np.isnan(times)
+    buckets[has_time] = np.clip((times[has_time] - initial_time) // bucket_seconds, 0, bucket_num - 1)
+    return buckets
+
+
+def __get_cumulative_busy_time(starts, ends, times):
+    '''
+    [0, t]内所有忙碌时间段的总长度: sum(t - start, start <= t) - sum(t - end, end <= t), 排序后每个t为O(log n)
+    '''
+    sorted_starts = np.sort(starts)
+    sorted_ends = np.sort(ends)
+    start_sums = np.concatenate(([0.0], np.cumsum(sorted_starts)))
+    end_sums = np.concatenate(([0.0], np.cumsum(sorted_ends)))
+    start_counts = np.searchsorted(sorted_starts, times, side="right")
+    end_counts = np.searchsorted(sorted_ends, times, side="right")
+    return (times * start_counts - start_sums[start_counts]) - (times * end_counts - end_sums[end_counts])
+
+
+def __get_grouped_mean(groups, values, group_num: int):
+    counts = np.bincount(groups, minlength=group_num)
+    sums = np.bincount(groups, weights=np.asarray(values, dtype=float), minlength=group_num)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def __get_grouped_percentiles(groups, values, percentiles: list, group_num: int):
+    '''
+    每组的分位数(线性插值, 与np.percentile相同), 一次排序
+    Output: list, 每个分位数一个长度为group_num的数组, 没有数据的组为nan
+    '''
+    order = np.lexsort((values, groups))
+    sorted_values = np.asarray(values, dtype=float)[order]
+    counts = np.bincount(groups, minlength=group_num)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = []
+    for percentile in percentiles:
+        positions = starts + (np.maximum(counts, 1) - 1) * percentile / 100
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.ceil(positions).astype(np.int64)
+        if len(sorted_values) == 0:
+            result.append(np.full(group_num, np.nan))
+            continue
+        lower_values = sorted_values[np.minimum(lower, len(sorted_values) - 1)]
+        upper_values = sorted_values[np.minimum(upper, len(sorted_values) - 1)]
+        percentile_values = lower_values + (upper_values - lower_values) * (positions - lower)
+        result.append(np.where(counts > 0, percentile_values, np.nan))
+    return result
@@ -0,0 +1,365 @@
+import heapq
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+from src.common.order import Order
+from src.configuration.config import Configs
+from src.utils.input_utils import get_order_from_row
+from src.utils.logging_engine import logger
+from src.utils.order_source import RecentOrderIds
+
+
+'''
+实时订单接入(shadow mode): 生产系统把订单发送到本地socket或追加到文件, 模拟器在时间片之间读取
+消息格式: 每行一个json
+- 订单: {"order_id", "demand", "creation_time", "committed_completion_time", "load_time", "unload_time",
+         "pickup_id", "delivery_id"}, 时间为unix timestamp, 或与订单文件相同的'%H:%M:%S'(模拟开始的日期)
+- 水位: {"watermark": unix timestamp}, 表示该时间之前的订单都已经发送(没有订单的时间段发送, 避免模拟器等待)
+- 结束: {"end": true}
+'''
+
+
+class LiveOrderSource(object):
+    def __init__(self, mode: str, address: str, initial_time: int, queue_size=None, batch_size=None,
+                 idle_timeout=None):
+        '''
+        与CsvOrderSource接口相同, 订单由后台线程接收
+        - 接收线程每次读取的所有完整消息(最多batch_size条)解析后作为一批放入有界队列, 队列满时接收线程阻塞,
+          不再读取socket/文件, 发送端随之阻塞(backpressure)
+        - 按事件时间释放: 模拟时间超过水位(已经收到的最大订单创建时间或水位消息)时等待新的消息,
+          模拟器的时钟不会超过生产系统的时钟; 等待超过idle_timeout秒时按已经收到的订单继续
+        - 重复的order_id(Configs.ORDER_SOURCE_DISORDER_TOLERANCE以内)只保留第一次收到的订单
+        - 支持pickle(检查点, 分支): 保存时先把队列中的批次移到缓冲区; 恢复后不接收新的订单(分支只回放已经收到的订单),
+          从检查点继续接收时调用restart()
+        Inputs:
+        - mode: "socket", unix socket路径或"host:port"; "file", 追加写入的jsonl文件
+        - address: socket地址或文件路径
+        - initial_time: unix timestamp, 模拟开始时间, '%H:%M:%S'格式的时间所在的日期
+        - queue_size, batch_size, idle_timeout: 默认Configs.INGESTION_QUEUE_SIZE, INGESTION_BATCH_SIZE,
+          INGESTION_IDLE_TIMEOUT
+        '''
+        self.mode = mode
+        self.address = address
+        self.initial_time = initial_time
+        self.queue_size = queue_size or Configs.INGESTION_QUEUE_SIZE
+        self.batch_size = batch_size or Configs.INGESTION_BATCH_SIZE
+        self.idle_timeout = Configs.INGESTION_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+
+        # 已经收到的最大创建时间(或水位消息), 是否收到了结束消息
+        self.watermark = initial_time
+        self.is_ended = False
+        self.received_order_num = 0
+        self.released_order_num = 0
+        # file模式下已经移到缓冲区的位置, 恢复检查点时从该位置继续
+        self.file_offset = 0
+
+        # 缓冲区, 堆: (creation_time, sequence, order)
+        self.__buffer = []
+        self.__sequence = 0
+        self.__order_ids = RecentOrderIds(Configs.ORDER_SOURCE_DISORDER_TOLERANCE)
+        self.__initialize_receiver()
+        self.restart()
+
+
+    def __getstate__(self):
+        # 队列中的批次不能pickle, 先移到缓冲区
+        self.__drain()
+        state = self.__dict__.copy()
+        for name in ["_LiveOrderSource__queue", "_LiveOrderSource__stop_event", "_LiveOrderSource__server",
+                     "_LiveOrderSource__threads"]:
+            state.pop(name, None)
+        state["is_receiving"] = False
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__initialize_receiver()
+
+
+    def __initialize_receiver(self):
+        self.__queue = queue.Queue(maxsize=self.queue_size)
+        self.__stop_event = threading.Event()
+        self.__server = None
+        self.__threads = []
+        # 是否在接收新的订单, 否则只释放缓冲区中的订单
+        self.is_receiving = False
+
+
+    def restart(self):
+        '''
+        启动接收线程(socket模式下监听address), 从检查点恢复后继续接收订单时调用
+        '''
+        if self.is_receiving or self.is_ended:
+            return
+        self.is_receiving = True
+        if self.mode == "socket":
+            self.__server = LiveOrderSource.__create_server(self.address)
+            target = self.__accept_connections
+        else:
+            target = self.__tail_file
+        thread = threading.Thread(target=target, name=f"order-ingestion-{self.mode}", daemon=True)
+        thread.start()
+        self.__threads.append(thread)
+        logger.info(f"Receive the orders from {self.mode} {self.address}, queue size: {self.queue_size} batches")
+
+
+    @staticmethod
+    def __create_server(address: str):
+        if ":" in address and "/" not in address:
+            host, port = address.rsplit(":", 1)
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((host, int(port)))
+        else:
+            if os.path.exists(address):
+                os.remove(address)
+            folder = os.path.dirname(address)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(address)
+        server.listen()
+        server.settimeout(0.5)
+        return server
+
+
+    def close(self):
+        '''
+        停止接收线程, 关闭socket
+        '''
+        self.__stop_event.set()
+        if self.__server is not None:
+            self.__server.close()
+            self.__server = None
+            if self.mode == "socket" and os.path.exists(self.address):
+                os.remove(self.address)
+        for thread in self.__threads:
+            thread.join(timeout=1)
+
+
+    # 接收线程
+    def __accept_connections(self):
+        while not self.__stop_event.is_set():
+            try:
+                connection, _ = self.__server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            thread = threading.Thread(target=self.__receive_from_connection, args=(connection,), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+
+    def __receive_from_connection(self, connection):
+        pending = b""
+        connection.settimeout(0.5)
+        with connection:
+            while not self.__stop_event.is_set():
+                try:
+                    data = connection.recv(1 << 16)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                pending = self.__put_lines(pending + data)
+
+
+    def __tail_file(self):
+        # 接收线程读取到的位置, 批次移到缓冲区时才更新file_offset
+        read_offset = self.file_offset
+        while not self.__stop_event.is_set():
+            if not os.path.exists(self.address):
+                time.sleep(0.1)
+                continue
+            with open(self.address, "rb") as fd:
+                fd.seek(read_offset)
+                data = fd.read(1 << 20)
+            if not data:
+                time.sleep(0.1)
+                continue
+            pending = self.__put_lines(data, read_offset)
+            # 只有完整的行才算读取, 不完整的最后一行下次重新读取
+            read_offset += len(data) - len(pending)
+
+
+    def __put_lines(self, data: bytes, offset=None):
+        '''
+        完整的行按batch_size分批解析后放入队列(队列满时阻塞), 返回不完整的最后一行
+        offset: file模式下data在文件中的位置, 每个批次记录其结束的位置
+        '''
+        lines = data.split(b"\n")
+        pending = lines.pop()
+        for start in range(0, len(lines), self.batch_size):
+            batch_lines = lines[start:start + self.batch_size]
+            if offset is not None:
+                offset += sum(len(line) + 1 for line in batch_lines)
+            batch = self.__parse_lines(batch_lines) + (offset, )
+            while not self.__stop_event.is_set():
+                try:
+                    self.__queue.put(batch, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+        return pending
+
+
+    def __parse_lines(self, lines: list):
+        '''
+        Output: (orders, watermark, is_end)
+        '''
+        orders = []
+        watermark = None
+        is_end = False
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                if message.get("end"):
+                    is_end = True
+                elif "watermark" in message:
+                    watermark = max(watermark or 0, int(message.get("watermark")))
+                else:
+                    orders.append(get_order_from_message(message, self.initial_time))
+            except Exception as exception:
+                logger.error(f"Invalid order message {line[:200]}: {exception}")
+        return orders, watermark, is_end
+
+
+    # 模拟器线程
+    def __add_batch(self, batch: tuple):
+        orders, watermark, is_end, file_offset = batch
+        for order in orders:
+            if not self.__order_ids.add(order.id, order.creation_time):
+                continue
+            heapq.heappush(self.__buffer, (order.creation_time, self.__sequence, order))
+            self.__sequence += 1
+            self.received_order_num += 1
+            self.watermark = max(self.watermark, order.creation_time)
+        if watermark is not None:
+            self.watermark = max(self.watermark, watermark)
+        self.is_ended = self.is_ended or is_end
+        if file_offset is not None:
+            self.file_offset = file_offset
+
+
+    def __drain(self, timeout=0):
+        '''
+        把队列中所有的批次移到缓冲区, timeout > 0时最多等待timeout秒, 返回是否收到了新的批次
+        '''
+        try:
+            self.__add_batch(self.__queue.get(timeout=timeout) if timeout > 0 else self.__queue.get_nowait())
+        except queue.Empty:
+            return False
+        while True:
+            try:
+                self.__add_batch(self.__queue.get_nowait())
+            except queue.Empty:
+                return True
+
+
+    def __fill_buffer(self, until_time: int):
+        '''
+        等待直到水位>=until_time(创建时间<=until_time的订单都已经收到)或者收到结束消息
+        '''
+        self.__drain()
+        deadline = time.monotonic() + self.idle_timeout
+        while self.is_receiving and not self.is_ended and self.watermark < until_time:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"No order message for {self.idle_timeout} seconds, continue with the received orders")
+                break
+            if self.__drain(remaining):
+                deadline = time.monotonic() + self.idle_timeout
+
+
+    def next_creation_time(self):
+        '''
+        下一个未释放订单的创建时间, 没有订单时返回None
+        '''
+        self.__drain()
+        deadline = time.monotonic() + self.idle_timeout
+        while not self.__buffer and self.is_receiving and not self.is_ended and time.monotonic() < deadline:
+            self.__drain(deadline - time.monotonic())
+        return self.__buffer[0][0] if self.__buffer else None
+
+
+    def peek_orders(self, until_time: int):
+        '''
+        已经收到的创建时间<=until_time且还未释放的订单(按创建时间排序), 不等待, 不释放
+        '''
+        self.__drain()
+        return [order for creation_time, _, order in sorted(self.__buffer) if creation_time <= until_time]
+
+
+    def release_orders(self, until_time: int):
+        '''
+        释放创建时间<=until_time的订单(按创建时间排序)
+        '''
+        self.__fill_buffer(until_time)
+        orders = []
+        while self.__buffer and self.__buffer[0][0] <= until_time:
+            orders.append(heapq.heappop(self.__buffer)[2])
+        self.released_order_num += len(orders)
+        if self.is_exhausted():
+            self.close()
+        return orders
+
+
+    def is_exhausted(self):
+        '''
+        收到了结束消息(或不再接收订单), 且所有订单都已经释放
+        '''
+        return (self.is_ended or not self.is_receiving) and self.__queue.empty() and not self.__buffer
+
+
+def get_order_from_message(message: dict, initial_time: int):
+    '''
+    订单消息转换成Order, 时间为unix timestamp或'%H:%M:%S'
+    '''
+    if isinstance(message.get("creation_time"), str):
+        return get_order_from_row(message, initial_time)
+    return Order(str(message["order_id"]), float(message.get("demand", 1)),
+                 order_restaurant_id=str(message["pickup_id"]).strip(),
+                 order_customer_id=str(message["delivery_id"]).strip(),
+                 creation_time=int(message["creation_time"]),
+                 committed_completion_time=int(message["committed_completion_time"]),
+                 load_time=int(message["load_time"]), unload_time=int(message["unload_time"]))
+
+
+def convert_order_to_message(order):
+    '''
+    Order转换成订单消息(unix timestamp)
+    '''
+    return {"order_id": order.id,
+            "demand": order.demand,
+            "creation_time": order.creation_time,
+            "committed_completion_time": order.committed_completion_time,
+            "load_time": order.load_time,
+            "unload_time": order.unload_time,
+            "pickup_id": order.pickup_location_id,
+            "delivery_id": order.delivery_location_id}
+
+
+def send_order_messages(address: str, messages: list, batch_size=None):
+    '''
+    发送订单消息到LiveOrderSource的socket(e.g., 回放测试例, 压力测试), 每batch_size条消息发送一次
+    接收端的队列满时sendall阻塞
+    '''
+    batch_size = batch_size or Configs.INGESTION_BATCH_SIZE
+    if ":" in address and "/" not in address:
+        host, port = address.rsplit(":", 1)
+        client = socket.create_connection((host, int(port)))
+    else:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(address)
+    with client:
+        for start in range(0, len(messages), batch_size):
+            data = "".join(json.dumps(message) + "\n" for message in messages[start:start + batch_size])
+            client.sendall(data.encode())
@@ -0,0 +1,196 @@
+import calendar
+import collections
+import datetime
+import heapq
+import os
+
+import pandas as pd
+
+from src.configuration.config import Configs
+from src.utils.input_utils import get_order_from_row
+from src.utils.logging_engine import logger
+from src.utils.time_utils import combine_date_and_time
+
+
+class RecentOrderIds(object):
+    def __init__(self, window: int):
+        '''
+        最近读取的订单id, 用于去掉重复的订单, 只保存创建时间在最大创建时间之前window秒以内的id(内存有界)
+        window: 默认Configs.ORDER_SOURCE_DISORDER_TOLERANCE, 超过该时间的重复订单视为新的订单
+        '''
+        self.window = window
+        self.__order_ids = set()
+        # (creation_time, order_id), 按读取顺序(基本按创建时间排序)
+        self.__queue = collections.deque()
+        self.__latest_creation_time = None
+
+
+    def add(self, order_id: str, creation_time: int):
+        '''
+        添加订单id, 已经存在时返回False
+        '''
+        if order_id in self.__order_ids:
+            return False
+        self.__order_ids.add(order_id)
+        self.__queue.append((creation_time, order_id))
+        self.__latest_creation_time = max(self.__latest_creation_time or creation_time, creation_time)
+        while self.__queue and self.__queue[0][0] < self.__latest_creation_time - self.window:
+            self.__order_ids.discard(self.__queue.popleft()[1])
+        return True
+
+
+    def __len__(self):
+        return len(self.__order_ids)
+
+
+class CsvOrderSource(object):
+    def __init__(self, file_path: str, initial_time: int, chunk_size=None):
+        '''
+        按模拟时间分块读取订单文件, 内存中只保存已读取但还未释放的订单
+        - 文件按订单创建时间排序, 可以包含多天的订单: 有date列('%Y-%m-%d')时按日期确定是第几天,
+          否则创建时间比上一行小超过Configs.ORDER_SOURCE_DISORDER_TOLERANCE时视为进入下一天
+        - 少量乱序的订单在缓冲区中按创建时间排序, 释放时间已经过去的订单在下一次释放
+        - 重复的order_id(Configs.ORDER_SOURCE_DISORDER_TOLERANCE以内)只保留第一行
+        - 支持pickle(检查点): 只保存已读取的行数, 恢复时重新打开文件并跳过这些行
+        Inputs:
+        - file_path: 订单数据文件路径, 格式与get_order_info相同
+        - initial_time: unix timestamp, 模拟开始时间, 第一行订单所在的日期
+        - chunk_size: 每次读取的行数, 默认Configs.ORDER_SOURCE_CHUNK_SIZE
+        '''
+        self.file_path = file_path
+        self.initial_time = initial_time
+        self.chunk_size = chunk_size or Configs.ORDER_SOURCE_CHUNK_SIZE
+
+        # 已读取的行数, 当前是第几天, 上一行的创建时间(第0天的日期)
+        self.row_num = 0
+        self.day_offset = 0
+        self.pre_creation_time = None
+        # 已读取的最大创建时间, 大于该时间的订单还没有读取
+        self.latest_creation_time = None
+        self.is_file_exhausted = False
+
+        # 缓冲区, 堆: (creation_time, sequence, order)
+        self.__buffer = []
+        self.__sequence = 0
+        self.__order_ids = RecentOrderIds(Configs.ORDER_SOURCE_DISORDER_TOLERANCE)
+        self.released_order_num = 0
+
+        self.__reader = self.__open_reader()
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_CsvOrderSource__reader", None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__reader = None if self.is_file_exhausted else self.__open_reader()
+
+
+    def __open_reader(self):
+        # 避免丢失前几个为0的id信息
+        return pd.read_csv(self.file_path, dtype={'order_id': object}, chunksize=self.chunk_size,
+                           skiprows=range(1, self.row_num + 1))
+
+
+    def __read_chunk(self):
+        try:
+            chunk = next(self.__reader)
+        except StopIteration:
+            self.is_file_exhausted = True
+            self.__reader.close()
+            self.__reader = None
+            logger.info(f"Read all {self.row_num} orders from {self.file_path}")
+            return
+
+        self.row_num += len(chunk)
+        for row in chunk.to_dict("records"):
+            self.__update_day_offset(row)
+            order = get_order_from_row(row, self.initial_time + self.day_offset * Configs.A_DAY_TIME_SECONDS)
+            if not self.__order_ids.add(order.id, order.creation_time):
+                continue
+            heapq.heappush(self.__buffer, (order.creation_time, self.__sequence, order))
+            self.__sequence += 1
+            self.latest_creation_time = max(self.latest_creation_time or order.creation_time, order.creation_time)
+
+
+    def __update_day_offset(self, row):
+        '''
+        确定订单是模拟开始后的第几天
+        '''
+        if 'date' in row:
+            date_time = combine_date_and_time(self.initial_time, "00:00:00")
+            row_date_time = calendar.timegm(datetime.datetime.strptime(str(row['date']), "%Y-%m-%d").timetuple())
+            self.day_offset = (row_date_time - date_time) // Configs.A_DAY_TIME_SECONDS
+            return
+
+        creation_time = combine_date_and_time(self.initial_time, row['creation_time'])
+        if self.pre_creation_time is not None and \
+                self.pre_creation_time - creation_time > Configs.ORDER_SOURCE_DISORDER_TOLERANCE:
+            self.day_offset += 1
+        self.pre_creation_time = creation_time
+
+
+    def __fill_buffer(self, until_time: int):
+        '''
+        读取文件直到创建时间<=until_time的订单都在缓冲区中
+        '''
+        while not self.is_file_exhausted and (self.latest_creation_time is None
+                                              or self.latest_creation_time <= until_time):
+            self.__read_chunk()
+
+
+    def next_creation_time(self):
+        '''
+        下一个未释放订单的创建时间, 没有订单时返回None
+        '''
+        while not self.__buffer and not self.is_file_exhausted:
+            self.__read_chunk()
+        return self.__buffer[0][0] if self.__buffer else None
+
+
+    def peek_orders(self, until_time: int):
+        '''
+        创建时间<=until_time且还未释放的订单(按创建时间排序), 不释放
+        '''
+        self.__fill_buffer(until_time)
+        return [order for creation_time, _, order in sorted(self.__buffer) if creation_time <= until_time]
+
+
+    def release_orders(self, until_time: int):
+        '''
+        释放创建时间<=until_time的订单(按创建时间排序), 释放后的订单由模拟器管理
+        '''
+        self.__fill_buffer(until_time)
+        orders = []
+        while self.__buffer and self.__buffer[0][0] <= until_time:
+            orders.append(heapq.heappop(self.__buffer)[2])
+        self.released_order_num += len(orders)
+        return orders
+
+
+    def is_exhausted(self):
+        '''
+        所有订单都已经释放
+        '''
+        return self.is_file_exhausted and not self.__buffer
+
+
+def get_order_source(data_file_path: str, initial_time: int):
+    '''
+    根据Configs.ORDER_SOURCE_MODE创建订单来源
+    - stream: CsvOrderSource
+    - socket, file: LiveOrderSource(实时接入)
+    - memory: None(初始化时读取所有订单)
+    '''
+    if Configs.ORDER_SOURCE_MODE in ["socket", "file"]:
+        from src.utils.order_ingestion import LiveOrderSource
+        file_name = "orders.sock" if Configs.ORDER_SOURCE_MODE == "socket" else "orders.jsonl"
+        address = Configs.INGESTION_ADDRESS or os.path.join(Configs.output_folder, "ingestion", file_name)
+        return LiveOrderSource(Configs.ORDER_SOURCE_MODE, address, initial_time)
+    if Configs.ORDER_SOURCE_MODE != "stream":
+        return None
+    logger.info(f"Stream the orders from {data_file_path}, chunk size: {Configs.ORDER_SOURCE_CHUNK_SIZE}")
+    return CsvOrderSource(data_file_path, initial_time)
@@ -0,0 +1,150 @@
+import numpy as np
+
+from src.configuration.config import Configs
+
+
+class PlanEvaluator(object):
+    def __init__(self, location_ids: list, distance_matrix, time_matrix, driver_num: int, lamda=None,
+                 speed_profile=None):
+        '''
+        批量评估候选路线, 目标函数与Evaluator.calculate_total_score相同:
+        总距离 / 骑手数量 + 总延误时间(秒) * LAMDA / 3600
+        订单的完成时间为到达送货地点的时间(与History一致)
+        Inputs:
+        - location_ids: 地点id列表, 与矩阵的下标对应
+        - distance_matrix, time_matrix: 地点之间的距离和时间, numpy array (n, n)
+        - driver_num: 骑手数量
+        - lamda: 延误的系数, 默认Configs.LAMDA
+        - speed_profile: 可选, SpeedProfile, 行驶时间与出发时间有关
+        '''
+        self.location_ids = list(location_ids)
+        self.location_id_to_index = {location_id: index for index, location_id in enumerate(self.location_ids)}
+        self.distance_matrix = np.asarray(distance_matrix, dtype=float)
+        self.time_matrix = np.asarray(time_matrix, dtype=float)
+        self.driver_num = driver_num
+        self.lamda = Configs.LAMDA if lamda is None else lamda
+        self.speed_profile = speed_profile
+
+    @classmethod
+    def from_route_map(cls, route_map, location_ids: list, driver_num: int, lamda=None):
+        '''
+        根据Map(或LazyMap, RoadNetworkMap, SharedMap)的get_matrices创建
+        '''
+        distance_matrix, time_matrix = route_map.get_matrices(location_ids)
+        return cls(location_ids, distance_matrix, time_matrix, driver_num, lamda,
+                   getattr(route_map, "speed_profile", None))
+
+    def evaluate(self, start_indexes, start_times, route_indexes, service_times, delivery_positions,
+                 delivery_deadlines):
+        '''
+        批量评估B条路线, 每条路线最多L个节点, M个送货订单, 不足的部分用-1填充
+        Inputs:
+        - start_indexes: (B,) 骑手出发的地点下标
+        - start_times: (B,) 骑手出发的时间
+        - route_indexes: (B, L) 路线依次访问的地点下标
+        - service_times: (B, L) 每个节点的服务时间
+        - delivery_positions: (B, M) 每个送货订单在路线中的位置(0 ~ L-1)
+        - delivery_deadlines: (B, M) 每个送货订单的承诺送达时间
+        Output: dict
+        - arrive_times, leave_times: (B, L), 填充的位置为np.nan
+        - distances: (B,) 路线长度
+        - over_times: (B,) 延误时间(秒)
+        - scores: (B,) 路线对目标函数的贡献
+        '''
+        start_indexes = np.asarray(start_indexes, dtype=int)
+        start_times = np.asarray(start_times, dtype=float)
+        route_indexes = np.atleast_2d(np.asarray(route_indexes, dtype=int))
+        service_times = np.atleast_2d(np.asarray(service_times, dtype=float))
+        delivery_positions = np.atleast_2d(np.asarray(delivery_positions, dtype=int))
+        delivery_deadlines = np.atleast_2d(np.asarray(delivery_deadlines, dtype=float))
+
+        is_valid = route_indexes >= 0
+        # 填充的节点停留在上一个有效节点(或出发地点), 行驶距离, 时间和服务时间都为0
+        positions = np.where(is_valid, np.arange(route_indexes.shape[1])[None, :], -1)
+        last_valid_positions = np.maximum.accumulate(positions, axis=1)
+        filled_indexes = np.where(last_valid_positions >= 0,
+                                  np.take_along_axis(route_indexes, np.maximum(last_valid_positions, 0), axis=1),
+                                  start_indexes[:, None])
+        previous_indexes = np.concatenate([start_indexes[:, None], filled_indexes[:, :-1]], axis=1)
+        service_times = np.where(is_valid, service_times, 0)
+
+        leg_distances = self.distance_matrix[previous_indexes, filled_indexes]
+        leg_times = self.time_matrix[previous_indexes, filled_indexes]
+        distances = leg_distances.sum(axis=1)
+
+        if self.speed_profile is None:
+            # 到达时间 = 出发时间 + 之前所有路段的行驶时间 + 之前所有节点的服务时间
+            arrive_times = start_times[:, None] + np.cumsum(leg_times, axis=1) + np.cumsum(service_times, axis=1) \
+                           - service_times
+        else:
+            arrive_times = self.__get_time_dependent_arrive_times(start_times, leg_times, service_times)
+        leave_times = arrive_times + service_times
+
+        # 订单延误
+        is_delivery = delivery_positions >= 0
+        delivery_arrive_times = np.take_along_axis(arrive_times, np.where(is_delivery, delivery_positions, 0), axis=1)
+        over_times = np.where(is_delivery, np.maximum(delivery_arrive_times - delivery_deadlines, 0), 0).sum(axis=1)
+
+        scores = distances / self.driver_num + over_times * self.lamda / 3600
+        return {"arrive_times": np.where(is_valid, arrive_times, np.nan),
+                "leave_times": np.where(is_valid, leave_times, np.nan),
+                "distances": distances,
+                "over_times": over_times,
+                "scores": scores}
+
+    def __get_time_dependent_arrive_times(self, start_times, leg_times, service_times):
+        '''
+        逐个节点计算(每一步对B条路线向量化), 路段的行驶时间由出发时间决定
+        '''
+        arrive_times = np.zeros(leg_times.shape)
+        departure_times = start_times.copy()
+        for column in range(leg_times.shape[1]):
+            arrive_times[:, column] = departure_times + self.speed_profile.calculate_travel_times(
+                departure_times, leg_times[:, column])
+            departure_times = arrive_times[:, column] + service_times[:, column]
+        return arrive_times
+
+    def build_batch(self, plans: list):
+        '''
+        把Node路线转换成evaluate的输入
+        Inputs:
+        - plans: list of (start_location_id, start_time, [Node]), Node的服务时间和送货订单与模拟器一致
+        Output:
+        - evaluate的参数dict
+        '''
+        batch_size = len(plans)
+        max_length = max([len(nodes) for _, _, nodes in plans], default=0)
+        max_delivery_num = max([sum(len(node.delivery_orders) for node in nodes) for _, _, nodes in plans],
+                               default=0)
+
+        start_indexes = np.zeros(batch_size, dtype=int)
+        start_times = np.zeros(batch_size)
+        route_indexes = np.full((batch_size, max(max_length, 1)), -1, dtype=int)
+        service_times = np.zeros((batch_size, max(max_length, 1)))
+        delivery_positions = np.full((batch_size, max(max_delivery_num, 1)), -1, dtype=int)
+        delivery_deadlines = np.zeros((batch_size, max(max_delivery_num, 1)))
+
+        for plan_index, (start_location_id, start_time, nodes) in enumerate(plans):
+            start_indexes[plan_index] = self.location_id_to_index[start_location_id]
+            start_times[plan_index] = start_time
+            delivery_index = 0
+            for position, node in enumerate(nodes):
+                route_indexes[plan_index, position] = self.location_id_to_index[node.id]
+                service_times[plan_index, position] = node.service_time
+                for order in node.delivery_orders:
+                    delivery_positions[plan_index, delivery_index] = position
+                    delivery_deadlines[plan_index, delivery_index] = order.committed_completion_time
+                    delivery_index += 1
+
+        return {"start_indexes": start_indexes,
+                "start_times": start_times,
+                "route_indexes": route_indexes,
+                "service_times": service_times,
+                "delivery_positions": delivery_positions,
+                "delivery_deadlines": delivery_deadlines}
+
+    def evaluate_plans(self, plans: list):
+        '''
+        build_batch + evaluate
+        '''
+        return self.evaluate(**self.build_batch(plans))
@@ -0,0 +1,175 @@
+import cProfile
+import csv
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from src.utils.logging_engine import logger
+
+
+class TickProfiler(object):
+    '''
+    模拟器每个时间片(tick)的计时和计数
+    - timer(name): 统计某个环节的耗时, 同一个tick内同名环节的耗时累加
+    - count(name, num): 统计计数器, e.g., 移动的骑手数, 访问的节点数, 释放的订单数
+    - 可选: 每个tick开启cProfile(输出.prof文件)或tracemalloc(记录内存峰值)
+    '''
+    def __init__(self, enable_cprofile=False, enable_tracemalloc=False, cprofile_folder=""):
+        '''
+        Inputs:
+        - enable_cprofile: 每个tick是否开启cProfile
+        - enable_tracemalloc: 每个tick是否记录内存峰值
+        - cprofile_folder: cProfile结果(.prof)的输出文件夹
+        '''
+        self.enable_cprofile = enable_cprofile
+        self.enable_tracemalloc = enable_tracemalloc
+        self.cprofile_folder = cprofile_folder
+
+        # 每个tick的记录, {"tick": index, "time": cur_time, "timers": {}, "counters": {}}
+        self.tick_records = []
+        # 不在tick内的环节(e.g., 模拟剩余订单, 计算分数)
+        self.run_record = {"timers": {}, "counters": {}}
+
+        self.__cur_record = None
+        self.__tick_start = 0
+        self.__cprofile = None
+        self.__started_tracemalloc = False
+
+    def start_tick(self):
+        self.__cur_record = {"tick": len(self.tick_records), "time": 0, "timers": {}, "counters": {}}
+        self.__tick_start = time.perf_counter()
+
+        if self.enable_tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.__started_tracemalloc = True
+            tracemalloc.reset_peak()
+
+        if self.enable_cprofile:
+            self.__cprofile = cProfile.Profile()
+            self.__cprofile.enable()
+
+    def end_tick(self, cur_time=0):
+        '''
+        结束当前tick, cur_time为该tick的派单时间
+        '''
+        if self.__cur_record is None:
+            return
+        record = self.__cur_record
+        record["time"] = cur_time
+
+        if self.__cprofile is not None:
+            self.__cprofile.disable()
+            if self.cprofile_folder:
+                if not os.path.exists(self.cprofile_folder):
+                    os.makedirs(self.cprofile_folder)
+                file_path = os.path.join(self.cprofile_folder, f"tick_{record['tick']}.prof")
+                self.__cprofile.dump_stats(file_path)
+                record["cprofile_file"] = file_path
+            self.__cprofile = None
+
+        if self.enable_tracemalloc and tracemalloc.is_tracing():
+            record["peak_memory_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+
+        record["total"] = time.perf_counter() - self.__tick_start
+        self.tick_records.append(record)
+        self.__cur_record = None
+
+    def stop(self):
+        '''
+        结束profile, 关闭本对象开启的tracemalloc
+        '''
+        self.end_tick()
+        if self.__started_tracemalloc:
+            tracemalloc.stop()
+            self.__started_tracemalloc = False
+
+    def __get_record(self):
+        return self.__cur_record if self.__cur_record is not None else self.run_record
+
+    @contextmanager
+    def timer(self, name: str):
+        timers = self.__get_record()["timers"]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timers[name] = timers.get(name, 0) + time.perf_counter() - start
+
+    def count(self, name: str, num=1):
+        counters = self.__get_record()["counters"]
+        counters[name] = counters.get(name, 0) + num
+
+    def get_summary(self):
+        '''
+        汇总所有tick: 各环节总耗时, 平均耗时, 最大耗时, 计数器总和
+        '''
+        timer_names = self.__get_names("timers")
+        counter_names = self.__get_names("counters")
+
+        timer_summary = {}
+        for name in timer_names:
+            values = [record["timers"].get(name, 0) for record in self.tick_records]
+            timer_summary[name] = {"total": sum(values),
+                                   "mean": sum(values) / len(values) if values else 0,
+                                   "max": max(values) if values else 0}
+        for name, value in self.run_record["timers"].items():
+            timer_summary.setdefault(name, {"total": 0, "mean": 0, "max": 0})
+            timer_summary[name]["total"] += value
+
+        counter_summary = {name: sum(record["counters"].get(name, 0) for record in self.tick_records)
+                           for name in counter_names}
+        for name, value in self.run_record["counters"].items():
+            counter_summary[name] = counter_summary.get(name, 0) + value
+
+        total_seconds = sum(record["total"] for record in self.tick_records)
+        summary = {"tick_num": len(self.tick_records),
+                   "total_tick_seconds": total_seconds,
+                   "ticks_per_second": len(self.tick_records) / total_seconds if total_seconds > 0 else 0,
+                   "timers": timer_summary,
+                   "counters": counter_summary}
+        if self.enable_tracemalloc:
+            summary["peak_memory_kb"] = max([record.get("peak_memory_kb", 0) for record in self.tick_records],
+                                            default=0)
+        return summary
+
+    def __get_names(self, key):
+        names = []
+        for record in self.tick_records:
+            for name in record[key]:
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def export(self, file_path_prefix: str):
+        '''
+        输出profile结果: {prefix}.csv (每个tick一行) 和 {prefix}.json (每个tick + 汇总)
+        '''
+        folder = os.path.dirname(file_path_prefix)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        timer_names = self.__get_names("timers")
+        counter_names = self.__get_names("counters")
+        header = ["tick", "time", "total"] + timer_names + counter_names
+        if self.enable_tracemalloc:
+            header.append("peak_memory_kb")
+
+        with open(f"{file_path_prefix}.csv", "w", newline="") as fd:
+            writer = csv.writer(fd)
+            writer.writerow(header)
+            for record in self.tick_records:
+                row = [record["tick"], record["time"], round(record["total"], 6)]
+                row.extend(round(record["timers"].get(name, 0), 6) for name in timer_names)
+                row.extend(record["counters"].get(name, 0) for name in counter_names)
+                if self.enable_tracemalloc:
+                    row.append(round(record.get("peak_memory_kb", 0), 3))
+                writer.writerow(row)
+
+        with open(f"{file_path_prefix}.json", "w") as fd:
+            fd.write(json.dumps({"summary": self.get_summary(),
+                                 "run": self.run_record,
+                                 "ticks": self.tick_records}, indent=4))
+        logger.info(f"Write the timing report to {file_path_prefix}.csv and {file_path_prefix}.json")
@@ -0,0 +1,203 @@
+import json
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from src.common.route import Map
+from src.utils.logging_engine import logger
+
+
+'''
+共享内存中的静态数据(地点坐标, 距离矩阵, 时间矩阵), 并行运行多个模拟器或算法进程时只发布一次, 其他进程只读连接
+共享内存的布局: [8 bytes 元数据长度][元数据json][按8 bytes对齐的numpy数组]
+'''
+
+# 共享内存名称的环境变量, 子进程(包括算法子进程)通过该变量连接
+SHARED_DATA_ENV_NAME = "FOOD_DELIVERY_SHARED_DATA"
+
+HEADER_SIZE = 8
+ARRAY_NAMES = ["lats", "lngs", "distance_matrix", "time_matrix"]
+
+
+class SharedStaticData(object):
+    def __init__(self, shm, location_ids: list, arrays: dict, is_owner: bool):
+        '''
+        通过SharedStaticData.create(发布)或SharedStaticData.attach(连接)创建
+        Inputs:
+        - shm: SharedMemory对象
+        - location_ids: 地点id列表, 与数组的下标对应
+        - arrays: {name: numpy array}, 共享内存上的数组视图
+        - is_owner: 是否为发布者, 发布者负责释放共享内存
+        '''
+        self.shm = shm
+        self.name = shm.name
+        self.location_ids = location_ids
+        self.location_id_to_index = {location_id: index for index, location_id in enumerate(location_ids)}
+        self.lats = arrays.get("lats")
+        self.lngs = arrays.get("lngs")
+        self.distance_matrix = arrays.get("distance_matrix")
+        self.time_matrix = arrays.get("time_matrix")
+        self.is_owner = is_owner
+
+    @classmethod
+    def create(cls, location_ids: list, lats, lngs, distance_matrix, time_matrix):
+        '''
+        发布静态数据到共享内存
+        Inputs:
+        - location_ids: 地点id列表
+        - lats, lngs: 地点坐标, shape (n,)
+        - distance_matrix, time_matrix: 地点之间的距离和时间, shape (n, n)
+        '''
+        arrays = {"lats": np.asarray(lats, dtype=np.float64),
+                  "lngs": np.asarray(lngs, dtype=np.float64),
+                  "distance_matrix": np.asarray(distance_matrix, dtype=np.float64),
+                  "time_matrix": np.asarray(time_matrix, dtype=np.float64)}
+
+        # 元数据: 地点id和每个数组的位置
+        array_infos = {}
+        offset = 0
+        for name in ARRAY_NAMES:
+            array_infos[name] = {"offset": offset, "shape": list(arrays[name].shape)}
+            offset += SharedStaticData.__align(arrays[name].nbytes)
+        metadata = json.dumps({"location_ids": list(location_ids), "arrays": array_infos}).encode()
+        data_start = SharedStaticData.__align(HEADER_SIZE + len(metadata))
+
+        shm = shared_memory.SharedMemory(create=True, size=max(data_start + offset, 1))
+        shm.buf[:HEADER_SIZE] = len(metadata).to_bytes(HEADER_SIZE, "little")
+        shm.buf[HEADER_SIZE:HEADER_SIZE + len(metadata)] = metadata
+        shared_arrays = {}
+        for name in ARRAY_NAMES:
+            shared_arrays[name] = np.ndarray(arrays[name].shape, dtype=np.float64, buffer=shm.buf,
+                                             offset=data_start + array_infos[name]["offset"])
+            shared_arrays[name][...] = arrays[name]
+            shared_arrays[name].flags.writeable = False
+        logger.info(f"Publish the static data of {len(location_ids)} locations to the shared memory {shm.name}, "
+                    f"{shm.size / 1024 / 1024:.2f} MB")
+        return cls(shm, list(location_ids), shared_arrays, True)
+
+    @classmethod
+    def attach(cls, name: str):
+        '''
+        只读连接已经发布的共享内存, 连接者退出时不会释放共享内存
+        '''
+        shm = SharedStaticData.__open_without_tracking(name)
+
+        metadata_size = int.from_bytes(bytes(shm.buf[:HEADER_SIZE]), "little")
+        metadata = json.loads(bytes(shm.buf[HEADER_SIZE:HEADER_SIZE + metadata_size]).decode())
+        data_start = SharedStaticData.__align(HEADER_SIZE + metadata_size)
+        arrays = {}
+        for name, array_info in metadata.get("arrays").items():
+            arrays[name] = np.ndarray(tuple(array_info.get("shape")), dtype=np.float64, buffer=shm.buf,
+                                      offset=data_start + array_info.get("offset"))
+            arrays[name].flags.writeable = False
+        return cls(shm, metadata.get("location_ids"), arrays, False)
+
+    def close(self):
+        '''
+        断开连接; 发布者同时释放共享内存
+        '''
+        # 释放数组视图后才能关闭共享内存
+        self.lats = self.lngs = self.distance_matrix = self.time_matrix = None
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
+
+    @staticmethod
+    def __open_without_tracking(name: str):
+        '''
+        连接者不注册到resource_tracker, 否则连接进程退出时resource_tracker会释放共享内存
+        (同一个进程树共用一个resource_tracker, 注册后再注销也会注销发布者的记录)
+        '''
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # python < 3.13 没有track参数
+            register = resource_tracker.register
+            resource_tracker.register = lambda resource_name, resource_type: None
+            try:
+                return shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+
+    @staticmethod
+    def __align(size: int):
+        return (size + 7) // 8 * 8
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def publish_static_data(id_to_location: dict, route_map):
+    '''
+    发布地点坐标和route_map的距离, 时间矩阵, 并设置环境变量, 之后创建的子进程可以通过attach_shared_static_data连接
+    '''
+    location_ids = list(id_to_location.keys())
+    lats = [id_to_location.get(location_id).lat for location_id in location_ids]
+    lngs = [id_to_location.get(location_id).lng for location_id in location_ids]
+    distance_matrix, time_matrix = route_map.get_matrices(location_ids)
+    shared_data = SharedStaticData.create(location_ids, lats, lngs, distance_matrix, time_matrix)
+    os.environ[SHARED_DATA_ENV_NAME] = shared_data.name
+    return shared_data
+
+
+def attach_shared_static_data():
+    '''
+    根据环境变量连接共享内存, 没有发布时返回None
+    '''
+    name = os.environ.get(SHARED_DATA_ENV_NAME)
+    if not name:
+        return None
+    try:
+        return SharedStaticData.attach(name)
+    except FileNotFoundError:
+        logger.warning(f"Shared memory {name} does not exist")
+        return None
+
+
+class SharedMap(Map):
+    def __init__(self, shared_data: SharedStaticData):
+        '''
+        与Map接口相同, 距离和时间从共享内存的矩阵中读取
+        '''
+        super().__init__({})
+        self.shared_data = shared_data
+
+    def calculate_distance_between_locations(self, org_location_id, dest_location_id):
+        '''
+        计算origin和destination的距离
+        '''
+        return self.__get_value(self.shared_data.distance_matrix, org_location_id, dest_location_id, "distance")
+
+    def calculate_time_between_locations(self, org_location_id, dest_location_id):
+        '''
+        计算origin和destination的时间
+        '''
+        return self.__get_value(self.shared_data.time_matrix, org_location_id, dest_location_id, "time")
+
+    def get_matrices(self, location_ids: list):
+        '''
+        与Map.get_matrices相同, 返回子矩阵的拷贝
+        '''
+        indexes = [self.shared_data.location_id_to_index.get(location_id) for location_id in location_ids]
+        if None in indexes:
+            logger.error(f"Location {location_ids[indexes.index(None)]} is not in the shared data")
+            raise KeyError(location_ids[indexes.index(None)])
+        grid = np.ix_(indexes, indexes)
+        return self.shared_data.distance_matrix[grid], self.shared_data.time_matrix[grid]
+
+    def __get_value(self, matrix, org_location_id, dest_location_id, name: str):
+        if org_location_id == dest_location_id:
+            return 0
+        org_index = self.shared_data.location_id_to_index.get(org_location_id)
+        dest_index = self.shared_data.location_id_to_index.get(dest_location_id)
+        if org_index is None or dest_index is None or np.isinf(matrix[org_index, dest_index]):
+            logger.error(f"({org_location_id}, {dest_location_id}) is not in {name} matrix.")
+            return sys.maxsize
+        value = float(matrix[org_index, dest_index])
+        # 与get_route_map和RouteInfo相同: 时间取整秒(int)后保存为float
+        return float(int(value)) if name == "time" else value
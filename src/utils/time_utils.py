@@ -0,0 +1,34 @@
+import calendar
+import datetime
+
+from src.configuration.config import Configs
+
+
+'''
+模拟时钟: 所有时间戳都以Configs.SIMULATION_EPOCH(UTC)为基准, 与运行的日期和时区无关
+'''
+
+
+def get_initial_time():
+    '''
+    模拟开始时间, unix timestamp(UTC), e.g., SIMULATION_EPOCH 6点
+    '''
+    epoch_date = datetime.datetime.strptime(Configs.SIMULATION_EPOCH, "%Y-%m-%d")
+    initial_datetime = epoch_date.replace(hour=Configs.SIMULATION_START_HOUR)
+    return calendar.timegm(initial_datetime.timetuple())
+
+
+def combine_date_and_time(ini_time: int, time_str: str):
+    '''
+    将ini_time所在的日期和时间字符串('%H:%M:%S')结合, 返回unix timestamp(UTC)
+    '''
+    ini_date = timestamp_to_datetime(ini_time).date()
+    combined_datetime = datetime.datetime.combine(ini_date, datetime.datetime.strptime(time_str, '%H:%M:%S').time())
+    return calendar.timegm(combined_datetime.timetuple())
+
+
+def timestamp_to_datetime(timestamp):
+    '''
+    unix timestamp转换成模拟时钟下的datetime(UTC, 不带时区信息), 用于日志输出
+    '''
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).replace(tzinfo=None)
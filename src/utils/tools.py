@@ -1,5 +1,7 @@
 import copy
 
+import numpy as np
+
 from src.configuration.config import Configs
 
 
@@ -88,4 +90,13 @@ def get_order_list_of_drivers(dispatch_result, id_to_driver: dict):
         # 对骑手更新订单信息
         driver_id_to_order_list[driver_id] = order_list
 
-    return driver_id_to_order_list
\ No newline at end of file
+    return driver_id_to_order_list
+
+
+def haversine_distance(lat_1, lng_1, lat_2, lng_2):
+    '''
+    向量化的haversine距离, 单位km
+    '''
+    lat_1, lng_1, lat_2, lng_2 = map(np.radians, (lat_1, lng_1, lat_2, lng_2))
+    a = np.sin((lat_2 - lat_1) / 2) ** 2 + np.cos(lat_1) * np.cos(lat_2) * np.sin((lng_2 - lng_1) / 2) ** 2
+    return 2 * 6371.0088 * np.arcsin(np.sqrt(a))
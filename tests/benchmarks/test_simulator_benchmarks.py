@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmark import BENCHMARK_SIZES, load_instance, prepare_instance, run_benchmark_case_in_new_process
+
+
+'''
+pytest-benchmark: pytest tests/benchmarks --benchmark-autosave, 与已保存的结果比较: --benchmark-compare
+测试规模默认small, 通过环境变量选择, e.g., FOOD_DELIVERY_BENCHMARK_SIZES=small,medium
+'''
+
+SIZE_NAMES = [size_name for size_name in os.environ.get("FOOD_DELIVERY_BENCHMARK_SIZES", "small").split(",")
+              if size_name in BENCHMARK_SIZES]
+
+
+@pytest.mark.parametrize("size_name", SIZE_NAMES)
+def test_load_instance(benchmark, size_name):
+    prepare_instance(size_name)
+    benchmark.extra_info.update(BENCHMARK_SIZES.get(size_name))
+    benchmark.pedantic(load_instance, args=(size_name,), rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("size_name", SIZE_NAMES)
+def test_simulation(benchmark, size_name):
+    '''
+    整个模拟在新的进程中运行(内存峰值互不影响), 计时包括启动进程; 每秒时间片数, 算法I/O时间和内存峰值记录在extra_info中
+    '''
+    prepare_instance(size_name)
+    result = benchmark.pedantic(run_benchmark_case_in_new_process, args=(size_name,), rounds=1, iterations=1)
+    assert result is not None, f"simulation of {size_name} failed"
+    benchmark.extra_info.update({name: result.get(name) for name in
+                                 ["order_num", "driver_num", "tick_num", "ticks_per_second", "simulation_seconds",
+                                  "algorithm_io_seconds", "algorithm_seconds", "peak_memory_mb", "score"]})
+    assert result.get("tick_num") > 0
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from src.configuration.config import Configs
+from src.simulator.branching import branch_settings
+
+
+ALGORITHM_ENV_NAME = "FOOD_DELIVERY_DISPATCH_ALGORITHM"
+
+
+@pytest.fixture
+def clean_environment(monkeypatch):
+    monkeypatch.delenv(ALGORITHM_ENV_NAME, raising=False)
+
+
+def test_branch_settings_are_restored_for_the_next_branch(tmp_path, clean_environment):
+    lamda = Configs.LAMDA
+    checkpoint_interval_ticks = Configs.CHECKPOINT_INTERVAL_TICKS
+    data_interaction_folder = Configs.algorithm_data_interaction_folder_path
+    environment = dict(os.environ)
+
+    with branch_settings({"name": "alns", "environment": {ALGORITHM_ENV_NAME: "alns"},
+                          "configs": {"LAMDA": 0, "NEW_SETTING": 1}}, str(tmp_path)):
+        assert os.environ[ALGORITHM_ENV_NAME] == "alns"
+        assert Configs.LAMDA == 0 and Configs.NEW_SETTING == 1
+        assert Configs.algorithm_data_interaction_folder_path == str(tmp_path / "data_interaction" / "alns")
+
+    # 同一个进程中运行的下一个分支不继承前一个分支的设置
+    with branch_settings({"name": "greedy"}, str(tmp_path)):
+        assert ALGORITHM_ENV_NAME not in os.environ
+        assert Configs.LAMDA == lamda
+        assert not hasattr(Configs, "NEW_SETTING")
+
+    assert dict(os.environ) == environment
+    assert Configs.algorithm_data_interaction_folder_path == data_interaction_folder
+    assert Configs.CHECKPOINT_INTERVAL_TICKS == checkpoint_interval_ticks
+
+
+def test_branch_settings_are_restored_after_an_exception(tmp_path, clean_environment):
+    save_profile_report = Configs.SAVE_PROFILE_REPORT
+    with pytest.raises(RuntimeError):
+        with branch_settings({"name": "failed", "environment": {ALGORITHM_ENV_NAME: "alns"},
+                              "configs": {"SAVE_PROFILE_REPORT": True}}, str(tmp_path)):
+            raise RuntimeError("branch failed")
+    assert ALGORITHM_ENV_NAME not in os.environ
+    assert Configs.SAVE_PROFILE_REPORT == save_profile_report
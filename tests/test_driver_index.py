@@ -0,0 +1,119 @@
+import pytest
+
+from Algorithm import algorithm_demo
+from src.common.customer import Customer
+from src.common.driver import Driver
+from src.common.driver_index import DriverIndex
+from src.common.node import Node
+from src.common.order import Order
+from src.common.restaurant import Restaurant
+from src.configuration.config import Configs
+from src.simulator.driver_simulator import DriverSimulator
+from src.utils.location_index import build_location_index
+
+
+ID_TO_CUSTOMER = {"C1": Customer("C1", 1.301, 103.80), "C2": Customer("C2", 1.31, 103.80),
+                  "C3": Customer("C3", 1.40, 103.80)}
+ID_TO_RESTAURANT = {"R1": Restaurant("R1", 1.30, 103.80, 10, 10, 0)}
+ID_TO_LOCATION = {**ID_TO_CUSTOMER, **ID_TO_RESTAURANT}
+
+
+def get_order(order_id: str, delivery_location_id="C1"):
+    return Order(order_id, 1, 0, 3600, 60, 60, "R1", delivery_location_id)
+
+
+def get_node(location_id: str, pickup_orders=(), delivery_orders=(), arrive_time=0, leave_time=0):
+    location = ID_TO_LOCATION[location_id]
+    return Node(location_id, location.lat, location.lng, list(pickup_orders), list(delivery_orders), arrive_time,
+                leave_time)
+
+
+def get_idle_driver(driver_id: str, location_id: str, leave_time: int, cur_time=1000):
+    driver = Driver(driver_id, 5, "G1", 0)
+    driver.set_cur_position_info(location_id, cur_time, 0, leave_time)
+    driver.update_state(cur_time)
+    return driver
+
+
+def get_busy_driver(driver_id: str, location_id: str, cur_time=1000):
+    # 在location_id, 正在送货(订单O0送到C1)
+    carrying_order = get_order(f"O0_{driver_id}")
+    driver = Driver(driver_id, 5, "G1", 0, [carrying_order])
+    driver.set_cur_position_info(location_id, cur_time, 0, 0)
+    driver.destination = get_node("C1", [], [carrying_order], cur_time + 300, cur_time + 360)
+    driver.update_state(cur_time)
+    return driver
+
+
+class StubLocationIndex(object):
+    def __init__(self, location_id_to_neighbors: dict):
+        self.location_id_to_neighbors = location_id_to_neighbors
+
+    def get_neighbors(self, location_id: str, max_distance=None):
+        return [(neighbor, distance) for neighbor, distance in self.location_id_to_neighbors.get(location_id, [])
+                if max_distance is None or distance <= max_distance]
+
+
+def test_idle_key_does_not_change_between_ticks():
+    driver = get_idle_driver("D1", "C2", leave_time=500)
+    assert driver.next_free_time == 500
+    driver_index = DriverIndex([driver])
+    entries = driver_index.location_id_to_entries["C2"]
+
+    # 停在原地的骑手, 之后的时间片离开时间被重置
+    for cur_time in [1600, 2200]:
+        driver.set_cur_position_info("C2", cur_time, 0, 0)
+        driver.update_state(cur_time)
+        driver_index.update(driver)
+        assert driver.next_free_time == 500
+        assert driver_index.location_id_to_entries["C2"] is entries and entries == [(500, "D1")]
+
+
+def test_free_before_and_near():
+    drivers = [get_idle_driver("D1", "C2", 500), get_idle_driver("D2", "C3", 100), get_busy_driver("D3", "R1")]
+    driver_index = DriverIndex(drivers)
+    location_index = StubLocationIndex({"R1": [("R1", 0.0), ("C1", 0.1), ("C2", 1.1), ("C3", 11.1)]})
+
+    assert driver_index.get_drivers_free_before(1000) == [(100, "D2"), (500, "D1")]
+    # D3完成送货后在C1空闲
+    assert driver_index.get_drivers_free_before(1400, ["C1"]) == [(1360, "D3")]
+    assert driver_index.get_drivers_free_near("R1", 1000, location_index) == [(100, 11.1, "D2"), (500, 1.1, "D1")]
+    assert driver_index.get_drivers_free_near("R1", 1400, location_index, max_distance=2) == \
+        [(500, 1.1, "D1"), (1360, 0.1, "D3")]
+    assert driver_index.get_next_free_time(1000) == 1360
+
+    driver_index.remove("D1")
+    assert driver_index.get_drivers_free_near("R1", 1000, location_index, max_distance=2) == []
+
+
+class StubRouteMap(object):
+    def calculate_time_between_locations_at(self, org_location_id, dest_location_id, departure_time):
+        return 100
+
+
+def test_driver_simulator_reports_moved_drivers():
+    id_to_driver = {"D1": get_idle_driver("D1", "C2", 500), "D2": get_busy_driver("D2", "R1")}
+    driver_simulator = DriverSimulator(StubRouteMap(), ID_TO_LOCATION)
+    driver_simulator.run(id_to_driver, 1000)
+    assert driver_simulator.moved_driver_ids == ["D2"]
+
+
+@pytest.mark.parametrize("prefer_free_drivers, expected_driver_id", [(False, "D_busy"), (True, "D_idle")])
+def test_demo_prefers_free_drivers_near_pickup(monkeypatch, prefer_free_drivers, expected_driver_id):
+    location_index = build_location_index(ID_TO_CUSTOMER, ID_TO_RESTAURANT, k=4, cluster_levels=[])
+    monkeypatch.setattr(algorithm_demo, "get_location_index", lambda: location_index)
+    monkeypatch.setattr(Configs, "GREEDY_PREFER_FREE_DRIVERS", prefer_free_drivers)
+    monkeypatch.setattr(Configs, "LOCATION_INDEX_K", 4)
+
+    # 骑手D_busy在餐厅(距离0)但是正在送货, 骑手D_idle在1.1km外空闲
+    id_to_driver = {"D_busy": get_busy_driver("D_busy", "R1"), "D_idle": get_idle_driver("D_idle", "C2", 500)}
+    order = get_order("O1", "C2")
+    driver_id_to_destination, driver_id_to_planned_route = algorithm_demo.dispatch_orders_to_drivers(
+        {order.id: order}, id_to_driver, ID_TO_LOCATION)
+
+    assigned_driver_ids = []
+    for driver_id in id_to_driver:
+        route = [driver_id_to_destination.get(driver_id)] + driver_id_to_planned_route.get(driver_id)
+        if any(pickup_order.id == "O1" for node in route if node is not None for pickup_order in node.pickup_orders):
+            assigned_driver_ids.append(driver_id)
+    assert assigned_driver_ids == [expected_driver_id]
@@ -0,0 +1,68 @@
+import sys
+
+import numpy as np
+import pytest
+
+from src.utils.evaluator import Evaluator, ScoreComponents
+
+
+def get_components(over_times, driver_distances=(3.0, 5.5, 1.25), failed_order_ids=()):
+    return ScoreComponents([f"D_{index}" for index in range(len(driver_distances))], driver_distances,
+                           [str(index) for index in range(len(over_times))], over_times, len(driver_distances),
+                           failed_order_ids)
+
+
+def get_brute_force_over_time(over_times, lateness_cap=None, lateness_percentile=None):
+    over_times = np.asarray(over_times, dtype=float)
+    late_times = over_times[over_times > 0]
+    cap = np.inf if lateness_cap is None else lateness_cap
+    if lateness_percentile is not None and len(late_times) > 0:
+        cap = min(cap, np.percentile(late_times, lateness_percentile))
+    return np.minimum(over_times, cap).sum()
+
+
+OVER_TIMES = [
+    np.random.default_rng(0).exponential(600, 500).round() * (np.random.default_rng(1).random(500) < 0.4),
+    np.array([0.0, 120.0, 120.0, 0.0, 30.0, 900.0]),
+    np.zeros(20),
+    np.array([]),
+]
+
+
+@pytest.mark.parametrize("over_times", OVER_TIMES)
+def test_capped_lateness_matches_brute_force(over_times):
+    lateness_caps = [None, 0, 60, 120, 500.5, 1e9]
+    lateness_percentiles = [None, 0, 50, 90, 100]
+    variants = Evaluator.calculate_objective_variants(get_components(over_times), lamdas=[1, 3600],
+                                                      lateness_caps=lateness_caps,
+                                                      lateness_percentiles=lateness_percentiles)
+
+    assert len(variants) == 2 * len(lateness_caps) * len(lateness_percentiles)
+    for row in variants.itertuples():
+        lateness_cap = None if np.isnan(row.lateness_cap) else row.lateness_cap
+        lateness_percentile = None if np.isnan(row.lateness_percentile) else row.lateness_percentile
+        expected = get_brute_force_over_time(over_times, lateness_cap, lateness_percentile)
+        assert row.total_over_time == pytest.approx(expected, rel=1e-12, abs=1e-9)
+        assert row.score == pytest.approx(row.total_distance / 3 + expected * row.lamda / 3600)
+
+
+def test_no_late_orders():
+    variants = Evaluator.calculate_objective_variants(get_components(np.zeros(10)), lamdas=[10],
+                                                      lateness_caps=[None, 60], lateness_percentiles=[None, 90])
+    assert (variants["total_over_time"] == 0).all()
+    assert variants["score"].tolist() == pytest.approx([9.75 / 3] * 4)
+    # 没有延误订单时分位数上限不生效
+    assert np.isinf(variants.loc[variants["lateness_cap"].isna(), "applied_cap"]).all()
+
+
+def test_uncapped_variant_matches_score_of_components():
+    components = get_components(OVER_TIMES[0])
+    variants = Evaluator.calculate_objective_variants(components, lamdas=[1, 3600])
+    for row in variants.itertuples():
+        assert row.score == pytest.approx(Evaluator.calculate_score_of_components(components, row.lamda))
+
+
+def test_failed_orders():
+    variants = Evaluator.calculate_objective_variants(get_components([0, 100], failed_order_ids=["2"]),
+                                                      lamdas=[1, 2])
+    assert (variants["score"] == sys.maxsize).all()
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.configuration.config import Configs
+from src.simulator.experiment import get_t_critical_value, summarize_results
+
+
+@pytest.mark.parametrize("degrees_of_freedom, confidence, expected", [
+    (1, 0.95, 12.7062), (2, 0.95, 4.3027), (4, 0.95, 2.7764), (9, 0.95, 2.2622), (29, 0.95, 2.0452),
+    (1000, 0.95, 1.9623), (10, 0.99, 3.1693), (5, 0.90, 2.0150)])
+def test_t_critical_value_matches_table(degrees_of_freedom, confidence, expected):
+    assert get_t_critical_value(degrees_of_freedom, confidence) == pytest.approx(expected, abs=1e-4)
+
+
+def test_summary_uses_t_interval():
+    scores = [10.0, 12.0, 11.0, 15.0, None]
+    results_df = pd.DataFrame({"instance": "Instance_3", "driver_num": None, "alg_run_frequency": 10,
+                               "lamda": 10000, "seed": range(len(scores)), "score": scores})
+    row = summarize_results(results_df).iloc[0]
+
+    valid_scores = np.array(scores[:-1])
+    half_width = 3.1824 * valid_scores.std(ddof=1) / 2
+    assert row["successful_runs"] == 4
+    assert row["ci95_low"] == pytest.approx(valid_scores.mean() - half_width, rel=1e-4)
+    assert row["ci95_high"] == pytest.approx(valid_scores.mean() + half_width, rel=1e-4)
+
+
+def test_single_run_has_no_interval():
+    results_df = pd.DataFrame({"instance": ["Instance_3"], "driver_num": [None], "alg_run_frequency": [10],
+                               "lamda": [10000], "seed": [0], "score": [10.0]})
+    row = summarize_results(results_df).iloc[0]
+    assert row["mean_score"] == 10.0
+    assert np.isnan(row["ci95_low"]) and np.isnan(row["ci95_high"])
+
+
+def test_random_seed_reaches_algorithm_subprocess(monkeypatch):
+    monkeypatch.setenv("FOOD_DELIVERY_RANDOM_SEED", "0")
+    monkeypatch.setattr(Configs, "RANDOM_SEED", 0)
+    Configs.set_random_seed(7)
+
+    # 算法子进程重新导入Configs
+    output = subprocess.run([sys.executable, "-c", "from src.configuration.config import Configs; "
+                                                   "print(Configs.RANDOM_SEED)"],
+                            cwd=Configs.root_folder_path, capture_output=True, text=True, check=True)
+    assert Configs.RANDOM_SEED == 7
+    assert output.stdout.strip() == "7"
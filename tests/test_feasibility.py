@@ -0,0 +1,203 @@
+import pytest
+
+from src.common.customer import Customer
+from src.common.dispatch_result import DispatchResult
+from src.common.driver import Driver
+from src.common.node import Node
+from src.common.order import Order
+from src.utils.checker import Checker
+from src.utils.feasibility import check_capacity, check_destination, check_duplicate_orders, \
+    check_order_locations, check_pickup_before_delivery, get_route_violations, repair_dispatch_result, repair_route
+
+
+ID_TO_LOCATION = {location_id: Customer(location_id, 1.30 + index * 0.01, 103.80)
+                  for index, location_id in enumerate(["R1", "R2", "C1", "C2", "C3"])}
+
+
+def get_order(order_id: str, pickup_location_id="R1", delivery_location_id="C1", demand=1):
+    return Order(order_id, demand, 0, 3600, 60, 60, pickup_location_id, delivery_location_id)
+
+
+def get_node(location_id: str, pickup_orders=(), delivery_orders=(), arrive_time=0, leave_time=0):
+    location = ID_TO_LOCATION[location_id]
+    return Node(location_id, location.lat, location.lng, list(pickup_orders), list(delivery_orders), arrive_time,
+                leave_time)
+
+
+def get_driver(capacity=2, carrying_orders=None, destination=None, current_location_id="R1"):
+    driver = Driver("D1", capacity, "G1", 0, carrying_orders)
+    driver.destination = destination
+    driver.current_location_id = current_location_id
+    return driver
+
+
+def get_ids(route: list):
+    return [(node.id, [order.id for order in node.pickup_orders], [order.id for order in node.delivery_orders])
+            for node in route]
+
+
+# 规则
+def test_check_destination():
+    destination = get_node("R1", arrive_time=100)
+    driver = get_driver(destination=destination, current_location_id="")
+    assert check_destination(get_node("R1", arrive_time=100), driver) == ""
+    assert "returned destination is None" in check_destination(None, driver)
+    assert "destination id is R2" in check_destination(get_node("R2", arrive_time=100), driver)
+    assert "arrive time" in check_destination(get_node("R1", arrive_time=200), driver)
+
+    assert check_destination(None, get_driver(current_location_id="R1")) == ""
+    assert "cannot locate the driver" in check_destination(None, get_driver(current_location_id=""))
+
+
+def test_check_capacity():
+    order_1, order_2, order_3 = get_order("1"), get_order("2"), get_order("3")
+    assert check_capacity([get_node("R1", [order_1, order_2]), get_node("C1", [], [order_1, order_2])], [], 2) == ""
+    assert "< 0" in check_capacity([get_node("R1", [order_1, order_2, order_3])], [], 2)
+    assert "< 0" in check_capacity([], [order_1, order_2, order_3], 2)
+    # 送货后的容量可以再次取货
+    route = [get_node("R1", [order_1, order_2]), get_node("C1", [], [order_1]), get_node("R1", [order_3])]
+    assert check_capacity(route, [], 2) == ""
+    assert "> capacity" in check_capacity([get_node("C1", [], [order_1])], [], 2)
+
+
+def test_check_duplicate_orders():
+    order_1, order_2 = get_order("1"), get_order("2")
+    assert check_duplicate_orders([get_node("R1", [order_2])], [order_1]) == ""
+    assert "duplicate order id" in check_duplicate_orders([get_node("R1", [order_1])], [order_1])
+    assert "duplicate order id" in check_duplicate_orders([get_node("R1", [order_2]), get_node("R1", [order_2])], [])
+
+
+def test_check_order_locations():
+    order = get_order("1", "R1", "C1")
+    assert check_order_locations([get_node("R1", [order]), get_node("C1", [], [order])]) == ""
+    assert "Pickup location of order 1" in check_order_locations([get_node("R2", [order])])
+    assert "Delivery location of order 1" in check_order_locations([get_node("C2", [], [order])])
+
+
+def test_checker_does_not_enforce_pickup_before_delivery():
+    # 送货的订单1没有取货: 只有派单算法的预检查报告, 模拟器的Checker行为不变
+    order_1, order_2 = get_order("1"), get_order("2")
+    driver = get_driver(carrying_orders=[order_2])
+    destination = get_node("C1", [], [order_1])
+    dispatch_result = DispatchResult({driver.id: destination}, {driver.id: []})
+
+    assert Checker.check_dispatch_result(dispatch_result, {driver.id: driver}, {})
+    assert any("before it is picked up" in violation
+               for violation in get_route_violations(driver, destination, []))
+
+
+def test_check_pickup_before_delivery():
+    order_1, order_2 = get_order("1"), get_order("2")
+    route = [get_node("C1", [], [order_1]), get_node("R1", [order_2]), get_node("C1", [], [order_2])]
+    assert check_pickup_before_delivery(route, [order_1]) == ""
+    assert "before it is picked up" in check_pickup_before_delivery([get_node("C1", [], [order_2])], [])
+    # 只能送货一次
+    route = [get_node("C1", [], [order_1]), get_node("C1", [], [order_1])]
+    assert "before it is picked up" in check_pickup_before_delivery(route, [order_1])
+
+
+def test_get_route_violations():
+    order = get_order("1")
+    driver = get_driver()
+    assert get_route_violations(driver, get_node("R1", [order]), [get_node("C1", [], [order])]) == []
+    assert get_route_violations(driver, None, []) == []
+    # 取货之后可以不在路线中送货(订单留在骑手身上)
+    assert get_route_violations(driver, get_node("R1", [order]), []) == []
+    violations = get_route_violations(driver, get_node("R2", [order]), [get_node("C2", [], [order])])
+    assert len(violations) == 1 and "Pickup location of order 1" in violations[0]
+
+
+# 修复
+def test_repair_route_restores_destination():
+    order_1, order_2 = get_order("1"), get_order("2", "R2", "C2")
+    destination = get_node("R1", [order_1], arrive_time=100, leave_time=160)
+    driver = get_driver(destination=destination, current_location_id="")
+    new_destination, planned_route, removed_order_ids = repair_route(
+        driver, get_node("R2", [order_2], arrive_time=50), [get_node("C2", [], [order_2])], ID_TO_LOCATION)
+
+    assert (new_destination.id, new_destination.arrive_time) == ("R1", 100)
+    assert [order.id for order in new_destination.pickup_orders] == ["1"]
+    # 目的地取货的订单在路线最后送货
+    assert get_ids(planned_route) == [("C1", [], ["1"])]
+    assert removed_order_ids == []
+    assert get_route_violations(driver, new_destination, planned_route) == []
+
+
+def test_repair_route_removes_overload():
+    order_1, order_2, order_3 = get_order("1"), get_order("2"), get_order("3", delivery_location_id="C2")
+    driver = get_driver(capacity=2)
+    destination = get_node("R1", [order_1, order_2, order_3])
+    planned_route = [get_node("C1", [], [order_1, order_2]), get_node("C2", [], [order_3])]
+    new_destination, planned_route, removed_order_ids = repair_route(driver, destination, planned_route,
+                                                                     ID_TO_LOCATION)
+
+    assert removed_order_ids == ["3"]
+    assert get_ids([new_destination] + planned_route) == [("R1", ["1", "2"], []), ("C1", [], ["1", "2"])]
+    assert get_route_violations(driver, new_destination, planned_route) == []
+
+
+def test_repair_route_drops_duplicate_pickup():
+    order_1, order_2 = get_order("1"), get_order("2")
+    driver = get_driver(capacity=3, carrying_orders=[order_1])
+    destination = get_node("R1", [order_1, order_2])
+    planned_route = [get_node("C1", [], [order_1, order_2])]
+    new_destination, planned_route, removed_order_ids = repair_route(driver, destination, planned_route,
+                                                                     ID_TO_LOCATION)
+
+    # 正在配送的订单不再取货, 也不需要在下一次派单
+    assert removed_order_ids == []
+    assert get_ids([new_destination] + planned_route) == [("R1", ["2"], []), ("C1", [], ["1", "2"])]
+    assert get_route_violations(driver, new_destination, planned_route) == []
+
+
+def test_repair_route_adds_missing_delivery():
+    order_1, order_2 = get_order("1"), get_order("2", delivery_location_id="C2")
+    driver = get_driver(carrying_orders=[order_1])
+    # 没有送货: 正在配送的订单1和取货的订单2
+    new_destination, planned_route, removed_order_ids = repair_route(driver, get_node("R1", [order_2]), [],
+                                                                     ID_TO_LOCATION)
+
+    assert removed_order_ids == []
+    assert get_ids([new_destination] + planned_route) == [("R1", ["2"], []), ("C1", [], ["1"]), ("C2", [], ["2"])]
+    assert get_route_violations(driver, new_destination, planned_route) == []
+
+
+def test_repair_route_removes_unpicked_delivery_and_wrong_locations():
+    order_1, order_2 = get_order("1"), get_order("2", "R2", "C2")
+    driver = get_driver()
+    # 订单1在错误的地点取货, 订单2没有取货就送货
+    destination = get_node("R2", [order_1])
+    planned_route = [get_node("C2", [], [order_2]), get_node("C1", [], [order_1])]
+    new_destination, planned_route, removed_order_ids = repair_route(driver, destination, planned_route,
+                                                                     ID_TO_LOCATION)
+
+    assert removed_order_ids == ["1"]
+    # 目的地保留, 其他空节点删除
+    assert get_ids([new_destination] + planned_route) == [("R2", [], [])]
+
+
+def test_repair_route_uses_first_node_as_destination():
+    order = get_order("1")
+    driver = get_driver(current_location_id="")
+    new_destination, planned_route, removed_order_ids = repair_route(
+        driver, None, [get_node("R1", [order]), get_node("R1"), get_node("C1", [], [order])], ID_TO_LOCATION)
+
+    assert get_ids([new_destination] + planned_route) == [("R1", ["1"], []), ("C1", [], ["1"])]
+    assert removed_order_ids == []
+
+
+@pytest.mark.parametrize("is_feasible", [True, False])
+def test_repair_dispatch_result_only_repairs_infeasible_drivers(is_feasible):
+    order_1, order_2, order_3 = get_order("1"), get_order("2"), get_order("3")
+    driver = get_driver(capacity=2)
+    destination = get_node("R1", [order_1, order_2] + ([] if is_feasible else [order_3]))
+    planned_route = [get_node("C1", [], [order_1, order_2])]
+    driver_id_to_destination, driver_id_to_planned_route = repair_dispatch_result(
+        {driver.id: driver}, {driver.id: destination}, {driver.id: planned_route}, ID_TO_LOCATION)
+
+    if is_feasible:
+        assert driver_id_to_destination[driver.id] is destination
+        assert driver_id_to_planned_route[driver.id] is planned_route
+    else:
+        assert get_ids([driver_id_to_destination[driver.id]]) == [("R1", ["1", "2"], [])]
+        assert get_ids(driver_id_to_planned_route[driver.id]) == [("C1", [], ["1", "2"])]
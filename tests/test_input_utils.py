@@ -0,0 +1,35 @@
+import os
+
+from src.configuration.config import Configs
+from src.utils.input_utils import get_content_digest, get_source_file_paths
+
+
+def write_file(file_path, content):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as fd:
+        fd.write(content)
+
+
+def test_source_file_paths_are_recursive_and_sorted(tmp_path):
+    for relative_path in ["b.py", "a.py", "notes.txt", "pkg/c.py", "pkg/__pycache__/c.cpython-311.py"]:
+        write_file(os.path.join(tmp_path, relative_path), "")
+
+    file_paths = get_source_file_paths([str(tmp_path)])
+    assert [os.path.relpath(file_path, tmp_path) for file_path in file_paths] == \
+        ["a.py", "b.py", os.path.join("pkg", "c.py")]
+
+
+def test_source_file_paths_skip_output_folder(tmp_path, monkeypatch):
+    write_file(os.path.join(tmp_path, "a.py"), "")
+    write_file(os.path.join(tmp_path, "Output", "b.py"), "")
+    monkeypatch.setattr(Configs, "output_folder", os.path.join(str(tmp_path), "Output"))
+
+    assert get_source_file_paths([str(tmp_path)]) == [os.path.join(str(tmp_path), "a.py")]
+
+
+def test_digest_changes_with_nested_module(tmp_path):
+    write_file(os.path.join(tmp_path, "pkg", "order.py"), "x = 1\n")
+    digest = get_content_digest(get_source_file_paths([str(tmp_path)]), 0)
+
+    write_file(os.path.join(tmp_path, "pkg", "order.py"), "x = 2\n")
+    assert get_content_digest(get_source_file_paths([str(tmp_path)]), 0) != digest
@@ -0,0 +1,31 @@
+from src.utils.logging_engine import LoggingEngine
+
+
+def test_flush_writes_queued_records(tmp_path):
+    file_path = str(tmp_path / "async.log")
+    engine = LoggingEngine(level="info", logger_name="test_flush_writes_queued_records", asynchronous=True)
+    engine.add_file_output(file_path)
+    assert engine.is_listening
+
+    for index in range(100):
+        engine.info(f"record {index}")
+    engine.flush()
+    with open(file_path, "r") as fd:
+        assert fd.read().count("record") == 100
+    engine.remove_file_handler(file_path)
+    engine.stop()
+
+
+def test_stop_is_idempotent_and_flush_after_stop_returns():
+    engine = LoggingEngine(level="info", logger_name="test_stop_is_idempotent", asynchronous=True)
+    engine.stop()
+    assert not engine.is_listening
+    engine.stop()
+    engine.flush()
+
+
+def test_synchronous_engine_is_not_listening():
+    engine = LoggingEngine(level="info", logger_name="test_synchronous_engine")
+    assert not engine.is_listening
+    engine.flush()
+    engine.stop()
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from src.utils import metrics
+from src.utils.metrics import get_driver_visit_table
+
+
+get_grouped_percentiles = getattr(metrics, "__get_grouped_percentiles")
+get_cumulative_busy_time = getattr(metrics, "__get_cumulative_busy_time")
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_grouped_percentiles_match_np_percentile(seed):
+    rng = np.random.default_rng(seed)
+    group_num = 8
+    # 第0组和最后一组没有数据, 数值有重复
+    groups = rng.integers(1, group_num - 1, 300)
+    values = rng.integers(0, 50, 300).astype(float)
+    percentiles = [0, 50, 95, 99, 100]
+    result = get_grouped_percentiles(groups, values, percentiles, group_num)
+
+    for percentile, percentile_values in zip(percentiles, result):
+        for group in range(group_num):
+            group_values = values[groups == group]
+            if len(group_values) == 0:
+                assert np.isnan(percentile_values[group])
+            else:
+                assert percentile_values[group] == pytest.approx(np.percentile(group_values, percentile))
+
+
+def test_grouped_percentiles_without_values():
+    result = get_grouped_percentiles(np.array([], dtype=np.int64), np.array([]), [50, 95], 3)
+    assert len(result) == 2 and all(np.isnan(values).all() for values in result)
+
+
+def get_naive_busy_time(starts, ends, time):
+    return sum(max(min(end, time) - start, 0) for start, end in zip(starts, ends))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_cumulative_busy_time_matches_interval_sum(seed):
+    rng = np.random.default_rng(seed)
+    # 重叠的时间段和长度为0的时间段
+    starts = rng.integers(0, 1000, 200).astype(float)
+    ends = starts + rng.integers(0, 300, 200)
+    times = np.array([-10, 0, 1, 250.5, 500, 999, 1000, 1299, 1500], dtype=float)
+    result = get_cumulative_busy_time(starts, ends, times)
+    expected = [get_naive_busy_time(starts, ends, time) for time in times]
+    assert result.tolist() == pytest.approx(expected)
+
+
+def get_node(location_id: str, update_time: int, arrive_time: int, service_time=None):
+    return {"location_id": location_id, "update time": update_time, "arrive_time": arrive_time,
+            "service_time": service_time}
+
+
+def test_driver_visit_table_merges_a_visit_recorded_in_several_ticks():
+    driver_id_to_node_list = {
+        # D_2在C1停车, 之后的时间片中离开时间延长; 只有一个记录有服务时间
+        "D_2": [get_node("R1", 100, 40, 30),
+                get_node("C1", 160, 100),
+                get_node("C1", 200, 100, 60),
+                get_node("C1", 260, 100)],
+        # D_1两次到达R1(到达时间不同), 不合并; 第二次访问没有服务时间
+        "D_1": [get_node("R1", 50, 50, 0),
+                get_node("C2", 300, 120, 90),
+                get_node("R1", 500, 400),
+                get_node("R1", 520, 400)],
+    }
+    visits = get_driver_visit_table(driver_id_to_node_list)
+
+    assert visits[["driver_id", "location_id", "arrive_time"]].values.tolist() == [
+        ["D_2", "R1", 40], ["D_2", "C1", 100], ["D_1", "R1", 50], ["D_1", "C2", 120], ["D_1", "R1", 400]]
+    assert visits["service_end_time"].tolist() == [100, 160, 50, 300, 500]
+    assert visits["depart_time"].tolist() == [100, 260, 50, 300, 520]
+    assert visits["service_time"].tolist() == [30, 60, 0, 90, 100]
+
+
+def test_driver_visit_table_without_visits():
+    visits = get_driver_visit_table({"D_1": []})
+    assert len(visits) == 0
+    assert list(visits.columns) == ["driver_id", "location_id", "arrive_time", "service_end_time", "depart_time",
+                                    "service_time"]
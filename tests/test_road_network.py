@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.common.customer import Customer
+from src.common.road_network import RoadNetworkMap
+from src.utils.logging_engine import logger
+
+
+# 0 - 1 - 2 - 3 一条直线上的节点, 4 孤立(不连通)
+NODE_DF = pd.DataFrame({"node_id": [0, 1, 2, 3, 4], "latitude": [1.30, 1.31, 1.32, 1.33, 1.50],
+                        "longitude": [103.80] * 5})
+EDGE_DF = pd.DataFrame({"start_node_id": [0, 1, 2], "end_node_id": [1, 2, 3], "distance": [1.0, 2.0, 3.0],
+                        "time": [100.0, 200.0, 300.0], "oneway": ["no", "yes", "no"]})
+
+
+def get_road_map(tree_cache_size=2):
+    # 地点正好在节点上, 吸附距离为0
+    id_to_location = {"A": Customer("A", 1.30, 103.80), "B": Customer("B", 1.32, 103.80),
+                      "C": Customer("C", 1.33, 103.80), "D": Customer("D", 1.50, 103.80)}
+    return RoadNetworkMap(EDGE_DF, NODE_DF, id_to_location, ["A"], tree_cache_size)
+
+
+def test_routes_follow_one_way_arcs():
+    road_map = get_road_map()
+    distances, times = road_map.calculate_routes_from_location("A", ["A", "B", "C"])
+    assert distances == pytest.approx([0, 3, 6], abs=1e-6)
+    assert times == pytest.approx([0, 300, 600], abs=1e-3)
+    # 1 -> 2 单行, C到A不可达, 使用haversine
+    assert road_map.calculate_time_between_locations("C", "B") == pytest.approx(300, abs=1e-3)
+    assert road_map.calculate_distance_between_locations("C", "A") == pytest.approx(
+        road_map.fallback_map.calculate_distance_between_locations("C", "A"))
+
+
+def test_trees_only_keep_location_nodes():
+    road_map = get_road_map()
+    road_map.calculate_routes_from_location("B", ["A", "C"])
+    road_map.calculate_routes_from_location("C", ["A", "B"])
+    road_map.calculate_routes_from_location("D", ["A", "B"])
+
+    get_tree = getattr(road_map, "_RoadNetworkMap__get_tree")
+    tree_times, tree_distances = get_tree(road_map.location_id_to_node_index["B"])
+    # 4个地点(节点0, 2, 3, 4), 不是路网的5个节点
+    assert len(tree_times) == len(tree_distances) == 4
+    assert np.isinf(tree_times[road_map.location_id_to_tree_index["A"]])
+    stats = road_map.get_cache_stats()
+    assert stats["size"] == 2 and stats["precomputed"] == 1
+
+
+def test_unreachable_pair_warns_once(monkeypatch):
+    road_map = get_road_map()
+    messages = []
+    monkeypatch.setattr(logger, "warning", lambda message, *args: messages.append(message))
+
+    for _ in range(3):
+        road_map.calculate_routes_from_location("C", ["A", "B"])
+    assert len(messages) == 1 and "1 locations are unreachable from C" in messages[0]
+
+    road_map.calculate_routes_from_location("C", ["A", "D"])
+    assert len(messages) == 2 and "1 locations are unreachable from C" in messages[1]